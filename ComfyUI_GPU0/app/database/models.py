@@ -1,3 +1,4 @@
+from sqlalchemy import Column, Index, Integer, String, Text
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
@@ -11,4 +12,22 @@ def to_dict(obj):
         if (val := getattr(obj, field))
     }
 
-# TODO: Define models here
+
+
+class HistoryEntry(Base):
+    """
+    Prompt history entries that were moved out of memory by app.history_store.
+    """
+
+    __tablename__ = "history"
+
+    sequence = Column(Integer, primary_key=True, autoincrement=False)
+    prompt_id = Column(String, nullable=False, unique=True)
+    end_time = Column(Integer, nullable=False)
+    status = Column(String)
+    data = Column(Text, nullable=False)
+
+    __table_args__ = (
+        Index("ix_history_end_time", "end_time"),
+        Index("ix_history_status", "status"),
+    )
@@ -3,7 +3,6 @@ from __future__ import annotations
 import os
 import base64
 import json
-import time
 import logging
 import folder_paths
 import glob
@@ -11,7 +10,7 @@ import comfy.utils
 from aiohttp import web
 from PIL import Image
 from io import BytesIO
-from folder_paths import map_legacy, filter_files_extensions, filter_files_content_types
+from folder_paths import map_legacy, filter_files_content_types
 
 
 class ModelFileManager:
@@ -84,78 +83,31 @@ class ModelFileManager:
         for index, folder in enumerate(folders[0]):
             if not os.path.isdir(folder):
                 continue
-            out = self.cache_model_file_list_(folder)
-            if out is None:
-                out = self.recursive_search_models_(folder, index)
-                self.set_cache(folder, out)
-            output_list.extend(out[0])
+            output_list.extend(self.get_folder_model_files(folder, index))
 
         return output_list
 
-    def cache_model_file_list_(self, folder: str):
-        model_file_list_cache = self.get_cache(folder)
-
-        if model_file_list_cache is None:
-            return None
-        if not os.path.isdir(folder):
-            return None
-        if os.path.getmtime(folder) != model_file_list_cache[1]:
-            return None
-        for x in model_file_list_cache[1]:
-            time_modified = model_file_list_cache[1][x]
-            folder = x
-            if os.path.getmtime(folder) != time_modified:
-                return None
-
-        return model_file_list_cache
-
-    def recursive_search_models_(self, directory: str, pathIndex: int) -> tuple[list[str], dict[str, float], float]:
-        if not os.path.isdir(directory):
-            return [], {}, time.perf_counter()
-
-        excluded_dir_names = [".git"]
+    def get_folder_model_files(self, folder: str, pathIndex: int) -> list[dict]:
         # TODO use settings
         include_hidden_files = False
 
-        result: list[str] = []
-        dirs: dict[str, float] = {}
-
-        for dirpath, subdirs, filenames in os.walk(directory, followlinks=True, topdown=True):
-            subdirs[:] = [d for d in subdirs if d not in excluded_dir_names]
-            if not include_hidden_files:
-                subdirs[:] = [d for d in subdirs if not d.startswith(".")]
-                filenames = [f for f in filenames if not f.startswith(".")]
-
-            filenames = filter_files_extensions(filenames, folder_paths.supported_pt_extensions)
-
-            for file_name in filenames:
-                try:
-                    full_path = os.path.join(dirpath, file_name)
-                    relative_path = os.path.relpath(full_path, directory)
-
-                    # Get file metadata
-                    file_info = {
-                        "name": relative_path,
-                        "pathIndex": pathIndex,
-                        "modified": os.path.getmtime(full_path),  # Add modification time
-                        "created": os.path.getctime(full_path),   # Add creation time
-                        "size": os.path.getsize(full_path)        # Add file size
-                    }
-                    result.append(file_info)
-
-                except Exception as e:
-                    logging.warning(f"Warning: Unable to access {file_name}. Error: {e}. Skipping this file.")
-                    continue
-
-            for d in subdirs:
-                path: str = os.path.join(dirpath, d)
-                try:
-                    dirs[path] = os.path.getmtime(path)
-                except FileNotFoundError:
-                    logging.warning(f"Warning: Unable to access {path}. Skipping this path.")
-                    continue
-
-        return result, dirs, time.perf_counter()
+        file_index = folder_paths.get_file_index(folder)
+        result: list[dict] = []
+        for relative_path in file_index.list_files(folder_paths.supported_pt_extensions):
+            if not include_hidden_files and any(part.startswith(".") for part in relative_path.split(os.sep)):
+                continue
+            stat = file_index.get_stat(relative_path)
+            if stat is None:
+                logging.warning(f"Warning: Unable to access {relative_path}. Skipping this file.")
+                continue
+            result.append({
+                "name": relative_path,
+                "pathIndex": pathIndex,
+                "modified": stat.st_mtime,
+                "created": stat.st_ctime,
+                "size": stat.st_size,
+            })
+        return result
 
     def get_model_previews(self, filepath: str) -> list[str | BytesIO]:
         dirname = os.path.dirname(filepath)
@@ -0,0 +1,158 @@
+import gzip
+import json
+import logging
+import threading
+import time
+import traceback
+from typing import Any, Callable, Optional
+
+import folder_paths
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class NodeInfoEntry:
+    __slots__ = ("node_class", "info", "dependencies", "version")
+
+    def __init__(self, node_class: type, info: dict, dependencies: Optional[dict[tuple[str, str], tuple]], version: int):
+        self.node_class = node_class
+        self.info = info
+        # dependency -> folder_paths.get_dependency_version() at the time info was built, None if info has to be
+        # built again on every update
+        self.dependencies = dependencies
+        self.version = version
+
+
+class ObjectInfoCache:
+    """
+    Keeps the /object_info of every node class along with the serialized and compressed response.
+
+    The info of a node class is only built again when the class registered under its name changes or when one of
+    the model folders or directories its INPUT_TYPES read changed, see folder_paths.record_dependencies. Custom
+    nodes can read their options from anywhere, their info is built on every update but only counts as changed
+    when it differs from the previous one.
+
+    Every change bumps the version, which is the ETag of the response and what the delta of get_delta() is
+    relative to. Versions start at the current time in milliseconds so a version from before a restart is never
+    mistaken for a current one.
+    """
+
+    def __init__(self, node_info: Callable[[str], dict]):
+        self.node_info = node_info
+        self.lock = threading.Lock()
+        self.entries: dict[str, NodeInfoEntry] = {}
+        # node class name -> version it was removed at
+        self.removed: dict[str, int] = {}
+        self.version = int(time.time() * 1000)
+        self.bodies: dict[str, bytes] = {}
+
+    @staticmethod
+    def is_custom_node(node_class: type) -> bool:
+        return getattr(node_class, "RELATIVE_PYTHON_MODULE", "nodes").startswith("custom_nodes.")
+
+    def update(self, node_classes: dict[str, type]) -> int:
+        """Brings the cached info up to date with node_classes and returns the current version."""
+        with self.lock, folder_paths.cache_helper:
+            versions: dict[tuple[str, str], tuple] = {}
+
+            def get_version(dependency):
+                if dependency not in versions:
+                    versions[dependency] = folder_paths.get_dependency_version(dependency)
+                return versions[dependency]
+
+            changed = []
+            for name, node_class in node_classes.items():
+                entry = self.entries.get(name)
+                if entry is not None and entry.node_class is node_class and entry.dependencies is not None:
+                    if all(get_version(d) == v for d, v in entry.dependencies.items()):
+                        continue
+
+                try:
+                    with folder_paths.record_dependencies() as dependencies:
+                        info = self.node_info(name)
+                except Exception:
+                    logging.error(f"[ERROR] An error occurred while retrieving information for the '{name}' node.")
+                    logging.error(traceback.format_exc())
+                    if entry is not None:
+                        self.entries.pop(name)
+                        self.removed[name] = self.version + 1
+                        changed.append(name)
+                    continue
+
+                if self.is_custom_node(node_class):
+                    recorded = None
+                else:
+                    recorded = {d: get_version(d) for d in dependencies}
+                if entry is not None and entry.info == info:
+                    entry.node_class = node_class
+                    entry.dependencies = recorded
+                    continue
+                self.entries[name] = NodeInfoEntry(node_class, info, recorded, self.version + 1)
+                self.removed.pop(name, None)
+                changed.append(name)
+
+            for name in [name for name in self.entries if name not in node_classes]:
+                self.entries.pop(name)
+                self.removed[name] = self.version + 1
+                changed.append(name)
+
+            if len(changed) > 0:
+                self.version += 1
+                self.bodies.clear()
+            return self.version
+
+    def get_node_info(self, name: str) -> Optional[dict]:
+        with self.lock:
+            entry = self.entries.get(name)
+            return entry.info if entry is not None else None
+
+    def get_body(self, encoding: str = "identity") -> tuple[int, bytes]:
+        """
+        Returns the version and the JSON of all node classes, compressed with encoding ("identity", "gzip" or
+        "br"). Each encoding is only serialized and compressed once per version.
+        """
+        with self.lock:
+            version = self.version
+            body = self.bodies.get(encoding)
+            if body is not None:
+                return version, body
+            data = self.bodies.get("identity")
+            if data is None:
+                data = json.dumps({name: entry.info for name, entry in self.entries.items()}).encode("utf-8")
+                self.bodies["identity"] = data
+        if encoding == "gzip":
+            body = gzip.compress(data, compresslevel=6)
+        elif encoding == "br":
+            body = brotli.compress(data, quality=5)
+        else:
+            return version, data
+        with self.lock:
+            if self.version == version:
+                self.bodies[encoding] = body
+        return version, body
+
+    def get_delta(self, since: int) -> dict[str, Any]:
+        """
+        Returns the info of the node classes that changed after version since and the names of the ones that were
+        removed. Everything counts as changed when since isn't a version of this cache.
+        """
+        with self.lock:
+            if since > self.version or since < 0:
+                since = 0
+            return {
+                "version": self.version,
+                "changed": {name: entry.info for name, entry in self.entries.items() if entry.version > since},
+                "removed": [name for name, version in self.removed.items() if version > since],
+            }
+
+    @staticmethod
+    def get_accepted_encoding(accept_encoding: str) -> str:
+        accepted = {value.split(";")[0].strip().lower() for value in accept_encoding.split(",")}
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return "identity"
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import logging
+import struct
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+from comfy.cli_args import args
+from comfy_api import feature_flags
+from protocol import BinaryEventTypes
+
+# preview image format -> (type number of PREVIEW_IMAGE messages, mimetype)
+PREVIEW_TYPES = {
+    "JPEG": (1, "image/jpeg"),
+    "PNG": (2, "image/png"),
+    "WEBP": (3, "image/webp"),
+}
+
+
+def encode_preview_image(image_type, image, max_size):
+    if max_size is not None:
+        if hasattr(Image, 'Resampling'):
+            resampling = Image.Resampling.BILINEAR
+        else:
+            resampling = Image.Resampling.LANCZOS
+
+        image = ImageOps.contain(image, (max_size, max_size), resampling)
+    if image_type not in PREVIEW_TYPES:
+        image_type = "JPEG"
+
+    bytesIO = BytesIO()
+    # method 0 is the fastest WEBP encoder setting, the other formats ignore it
+    image.save(bytesIO, format=image_type, quality=args.preview_quality, compress_level=1, method=0)
+    return image_type, bytesIO.getvalue()
+
+
+class PreviewSender:
+    """
+    Encodes the sampler previews off the event loop and sends them through the server's websockets. Only the newest
+    preview of a node is kept while an older one of the same node is still being encoded or sent to the client, stale
+    ones are dropped.
+
+    The stock frontend shows unknown preview types as JPEG, so WEBP is only sent to clients that set the
+    supports_webp_previews feature flag. The others get JPEG.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="PreviewEncoder")
+        # (sid, node_id) -> newest preview waiting to be encoded, and the task sending them
+        self.pending = {}
+        self.senders = {}
+
+    def queue(self, event, data, sid=None):
+        node_id = None
+        if event == BinaryEventTypes.PREVIEW_IMAGE_WITH_METADATA and data[1] is not None:
+            node_id = data[1].get("node_id")
+        key = (sid, node_id)
+        self.pending[key] = (event, data, sid)
+        if key not in self.senders:
+            self.senders[key] = asyncio.create_task(self.send_pending(key))
+
+    async def send_pending(self, key):
+        try:
+            while key in self.pending:
+                event, data, sid = self.pending.pop(key)
+                try:
+                    if event == BinaryEventTypes.UNENCODED_PREVIEW_IMAGE:
+                        await self.send_image(data, sid=sid)
+                    else:
+                        # data is (preview_image, metadata)
+                        preview_image, metadata = data
+                        await self.send_image_with_metadata(preview_image, metadata, sid=sid)
+                except Exception:
+                    logging.warning(f"Failed to send preview: {traceback.format_exc()}")
+        finally:
+            self.senders.pop(key, None)
+
+    def get_preview_type(self, image_type, sid=None):
+        if image_type == "WEBP":
+            sids = list(self.server.sockets) if sid is None else [sid]
+            if len(sids) == 0 or not all(feature_flags.supports_feature(self.server.sockets_metadata, s, "supports_webp_previews") for s in sids):
+                return "JPEG"
+        return image_type
+
+    async def encode(self, image_data, sid=None):
+        image_type, image, max_size = image_data[:3]
+        return await asyncio.get_running_loop().run_in_executor(self.executor, encode_preview_image, self.get_preview_type(image_type, sid), image, max_size)
+
+    async def send_image(self, image_data, sid=None):
+        image_type, image_bytes = await self.encode(image_data, sid)
+        preview_bytes = struct.pack(">I", PREVIEW_TYPES[image_type][0]) + image_bytes
+        await self.server.send_bytes(BinaryEventTypes.PREVIEW_IMAGE, preview_bytes, sid=sid)
+
+    async def send_image_with_metadata(self, image_data, metadata=None, sid=None):
+        image_type, image_bytes = await self.encode(image_data, sid)
+
+        # Prepare metadata
+        if metadata is None:
+            metadata = {}
+        metadata["image_type"] = PREVIEW_TYPES[image_type][1]
+
+        # Serialize metadata as JSON
+        metadata_json = json.dumps(metadata).encode('utf-8')
+        metadata_length = len(metadata_json)
+
+        # Combine metadata and image
+        combined_data = bytearray()
+        combined_data.extend(struct.pack(">I", metadata_length))
+        combined_data.extend(metadata_json)
+        combined_data.extend(image_bytes)
+
+        await self.server.send_bytes(BinaryEventTypes.PREVIEW_IMAGE_WITH_METADATA, combined_data, sid=sid)
@@ -238,6 +238,14 @@ class ComfyNodeABC(ABC):
     """Flags a node as deprecated, indicating to users that they should find alternatives to this node."""
     API_NODE: Optional[bool]
     """Flags a node as an API node. See: https://docs.comfy.org/tutorials/api-nodes/overview."""
+    EXECUTION_RESOURCES: tuple[Literal["cpu", "io", "gpu"], ...]
+    """What the node's function needs while it runs, ``("gpu",)`` when not set.
+
+    With ``--concurrent-nodes``, nodes that only need ``"cpu"`` and/or ``"io"`` run in a thread pool next to the node
+    using the GPU. They must not load models through ``comfy.model_management`` or expand subgraphs. Usage::
+
+        EXECUTION_RESOURCES = ("io",)
+    """
 
     @classmethod
     @abstractmethod
@@ -3,11 +3,15 @@ from typing import TYPE_CHECKING, Callable
 import torch
 import numpy as np
 import collections
+import copy
 from dataclasses import dataclass
 from abc import ABC, abstractmethod
 import logging
+from concurrent.futures import ThreadPoolExecutor
 import comfy.model_management
+import comfy.model_patcher
 import comfy.patcher_extension
+import comfy.utils
 if TYPE_CHECKING:
     from comfy.model_base import BaseModel
     from comfy.model_patcher import ModelPatcher
@@ -94,7 +98,8 @@ class ContextFuseMethod:
 
 ContextResults = collections.namedtuple("ContextResults", ['window_idx', 'sub_conds_out', 'sub_conds', 'window'])
 class IndexListContextHandler(ContextHandlerABC):
-    def __init__(self, context_schedule: ContextSchedule, fuse_method: ContextFuseMethod, context_length: int=1, context_overlap: int=0, context_stride: int=1, closed_loop=False, dim=0):
+    def __init__(self, context_schedule: ContextSchedule, fuse_method: ContextFuseMethod, context_length: int=1, context_overlap: int=0, context_stride: int=1, closed_loop=False, dim=0,
+                 max_batched_windows: int=1, devices: list[torch.device]=None):
         self.context_schedule = context_schedule
         self.fuse_method = fuse_method
         self.context_length = context_length
@@ -102,6 +107,11 @@ class IndexListContextHandler(ContextHandlerABC):
         self.context_stride = context_stride
         self.closed_loop = closed_loop
         self.dim = dim
+        # windows are concatenated along the batch dim, so batching is only possible when windowing a different dim
+        self.max_batched_windows = max(1, max_batched_windows) if dim != 0 else 1
+        # extra devices that window groups are dispatched to; the models loaded on them are only set during sampling
+        self.devices: list[torch.device] = devices if devices is not None else []
+        self.device_models: dict[torch.device, BaseModel] = {}
         self._step = 0
 
         self.callbacks = {}
@@ -191,8 +201,8 @@ class IndexListContextHandler(ContextHandlerABC):
         for callback in comfy.patcher_extension.get_all_callbacks(IndexListCallbacks.EXECUTE_START, self.callbacks):
             callback(self, model, x_in, conds, timestep, model_options)
 
-        for enum_window in enumerated_context_windows:
-            results = self.evaluate_context_windows(calc_cond_batch, model, x_in, conds, timestep, [enum_window], model_options)
+        window_groups = self.get_window_groups(model, x_in, conds, enumerated_context_windows)
+        for results in self.evaluate_window_groups(calc_cond_batch, model, x_in, conds, timestep, window_groups, model_options):
             for result in results:
                 self.combine_context_window_results(x_in, result.sub_conds_out, result.sub_conds, result.window, result.window_idx, len(enumerated_context_windows), timestep,
                                             conds_final, counts_final, biases_final)
@@ -212,6 +222,73 @@ class IndexListContextHandler(ContextHandlerABC):
             for callback in comfy.patcher_extension.get_all_callbacks(IndexListCallbacks.EXECUTE_CLEANUP, self.callbacks):
                 callback(self, model, x_in, conds, timestep, model_options)
 
+    def get_max_batched_windows(self, model: BaseModel, x_in: torch.Tensor, conds, device=None) -> int:
+        if self.max_batched_windows <= 1:
+            return 1
+        # these callbacks prepare the call of each window, so windows are evaluated one at a time when any are registered
+        if len(comfy.patcher_extension.get_all_callbacks(IndexListCallbacks.EVALUATE_CONTEXT_WINDOWS, self.callbacks)) > 0:
+            return 1
+        if device is None:
+            device = x_in.device
+        free_memory = comfy.model_management.get_free_memory(device)
+        window_shape = list(x_in.shape)
+        window_shape[self.dim] = min(self.context_length, window_shape[self.dim])
+        # every cond (positive, negative, ...) gets its own copy of each window in the batch
+        conds_count = max(1, len([c for c in conds if c is not None]))
+        for batched in range(self.max_batched_windows, 1, -1):
+            input_shape = [window_shape[0] * batched * conds_count] + window_shape[1:]
+            if model.memory_required(input_shape) * 1.5 < free_memory:
+                return batched
+        return 1
+
+    def get_window_groups(self, model: BaseModel, x_in: torch.Tensor, conds, enumerated_context_windows: list[tuple[int, IndexListContextWindow]]) -> list[list[tuple[int, IndexListContextWindow]]]:
+        """
+        Split windows into groups that are evaluated with a single calc_cond_batch call; windows within a group must have the same length.
+        """
+        max_batched = self.get_max_batched_windows(model, x_in, conds)
+        groups: list[list[tuple[int, IndexListContextWindow]]] = []
+        for enum_window in enumerated_context_windows:
+            if len(groups) > 0 and len(groups[-1]) < max_batched and groups[-1][0][1].context_length == enum_window[1].context_length:
+                groups[-1].append(enum_window)
+            else:
+                groups.append([enum_window])
+        return groups
+
+    def evaluate_window_groups(self, calc_cond_batch: Callable, model: BaseModel, x_in: torch.Tensor, conds, timestep: torch.Tensor, window_groups: list[list[tuple[int, IndexListContextWindow]]],
+                               model_options):
+        """
+        Yields results of each window group, in order. If device_models are set, groups are spread round-robin across the main model and the extra devices.
+        """
+        if len(self.device_models) == 0 or len(window_groups) <= 1:
+            for group in window_groups:
+                yield self.evaluate_window_group(calc_cond_batch, model, x_in, conds, timestep, group, model_options)
+            return
+
+        targets = [(None, model)] + list(self.device_models.items())
+        assigned = [[] for _ in targets]
+        for i, group in enumerate(window_groups):
+            assigned[i % len(targets)].append(group)
+
+        def run_target(target_idx: int):
+            device, target_model = targets[target_idx]
+            # transformer_options are updated per window, so each device needs its own copy
+            target_options = model_options.copy()
+            target_options["transformer_options"] = model_options["transformer_options"].copy()
+            return [self.evaluate_window_group(calc_cond_batch, target_model, x_in, conds, timestep, group, target_options, device=device, first_device=x_in.device)
+                    for group in assigned[target_idx]]
+
+        with ThreadPoolExecutor(max_workers=len(targets) - 1) as executor:
+            futures = [executor.submit(run_target, i) for i in range(1, len(targets))]
+            outputs = [run_target(0)] + [f.result() for f in futures]
+        for i in range(len(window_groups)):
+            yield outputs[i % len(targets)][i // len(targets)]
+
+    def evaluate_window_group(self, calc_cond_batch: Callable, model: BaseModel, x_in: torch.Tensor, conds, timestep: torch.Tensor, enumerated_context_windows: list[tuple[int, IndexListContextWindow]],
+                              model_options, device=None, first_device=None):
+        if len(enumerated_context_windows) > 1:
+            return self.evaluate_batched_context_windows(calc_cond_batch, model, x_in, conds, timestep, enumerated_context_windows, model_options, device)
+        return self.evaluate_context_windows(calc_cond_batch, model, x_in, conds, timestep, enumerated_context_windows, model_options, device, first_device)
+
     def evaluate_context_windows(self, calc_cond_batch: Callable, model: BaseModel, x_in: torch.Tensor, conds, timestep: torch.Tensor, enumerated_context_windows: list[tuple[int, IndexListContextWindow]],
                                 model_options, device=None, first_device=None):
         results: list[ContextResults] = []
@@ -236,6 +313,62 @@ class IndexListContextHandler(ContextHandlerABC):
             results.append(ContextResults(window_idx, sub_conds_out, sub_conds, window))
         return results
 
+    def evaluate_batched_context_windows(self, calc_cond_batch: Callable, model: BaseModel, x_in: torch.Tensor, conds, timestep: torch.Tensor, enumerated_context_windows: list[tuple[int, IndexListContextWindow]],
+                                         model_options, device=None):
+        """
+        Evaluate windows of the same length with a single calc_cond_batch call, stacked along the batch dim.
+        During the call, transformer_options["context_windows"] holds the list of windows instead of "context_window".
+        """
+        # allow processing to end between context window executions for faster Cancel
+        comfy.model_management.throw_exception_if_processing_interrupted()
+        windows = [window for _, window in enumerated_context_windows]
+        batched_x = torch.cat([window.get_tensor(x_in, device) for window in windows])
+        batched_timestep = torch.cat([window.get_tensor(timestep, device, dim=0) for window in windows])
+        windows_conds = [[self.get_resized_cond(cond, x_in, window, device) for cond in conds] for window in windows]
+
+        transformer_options = model_options["transformer_options"]
+        previous_window = transformer_options.pop("context_window", None)
+        transformer_options["context_windows"] = windows
+        try:
+            conds_out = calc_cond_batch(model, self.merge_resized_conds(windows_conds), batched_x, batched_timestep, model_options)
+        finally:
+            transformer_options.pop("context_windows", None)
+            if previous_window is not None:
+                transformer_options["context_window"] = previous_window
+
+        results: list[ContextResults] = []
+        batch_size = x_in.shape[0]
+        for i, (window_idx, window) in enumerate(enumerated_context_windows):
+            sub_conds_out = [c.narrow(0, i * batch_size, batch_size) for c in conds_out]
+            if device is not None:
+                sub_conds_out = [c.to(x_in.device) for c in sub_conds_out]
+            results.append(ContextResults(window_idx, sub_conds_out, windows_conds[i], window))
+        return results
+
+    def merge_resized_conds(self, windows_conds: list[list[list[dict]]]) -> list[list[dict]]:
+        """
+        Merge per-window resized conds into conds for the windows concatenated along the batch dim.
+        """
+        merged = []
+        for i in range(len(windows_conds[0])):
+            if windows_conds[0][i] is None:
+                merged.append(None)
+                continue
+            merged.append([self._merge_cond_items([window_conds[i][j] for window_conds in windows_conds]) for j in range(len(windows_conds[0][i]))])
+        return merged
+
+    def _merge_cond_items(self, items: list):
+        first = items[0]
+        # unchanged between windows; repeat_to_batch_size will take care of the batch
+        if all(item is first for item in items[1:]):
+            return first
+        if isinstance(first, torch.Tensor):
+            return torch.cat(items)
+        if hasattr(first, "cond") and isinstance(first.cond, torch.Tensor):
+            return first._copy_with(torch.cat([item.cond for item in items]))
+        if isinstance(first, dict):
+            return {key: self._merge_cond_items([item[key] for item in items]) for key in first}
+        return first
 
     def combine_context_window_results(self, x_in: torch.Tensor, sub_conds_out, sub_conds, window: IndexListContextWindow, window_idx: int, total_windows: int, timestep: torch.Tensor,
                                     conds_final: list[torch.Tensor], counts_final: list[torch.Tensor], biases_final: list[torch.Tensor]):
@@ -287,6 +420,75 @@ def create_prepare_sampling_wrapper(model: ModelPatcher):
     )
 
 
+def clone_model_to_device(model: ModelPatcher, device: torch.device) -> ModelPatcher:
+    """
+    Clone the model patcher with its own copy of the unpatched weights, so it can be loaded on another device.
+    """
+    # the weights of the source model may be patched or loaded on its device, so copy the original ones instead
+    memo = {}
+    for key, patches in model.get_key_patches().items():
+        weight = comfy.utils.get_attr(model.model, key)
+        original = patches[0][0].to(model.offload_device, copy=True)
+        memo[id(weight)] = torch.nn.Parameter(original, requires_grad=False) if isinstance(weight, torch.nn.Parameter) else original
+    current_patcher = getattr(model.model, "current_patcher", None)
+    if current_patcher is not None:
+        memo[id(current_patcher)] = None
+    with model.use_ejected():
+        device_model = copy.deepcopy(model.model, memo)
+
+    for m in device_model.modules():
+        comfy.model_patcher.wipe_lowvram_weight(m)
+        if hasattr(m, "comfy_patched_weights"):
+            del m.comfy_patched_weights
+    device_model.device = model.offload_device
+    device_model.model_loaded_weight_memory = 0
+    device_model.lowvram_patch_counter = 0
+    device_model.model_lowvram = False
+    device_model.current_weight_patches_uuid = None
+
+    device_patcher = model.clone()
+    device_patcher.model = device_model
+    device_patcher.load_device = device
+    device_patcher.backup = {}
+    device_patcher.object_patches_backup = {}
+    device_patcher.hook_backup = {}
+    device_patcher.is_injected = False
+    # not a clone of the source model: it must not take its place in the loaded models once it is freed
+    device_patcher.parent = None
+    return device_patcher
+
+
+def _outer_sample_wrapper(executor, *args, **kwargs):
+    """
+    This OUTER_SAMPLE wrapper loads a copy of the model on each extra device of the context handler for the sampling run.
+    """
+    guider = executor.class_obj
+    handler: IndexListContextHandler = guider.model_options.get("context_handler", None)
+    if handler is None or len(handler.devices) == 0:
+        return executor(*args, **kwargs)
+
+    device_patchers = [clone_model_to_device(guider.model_patcher, device) for device in handler.devices]
+    try:
+        comfy.model_management.load_models_gpu(device_patchers)
+        for device_patcher in device_patchers:
+            device_patcher.pre_run()
+        handler.device_models = {device_patcher.load_device: device_patcher.model for device_patcher in device_patchers}
+        return executor(*args, **kwargs)
+    finally:
+        # the handler is copied with the model options, so it must not keep the models
+        handler.device_models = {}
+        for device_patcher in device_patchers:
+            device_patcher.cleanup()
+
+
+def create_outer_sample_wrapper(model: ModelPatcher):
+    model.add_wrapper_with_key(
+        comfy.patcher_extension.WrappersMP.OUTER_SAMPLE,
+        "ContextWindows_outer_sample",
+        _outer_sample_wrapper
+    )
+
+
 def match_weights_to_dim(weights: list[float], x_in: torch.Tensor, dim: int, device=None) -> torch.Tensor:
     total_dims = len(x_in.shape)
     weights_tensor = torch.Tensor(weights).to(device=device)
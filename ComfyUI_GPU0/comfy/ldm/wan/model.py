@@ -589,6 +589,17 @@ class WanModel(torch.nn.Module):
         return x
 
     def rope_encode(self, t, h, w, t_start=0, steps_t=None, steps_h=None, steps_w=None, device=None, dtype=None):
+        rope_cache = self.rope_embedder.rope_cache
+        if not rope_cache.is_enabled():
+            return self._rope_encode(t, h, w, t_start, steps_t, steps_h, steps_w, device, dtype)
+        key = rope_cache.make_key(t, h, w, t_start, steps_t, steps_h, steps_w, torch.device(device) if device is not None else None, dtype)
+        freqs = rope_cache.get(key)
+        if freqs is None:
+            freqs = self._rope_encode(t, h, w, t_start, steps_t, steps_h, steps_w, device, dtype)
+            rope_cache.put(key, freqs)
+        return freqs
+
+    def _rope_encode(self, t, h, w, t_start=0, steps_t=None, steps_h=None, steps_w=None, device=None, dtype=None):
         patch_size = self.patch_size
         t_len = ((t + (patch_size[0] // 2)) // patch_size[0])
         h_len = ((h + (patch_size[1] // 2)) // patch_size[1])
@@ -607,7 +618,7 @@ class WanModel(torch.nn.Module):
         img_ids[:, :, :, 2] = img_ids[:, :, :, 2] + torch.linspace(0, w_len - 1, steps=steps_w, device=device, dtype=dtype).reshape(1, 1, -1)
         img_ids = img_ids.reshape(1, -1, img_ids.shape[-1])
 
-        freqs = self.rope_embedder(img_ids).movedim(1, 2)
+        freqs = self.rope_embedder.embed(img_ids).movedim(1, 2)
         return freqs
 
     def forward(self, x, timestep, context, clip_fea=None, time_dim_concat=None, transformer_options={}, **kwargs):
@@ -21,6 +21,7 @@ import torch
 import math
 import struct
 import comfy.checkpoint_pickle
+import comfy.model_management
 import safetensors.torch
 import numpy as np
 from PIL import Image
@@ -59,6 +60,8 @@ def load_torch_file(ckpt, safe_load=False, device=None, return_metadata=False):
             with safetensors.safe_open(ckpt, framework="pt", device=device.type) as f:
                 sd = {}
                 for k in f.keys():
+                    # reading the tensors is what takes time with mmap disabled or on a slow disk
+                    comfy.model_management.throw_exception_if_processing_interrupted()
                     tensor = f.get_tensor(k)
                     if DISABLE_MMAP:  # TODO: Not sure if this is the best way to bypass the mmap issues
                         tensor = tensor.to(device=device, copy=True)
@@ -972,6 +975,7 @@ def tiled_scale_multidim(samples, function, tile=(64, 64), overlap=8, upscale_am
         positions = [range(0, s.shape[d+2] - overlap[d], tile[d] - overlap[d]) if s.shape[d+2] > tile[d] else [0] for d in range(dims)]
 
         for it in itertools.product(*positions):
+            comfy.model_management.throw_exception_if_processing_interrupted()
             s_in = s
             upscaled = []
 
@@ -0,0 +1,152 @@
+"""
+Serialization of node output values (LATENT dicts, CONDITIONING lists, IMAGE and MASK tensors...) without pickle.
+
+A value is written as a safetensors file: the tensors it contains are stored once each in the data blob, and the
+structure around them (dicts, lists, tuples, numbers, strings) is stored as compact JSON in the "comfy_value"
+entry of the header metadata, with references to the tensors by name. Any safetensors reader can open the files,
+and load() maps them in memory so that the tensors are only read from the disk when they are used.
+
+Values holding other objects (models, control nets, hooks...) can't be serialized and raise a TypeError.
+"""
+from __future__ import annotations
+from typing import Any, Optional, Union
+import json
+import mmap
+import struct
+
+import torch
+
+STRUCTURE_KEY = "comfy_value"
+
+DTYPES = {
+    torch.float64: "F64",
+    torch.float32: "F32",
+    torch.float16: "F16",
+    torch.bfloat16: "BF16",
+    torch.int64: "I64",
+    torch.int32: "I32",
+    torch.int16: "I16",
+    torch.int8: "I8",
+    torch.uint8: "U8",
+    torch.bool: "BOOL",
+}
+if hasattr(torch, "float8_e4m3fn"):
+    DTYPES[torch.float8_e4m3fn] = "F8_E4M3"
+    DTYPES[torch.float8_e5m2] = "F8_E5M2"
+SAFETENSORS_DTYPES = {name: dtype for dtype, name in DTYPES.items()}
+
+
+def _flatten(value, tensors: dict[int, tuple[str, torch.Tensor]]):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, torch.Tensor):
+        # the same tensor referenced twice, like a pooled output shared by several conds, is stored once
+        entry = tensors.get(id(value))
+        if entry is None:
+            entry = (f"t{len(tensors)}", value)
+            tensors[id(value)] = entry
+        return {"tensor": entry[0]}
+    if isinstance(value, list):
+        return [_flatten(v, tensors) for v in value]
+    if isinstance(value, tuple):
+        return {"tuple": [_flatten(v, tensors) for v in value]}
+    if isinstance(value, dict):
+        for k in value:
+            if not isinstance(k, str):
+                raise TypeError(f"Can't serialize a dict key of type {type(k).__name__}")
+        return {"dict": {k: _flatten(v, tensors) for k, v in value.items()}}
+    raise TypeError(f"Can't serialize a value of type {type(value).__name__}")
+
+
+def _unflatten(structure, tensors: dict[str, torch.Tensor]):
+    if isinstance(structure, list):
+        return [_unflatten(v, tensors) for v in structure]
+    if not isinstance(structure, dict):
+        return structure
+    if "tensor" in structure:
+        return tensors[structure["tensor"]]
+    if "tuple" in structure:
+        return tuple(_unflatten(v, tensors) for v in structure["tuple"])
+    return {k: _unflatten(v, tensors) for k, v in structure["dict"].items()}
+
+
+def _tensor_bytes(tensor: torch.Tensor) -> memoryview:
+    tensor = tensor.detach().to("cpu").contiguous()
+    return memoryview(tensor.reshape(-1).view(torch.uint8).numpy())
+
+
+def _build(value, metadata: Optional[dict[str, str]]) -> tuple[bytes, list[torch.Tensor]]:
+    tensors: dict[int, tuple[str, torch.Tensor]] = {}
+    structure = _flatten(value, tensors)
+
+    # the largest elements first keeps every tensor aligned to its element size, the data starts 8 bytes aligned
+    entries = sorted(tensors.values(), key=lambda e: -e[1].element_size())
+    header: dict[str, Any] = {"__metadata__": {**(metadata or {}), STRUCTURE_KEY: json.dumps(structure, separators=(",", ":"))}}
+    offset = 0
+    for name, tensor in entries:
+        if tensor.dtype not in DTYPES:
+            raise TypeError(f"Can't serialize a tensor of dtype {tensor.dtype}")
+        size = tensor.numel() * tensor.element_size()
+        header[name] = {"dtype": DTYPES[tensor.dtype], "shape": list(tensor.shape), "data_offsets": [offset, offset + size]}
+        offset += size
+
+    header_bytes = json.dumps(header, separators=(",", ":")).encode()
+    header_bytes += b" " * (-len(header_bytes) % 8)
+    return struct.pack("<Q", len(header_bytes)) + header_bytes, [tensor for _, tensor in entries]
+
+
+def _parse(buffer) -> tuple[Any, dict[str, str]]:
+    """Returns the value and the other metadata of the serialized value in buffer. The tensors share its memory."""
+    header_size = struct.unpack_from("<Q", buffer)[0]
+    header = json.loads(bytes(buffer[8:8 + header_size]))
+    metadata = header.pop("__metadata__", {})
+    if STRUCTURE_KEY not in metadata:
+        raise ValueError("Not a serialized ComfyUI value")
+    structure = json.loads(metadata.pop(STRUCTURE_KEY))
+
+    data_start = 8 + header_size
+    tensors = {}
+    for name, info in header.items():
+        start, end = info["data_offsets"]
+        dtype = SAFETENSORS_DTYPES[info["dtype"]]
+        if end > start:
+            tensor = torch.frombuffer(buffer, dtype=dtype, count=(end - start) // dtype.itemsize, offset=data_start + start)
+        else:
+            tensor = torch.empty((0,), dtype=dtype)
+        tensors[name] = tensor.reshape(info["shape"])
+    return _unflatten(structure, tensors), metadata
+
+
+def dumps(value, metadata: Optional[dict[str, str]] = None) -> bytes:
+    header, tensors = _build(value, metadata)
+    return b"".join([header] + [_tensor_bytes(t) for t in tensors])
+
+
+def loads(data: Union[bytes, bytearray, memoryview], return_metadata=False):
+    """The tensors of the value share the memory of data, unless it's an immutable bytes object."""
+    if isinstance(data, bytes):
+        data = bytearray(data)
+    value, metadata = _parse(data)
+    return (value, metadata) if return_metadata else value
+
+
+def save(value, path: str, metadata: Optional[dict[str, str]] = None):
+    header, tensors = _build(value, metadata)
+    with open(path, "wb") as f:
+        f.write(header)
+        for tensor in tensors:
+            f.write(_tensor_bytes(tensor))
+
+
+def load(path: str, return_metadata=False, mmap_file=True):
+    """
+    Loads a value saved with save(). With mmap_file, the tensors are backed by a private copy-on-write mapping of
+    the file: they are only read when used, and writing to them doesn't change the file.
+    """
+    with open(path, "rb") as f:
+        if mmap_file:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        else:
+            data = bytearray(f.read())
+    value, metadata = _parse(data)
+    return (value, metadata) if return_metadata else value
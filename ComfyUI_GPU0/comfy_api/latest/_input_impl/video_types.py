@@ -2,15 +2,17 @@ from __future__ import annotations
 from av.container import InputContainer
 from av.subtitles.stream import SubtitleStream
 from fractions import Fraction
-from typing import Optional
+from typing import Iterator, Optional
 from comfy_api.latest._input import AudioInput, VideoInput
 import av
+import collections
 import io
 import json
 import numpy as np
 import math
 import torch
 from comfy_api.latest._util import VideoContainer, VideoCodec, VideoComponents
+from comfy_api.latest._input_impl.video_encoder import CONTAINER_FORMATS, add_video_stream, encode_video_frames, get_audio_encoder_name, resolve_format
 
 
 def container_to_output_format(container_format: str | None) -> str | None:
@@ -47,6 +49,8 @@ def get_open_write_kwargs(
             to_format = container_format.lower()
         elif isinstance(to_format, str):
             to_format = to_format.lower()
+            if to_format == VideoContainer.MKV:
+                to_format = CONTAINER_FORMATS[VideoContainer.MKV]
         open_kwargs["format"] = container_to_output_format(to_format)
 
     return open_kwargs
@@ -57,12 +61,68 @@ class VideoFromFile(VideoInput):
     Class representing video input from a file.
     """
 
-    def __init__(self, file: str | io.BytesIO):
+    def __init__(
+        self,
+        file: str | io.BytesIO,
+        *,
+        start_frame: int = 0,
+        end_frame: Optional[int] = None,
+        frame_stride: int = 1,
+        max_frames: Optional[int] = None,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        threads: int = 0,
+    ):
         """
         Initialize the VideoFromFile object based off of either a path on disk or a BytesIO object
         containing the file contents.
+
+        The optional decode options select a frame range (`start_frame` inclusive, `end_frame` exclusive),
+        keep every `frame_stride`-th frame up to `max_frames` frames and scale frames to `width`x`height`
+        while decoding. If only one of `width`/`height` is set the aspect ratio is kept. `threads` sets
+        the decoder thread count (0 lets the decoder decide).
         """
         self.__file = file
+        self.start_frame = max(0, start_frame)
+        self.end_frame = end_frame
+        self.frame_stride = max(1, frame_stride)
+        self.max_frames = max_frames
+        self.width = width
+        self.height = height
+        self.threads = threads
+
+    def with_decode_options(self, **kwargs) -> VideoFromFile:
+        """
+        Returns a new VideoFromFile for the same source with some decode options replaced.
+        """
+        options = {
+            "start_frame": self.start_frame,
+            "end_frame": self.end_frame,
+            "frame_stride": self.frame_stride,
+            "max_frames": self.max_frames,
+            "width": self.width,
+            "height": self.height,
+            "threads": self.threads,
+        }
+        options.update(kwargs)
+        return VideoFromFile(self.__file, **options)
+
+    def has_decode_options(self) -> bool:
+        """
+        Whether decoding selects a subset of the frames or scales them.
+        """
+        return (self.start_frame > 0 or self.end_frame is not None or self.frame_stride > 1 or self.max_frames is not None
+                or self.width is not None or self.height is not None)
+
+    def _get_target_size(self, width: int, height: int) -> tuple[int, int]:
+        target_width, target_height = self.width, self.height
+        if not target_width and not target_height:
+            return width, height
+        if not target_height:
+            target_height = max(1, round(height * target_width / width))
+        elif not target_width:
+            target_width = max(1, round(width * target_height / height))
+        return target_width, target_height
 
     def get_stream_source(self) -> str | io.BytesIO:
         """
@@ -86,12 +146,13 @@ class VideoFromFile(VideoInput):
             for stream in container.streams:
                 if stream.type == 'video':
                     assert isinstance(stream, av.VideoStream)
-                    return stream.width, stream.height
+                    return self._get_target_size(stream.width, stream.height)
         raise ValueError(f"No video stream found in file '{self.__file}'")
 
     def get_duration(self) -> float:
         """
-        Returns the duration of the video in seconds.
+        Returns the duration of the video in seconds. With decode options, this is the duration of the
+        selected frames.
 
         Returns:
             Duration in seconds
@@ -99,25 +160,43 @@ class VideoFromFile(VideoInput):
         if isinstance(self.__file, io.BytesIO):
             self.__file.seek(0)
         with av.open(self.__file, mode="r") as container:
-            if container.duration is not None:
-                return float(container.duration / av.time_base)
-
-            # Fallback: calculate from frame count and frame rate
+            duration = self._get_source_duration(container)
             video_stream = next(
                 (s for s in container.streams if s.type == "video"), None
             )
-            if video_stream and video_stream.frames and video_stream.average_rate:
-                return float(video_stream.frames / video_stream.average_rate)
-
-            # Last resort: decode frames to count them
-            if video_stream and video_stream.average_rate:
-                frame_count = 0
-                container.seek(0)
-                for packet in container.demux(video_stream):
-                    for _ in packet.decode():
-                        frame_count += 1
-                if frame_count > 0:
-                    return float(frame_count / video_stream.average_rate)
+            frame_rate = Fraction(video_stream.average_rate) if video_stream and video_stream.average_rate else None
+        if frame_rate is None or (self.start_frame == 0 and self.end_frame is None and self.frame_stride == 1 and self.max_frames is None):
+            return duration
+
+        end_frame = round(duration * frame_rate)
+        if self.end_frame is not None:
+            end_frame = min(end_frame, self.end_frame)
+        frame_count = max(0, math.ceil((end_frame - self.start_frame) / self.frame_stride))
+        if self.max_frames is not None:
+            frame_count = min(frame_count, self.max_frames)
+        # each selected frame lasts frame_stride source frames, like the frame rate of get_components()
+        return float(frame_count * self.frame_stride / frame_rate)
+
+    def _get_source_duration(self, container: InputContainer) -> float:
+        if container.duration is not None:
+            return float(container.duration / av.time_base)
+
+        # Fallback: calculate from frame count and frame rate
+        video_stream = next(
+            (s for s in container.streams if s.type == "video"), None
+        )
+        if video_stream and video_stream.frames and video_stream.average_rate:
+            return float(video_stream.frames / video_stream.average_rate)
+
+        # Last resort: decode frames to count them
+        if video_stream and video_stream.average_rate:
+            frame_count = 0
+            container.seek(0)
+            for packet in container.demux(video_stream):
+                for _ in packet.decode():
+                    frame_count += 1
+            if frame_count > 0:
+                return float(frame_count / video_stream.average_rate)
 
         raise ValueError(f"Could not determine duration for file '{self.__file}'")
 
@@ -133,45 +212,132 @@ class VideoFromFile(VideoInput):
         with av.open(self.__file, mode='r') as container:
             return container.format.name
 
-    def get_components_internal(self, container: InputContainer) -> VideoComponents:
-        # Get video frames
-        frames = []
-        for frame in container.decode(video=0):
-            img = frame.to_ndarray(format='rgb24')  # shape: (H, W, 3)
-            img = torch.from_numpy(img) / 255.0  # shape: (H, W, 3)
-            frames.append(img)
-
-        images = torch.stack(frames) if len(frames) > 0 else torch.zeros(0, 3, 0, 0)
+    def _iter_decoded(self, container: InputContainer, batch_size: int, audio_frames: Optional[list] = None) -> Iterator[torch.Tensor]:
+        """
+        Demuxes the container once, yielding the selected video frames as uint8 batches of shape
+        (N, H, W, 3). If `audio_frames` is a list, decoded audio frames are appended to it as
+        (start time, ndarray) pairs in the same pass.
+        """
+        video_stream = container.streams.video[0]
+        video_stream.thread_type = "AUTO"
+        if self.threads > 0:
+            video_stream.codec_context.thread_count = self.threads
+        audio_stream = container.streams.audio[0] if audio_frames is not None and len(container.streams.audio) > 0 else None
+        frame_rate = Fraction(video_stream.average_rate) if video_stream.average_rate else None
+        time_base = video_stream.time_base
+        stream_start = float(video_stream.start_time * time_base) if video_stream.start_time is not None and time_base else 0.0
+        width, height = self._get_target_size(video_stream.width, video_stream.height)
+
+        seeked = False
+        if self.start_frame > 0 and frame_rate is not None and time_base:
+            # jump to the keyframe before the first wanted frame instead of decoding everything before it
+            start_time = float(self.start_frame / frame_rate)
+            container.seek(int((stream_start + start_time) / time_base), stream=video_stream, backward=True)
+            seeked = True
+
+        streams = [video_stream] if audio_stream is None else [video_stream, audio_stream]
+        batch = []
+        frame_count = 0
+        sequential_index = 0
+        done = False
+        for packet in container.demux(*streams):
+            if packet.stream == audio_stream:
+                for frame in packet.decode():
+                    audio_frames.append((frame.time, frame.to_ndarray()))  # shape: (channels, samples)
+                continue
+            if done:
+                # keep demuxing until the audio for the selected range is complete
+                if audio_stream is not None and packet.pts is not None and time_base and float(packet.pts * time_base) - stream_start < self._get_end_time(frame_rate, frame_count):
+                    continue
+                break
+            for frame in packet.decode():
+                if seeked and frame.time is not None:
+                    # after seeking, the position is only known from the timestamp
+                    index = round((frame.time - stream_start) * frame_rate)
+                else:
+                    index = sequential_index
+                sequential_index += 1
+                if index < self.start_frame:
+                    continue
+                if (self.end_frame is not None and index >= self.end_frame) or (self.max_frames is not None and frame_count >= self.max_frames):
+                    done = True
+                    break
+                if (index - self.start_frame) % self.frame_stride != 0:
+                    continue
+                if frame.width != width or frame.height != height:
+                    frame = frame.reformat(width=width, height=height, format='rgb24')
+                batch.append(frame.to_ndarray(format='rgb24'))  # shape: (H, W, 3)
+                frame_count += 1
+                if len(batch) >= batch_size:
+                    yield torch.from_numpy(np.stack(batch))
+                    batch = []
+            if done and audio_stream is None:
+                break
+        if len(batch) > 0:
+            yield torch.from_numpy(np.stack(batch))
+
+    def _get_end_time(self, frame_rate: Optional[Fraction], frame_count: int) -> float:
+        if frame_rate is None:
+            return math.inf
+        end = math.inf
+        if self.end_frame is not None:
+            end = float(self.end_frame / frame_rate)
+        if self.max_frames is not None:
+            end = min(end, float((self.start_frame + self.max_frames * self.frame_stride) / frame_rate))
+        return end
+
+    def iter_frames(self, batch_size: int = 16) -> Iterator[torch.Tensor]:
+        """
+        Streams the selected frames as uint8 tensors of shape (N, H, W, 3), decoding at most
+        `batch_size` frames ahead, so that long videos can be processed without holding every
+        frame in memory.
+        """
+        if isinstance(self.__file, io.BytesIO):
+            self.__file.seek(0)
+        with av.open(self.__file, mode='r') as container:
+            yield from self._iter_decoded(container, batch_size)
 
-        # Get frame rate
-        video_stream = next(s for s in container.streams if s.type == 'video')
-        frame_rate = Fraction(video_stream.average_rate) if video_stream and video_stream.average_rate else Fraction(1)
+    def get_components_internal(self, container: InputContainer) -> VideoComponents:
+        video_stream = container.streams.video[0]
+        frame_rate = Fraction(video_stream.average_rate) if video_stream.average_rate else Fraction(1)
+
+        # Get video frames and audio in a single demux pass; frames are kept as uint8 until the final
+        # float tensor is allocated, so no per-frame float copies are made.
+        audio_frames = []
+        batches = collections.deque(self._iter_decoded(container, 32, audio_frames))
+        frame_count = sum(b.shape[0] for b in batches)
+        if frame_count > 0:
+            images = torch.empty((frame_count,) + tuple(batches[0].shape[1:]), dtype=torch.float32)
+            offset = 0
+            while len(batches) > 0:
+                b = batches.popleft()
+                images[offset:offset + b.shape[0]].copy_(b).div_(255.0)
+                offset += b.shape[0]
+        else:
+            images = torch.zeros(0, 3, 0, 0)
 
         # Get audio if available
         audio = None
-        try:
-            container.seek(0)  # Reset the container to the beginning
-            for stream in container.streams:
-                if stream.type != 'audio':
-                    continue
-                assert isinstance(stream, av.AudioStream)
-                audio_frames = []
-                for packet in container.demux(stream):
-                    for frame in packet.decode():
-                        assert isinstance(frame, av.AudioFrame)
-                        audio_frames.append(frame.to_ndarray())  # shape: (channels, samples)
-                if len(audio_frames) > 0:
-                    audio_data = np.concatenate(audio_frames, axis=1)  # shape: (channels, total_samples)
-                    audio_tensor = torch.from_numpy(audio_data).unsqueeze(0)  # shape: (1, channels, total_samples)
-                    audio = AudioInput({
-                        "waveform": audio_tensor,
-                        "sample_rate": int(stream.sample_rate) if stream.sample_rate else 1,
-                    })
-        except StopIteration:
-            pass  # No audio stream
+        if len(audio_frames) > 0:
+            audio_stream = container.streams.audio[0]
+            sample_rate = int(audio_stream.sample_rate) if audio_stream.sample_rate else 1
+            audio_data = np.concatenate([a for _, a in audio_frames], axis=1)  # shape: (channels, total_samples)
+            if self.has_decode_options() and audio_frames[0][0] is not None:
+                # trim to the time range of the selected frames
+                first_time = audio_frames[0][0]
+                stream_start = float(video_stream.start_time * video_stream.time_base) if video_stream.start_time is not None and video_stream.time_base else 0.0
+                start = max(0, round((stream_start + float(self.start_frame / frame_rate) - first_time) * sample_rate))
+                end_time = self._get_end_time(frame_rate, frame_count)
+                end = audio_data.shape[1] if math.isinf(end_time) else max(start, round((stream_start + end_time - first_time) * sample_rate))
+                audio_data = audio_data[:, start:end]
+            audio_tensor = torch.from_numpy(audio_data).unsqueeze(0)  # shape: (1, channels, total_samples)
+            audio = AudioInput({
+                "waveform": audio_tensor,
+                "sample_rate": sample_rate,
+            })
 
         metadata = container.metadata
-        return VideoComponents(images=images, audio=audio, frame_rate=frame_rate, metadata=metadata)
+        return VideoComponents(images=images, audio=audio, frame_rate=frame_rate / self.frame_stride, metadata=metadata)
 
     def get_components(self) -> VideoComponents:
         if isinstance(self.__file, io.BytesIO):
@@ -185,15 +351,20 @@ class VideoFromFile(VideoInput):
         path: str | io.BytesIO,
         format: VideoContainer = VideoContainer.AUTO,
         codec: VideoCodec = VideoCodec.AUTO,
-        metadata: Optional[dict] = None
+        metadata: Optional[dict] = None,
+        *,
+        crf: Optional[float] = None,
+        codec_options: Optional[dict[str, str]] = None,
+        thread_count: int = 0,
     ):
         if isinstance(self.__file, io.BytesIO):
             self.__file.seek(0)  # Reset the BytesIO object to the beginning
         with av.open(self.__file, mode='r') as container:
             container_format = container.format.name
             video_encoding = container.streams.video[0].codec.name if len(container.streams.video) > 0 else None
-            reuse_streams = True
-            if format != VideoContainer.AUTO and format not in container_format.split(","):
+            # streams can only be copied as is when all frames are kept unscaled
+            reuse_streams = not self.has_decode_options() and crf is None and codec_options is None
+            if format != VideoContainer.AUTO and CONTAINER_FORMATS[VideoContainer(format)] not in container_format.split(","):
                 reuse_streams = False
             if codec != VideoCodec.AUTO and codec != video_encoding and video_encoding is not None:
                 reuse_streams = False
@@ -205,7 +376,10 @@ class VideoFromFile(VideoInput):
                     path,
                     format=format,
                     codec=codec,
-                    metadata=metadata
+                    metadata=metadata,
+                    crf=crf,
+                    codec_options=codec_options,
+                    thread_count=thread_count,
                 )
 
             streams = container.streams
@@ -255,16 +429,20 @@ class VideoFromComponents(VideoInput):
 
     def save_to(
         self,
-        path: str,
+        path: str | io.BytesIO,
         format: VideoContainer = VideoContainer.AUTO,
         codec: VideoCodec = VideoCodec.AUTO,
-        metadata: Optional[dict] = None
+        metadata: Optional[dict] = None,
+        *,
+        crf: Optional[float] = None,
+        codec_options: Optional[dict[str, str]] = None,
+        thread_count: int = 0,
     ):
-        if format != VideoContainer.AUTO and format != VideoContainer.MP4:
-            raise ValueError("Only MP4 format is supported for now")
-        if codec != VideoCodec.AUTO and codec != VideoCodec.H264:
-            raise ValueError("Only H264 codec is supported for now")
-        with av.open(path, mode='w', options={'movflags': 'use_metadata_tags'}) as output:
+        format, codec = resolve_format(format, codec)
+        open_kwargs = {"mode": "w", "format": CONTAINER_FORMATS[format]}
+        if format == VideoContainer.MP4:
+            open_kwargs["options"] = {"movflags": "use_metadata_tags"}
+        with av.open(path, **open_kwargs) as output:
             # Add metadata before writing any streams
             if metadata is not None:
                 for key, value in metadata.items():
@@ -272,29 +450,31 @@ class VideoFromComponents(VideoInput):
 
             frame_rate = Fraction(round(self.__components.frame_rate * 1000), 1000)
             # Create a video stream
-            video_stream = output.add_stream('h264', rate=frame_rate)
-            video_stream.width = self.__components.images.shape[2]
-            video_stream.height = self.__components.images.shape[1]
-            video_stream.pix_fmt = 'yuv420p'
+            video_stream = add_video_stream(
+                output,
+                codec,
+                frame_rate,
+                width=self.__components.images.shape[2],
+                height=self.__components.images.shape[1],
+                crf=crf,
+                codec_options=codec_options,
+                thread_count=thread_count,
+            )
 
             # Create an audio stream
             audio_sample_rate = 1
             audio_stream: Optional[av.AudioStream] = None
             if self.__components.audio:
                 audio_sample_rate = int(self.__components.audio['sample_rate'])
-                audio_stream = output.add_stream('aac', rate=audio_sample_rate)
+                audio_encoder = get_audio_encoder_name(format)
+                stream_rate = audio_sample_rate
+                if audio_encoder == "libopus" and stream_rate not in (8000, 12000, 16000, 24000, 48000):
+                    # the encoder resamples the audio to the stream rate
+                    stream_rate = 48000
+                audio_stream = output.add_stream(audio_encoder, rate=stream_rate)
 
             # Encode video
-            for i, frame in enumerate(self.__components.images):
-                img = (frame * 255).clamp(0, 255).byte().cpu().numpy() # shape: (H, W, 3)
-                frame = av.VideoFrame.from_ndarray(img, format='rgb24')
-                frame = frame.reformat(format='yuv420p')  # Convert to YUV420P as required by h264
-                packet = video_stream.encode(frame)
-                output.mux(packet)
-
-            # Flush video
-            packet = video_stream.encode(None)
-            output.mux(packet)
+            encode_video_frames(output, video_stream, self.__components.images)
 
             if audio_stream and self.__components.audio:
                 waveform = self.__components.audio['waveform']
@@ -1,11 +1,13 @@
+import collections
 import itertools
-from typing import Sequence, Mapping, Dict
+from typing import Hashable, Iterable, Sequence, Mapping, Dict
 from comfy_execution.graph import DynamicPrompt
 from abc import ABC, abstractmethod
 
 import nodes
 
 from comfy_execution.graph_utils import is_link
+from comfy_execution.node_schema import get_node_schema
 
 NODE_CLASS_CONTAINS_UNIQUE_ID: Dict[str, bool] = {}
 
@@ -14,7 +16,7 @@ def include_unique_id_in_input(class_type: str) -> bool:
     if class_type in NODE_CLASS_CONTAINS_UNIQUE_ID:
         return NODE_CLASS_CONTAINS_UNIQUE_ID[class_type]
     class_def = nodes.NODE_CLASS_MAPPINGS[class_type]
-    NODE_CLASS_CONTAINS_UNIQUE_ID[class_type] = "UNIQUE_ID" in class_def.INPUT_TYPES().get("hidden", {}).values()
+    NODE_CLASS_CONTAINS_UNIQUE_ID[class_type] = "UNIQUE_ID" in get_node_schema(class_def).hidden.values()
     return NODE_CLASS_CONTAINS_UNIQUE_ID[class_type]
 
 class CacheKeySet(ABC):
@@ -141,6 +143,57 @@ class CacheKeySetInputSignature(CacheKeySet):
                     order_mapping[ancestor_id] = len(ancestors) - 1
                     self.get_ordered_ancestry_internal(dynprompt, ancestor_id, ancestors, order_mapping)
 
+class CachePins:
+    """
+    Reference counts of the cache keys of the next queued and the last executed prompts. A cache with pins keeps
+    the results they use when it drops the ones the current prompt doesn't use, so running a prompt of another
+    graph in between doesn't throw away the intermediate results the prompts of this one share.
+    """
+    def __init__(self, max_prompts):
+        self.max_prompts = max_prompts
+        self.counts = collections.Counter()
+        self.prompt_keys: Dict[str, frozenset] = {}
+        self.queued = set()
+        self.executed = collections.deque()
+
+    def __contains__(self, key):
+        return key in self.counts
+
+    def _pin(self, prompt_id, keys: Iterable[Hashable]):
+        self._unpin(prompt_id)
+        keys = frozenset(keys)
+        self.prompt_keys[prompt_id] = keys
+        self.counts.update(keys)
+
+    def _unpin(self, prompt_id):
+        keys = self.prompt_keys.pop(prompt_id, None)
+        if keys is None:
+            return
+        self.counts.subtract(keys)
+        for key in keys:
+            if self.counts[key] <= 0:
+                del self.counts[key]
+
+    def pin_queued(self, prompt_id, keys: Iterable[Hashable]):
+        self.queued.add(prompt_id)
+        self._pin(prompt_id, keys)
+
+    def unpin_queued(self, queued_prompt_ids: set):
+        """Unpins the queued prompts that aren't in queued_prompt_ids anymore and didn't execute."""
+        for prompt_id in self.queued - queued_prompt_ids:
+            self.queued.discard(prompt_id)
+            self._unpin(prompt_id)
+
+    def pin_executed(self, prompt_id, keys: Iterable[Hashable]):
+        """Pins the keys of an executing prompt in place of the ones it was queued with, until max_prompts more executed."""
+        self.queued.discard(prompt_id)
+        if prompt_id in self.executed:
+            self.executed.remove(prompt_id)
+        self.executed.append(prompt_id)
+        self._pin(prompt_id, keys)
+        while len(self.executed) > self.max_prompts:
+            self._unpin(self.executed.popleft())
+
 class BasicCache:
     def __init__(self, key_class):
         self.key_class = key_class
@@ -149,6 +202,7 @@ class BasicCache:
         self.cache_key_set: CacheKeySet
         self.cache = {}
         self.subcaches = {}
+        self.pins = None
 
     async def set_prompt(self, dynprompt, node_ids, is_changed_cache):
         self.dynprompt = dynprompt
@@ -168,7 +222,7 @@ class BasicCache:
         preserve_keys = set(self.cache_key_set.get_used_keys())
         to_remove = []
         for key in self.cache:
-            if key not in preserve_keys:
+            if key not in preserve_keys and (self.pins is None or key not in self.pins):
                 to_remove.append(key)
         for key in to_remove:
             del self.cache[key]
@@ -178,7 +232,7 @@ class BasicCache:
 
         to_remove = []
         for key in self.subcaches:
-            if key not in preserve_subcaches:
+            if key not in preserve_subcaches and (self.pins is None or key not in self.pins):
                 to_remove.append(key)
         for key in to_remove:
             del self.subcaches[key]
@@ -5,6 +5,8 @@ import nodes
 import asyncio
 import inspect
 from comfy_execution.graph_utils import is_link, ExecutionBlocker
+from comfy_execution.node_schema import get_node_schema
+from comfy_execution.resources import ExecutionResources
 from comfy.comfy_types.node_typing import ComfyNodeABC, InputTypeDict, InputTypeOptions
 
 # NOTE: ExecutionBlocker code got moved to graph_utils.py to prevent torch being imported too soon during unit tests
@@ -111,7 +113,10 @@ class TopologicalSort:
     def get_input_info(self, unique_id, input_name):
         class_type = self.dynprompt.get_node(unique_id)["class_type"]
         class_def = nodes.NODE_CLASS_MAPPINGS[class_type]
-        return get_input_info(class_def, input_name)
+        info = get_node_schema(class_def).inputs.get(input_name)
+        if info is None:
+            return None, None, None
+        return info.input_type, info.category, info.extra_info
 
     def make_input_strong_link(self, to_node_id, to_input):
         inputs = self.dynprompt.get_node(to_node_id)["inputs"]
@@ -185,15 +190,30 @@ class TopologicalSort:
     def is_empty(self):
         return len(self.pendingNodes) == 0
 
+    def get_pending_order(self):
+        """Returns the pending nodes in an order they can be executed in, without changing the graph."""
+        block_count = dict(self.blockCount)
+        order = [node_id for node_id in self.pendingNodes if block_count[node_id] == 0]
+        i = 0
+        while i < len(order):
+            for blocked_node_id in self.blocking[order[i]]:
+                block_count[blocked_node_id] -= 1
+                if block_count[blocked_node_id] == 0:
+                    order.append(blocked_node_id)
+            i += 1
+        return order
+
 class ExecutionList(TopologicalSort):
     """
     ExecutionList implements a topological dissolve of the graph. After a node is staged for execution,
     it can still be returned to the graph after having further dependencies added.
     """
-    def __init__(self, dynprompt, output_cache):
+    def __init__(self, dynprompt, output_cache, resources: ExecutionResources | None = None):
         super().__init__(dynprompt)
         self.output_cache = output_cache
         self.staged_node_id = None
+        # with resources, nodes that only need the CPU or IO run in its thread pool
+        self.resources = resources
 
     def is_cached(self, node_id):
         return self.output_cache.get(node_id) is not None
@@ -202,12 +222,12 @@ class ExecutionList(TopologicalSort):
         assert self.staged_node_id is None
         if self.is_empty():
             return None, None, None
-        available = self.get_ready_nodes()
+        available = self.get_startable_nodes()
         while len(available) == 0 and self.externalBlocks > 0:
             # Wait for an external block to be released
             await self.unblockedEvent.wait()
             self.unblockedEvent.clear()
-            available = self.get_ready_nodes()
+            available = self.get_startable_nodes()
         if len(available) == 0:
             cycled_nodes = self.get_nodes_in_cycle()
             # Because cycles composed entirely of static nodes are caught during initial validation,
@@ -231,6 +251,18 @@ class ExecutionList(TopologicalSort):
         self.staged_node_id = self.ux_friendly_pick_node(available)
         return self.staged_node_id, None, None
 
+    def get_node_resources(self, node_id):
+        class_type = self.dynprompt.get_node(node_id)["class_type"]
+        return get_node_schema(nodes.NODE_CLASS_MAPPINGS[class_type]).resources
+
+    def get_startable_nodes(self):
+        available = self.get_ready_nodes()
+        if self.resources is None:
+            return available
+        # a ready node whose resources are all taken waits for a running one to finish, which releases an
+        # external block
+        return [node_id for node_id in available if self.resources.can_start(self.get_node_resources(node_id))]
+
     def ux_friendly_pick_node(self, node_list):
         # If an output node is available, do that first.
         # Technically this has no effect on the overall length of execution, but it feels better as a user
@@ -250,8 +282,12 @@ class ExecutionList(TopologicalSort):
             class_def = nodes.NODE_CLASS_MAPPINGS[class_type]
             return inspect.iscoroutinefunction(getattr(class_def, class_def.FUNCTION))
 
+        # Nodes running in the thread pool are started early for the same reason.
+        def is_concurrent(node_id):
+            return self.resources is not None and self.resources.runs_concurrently(self.get_node_resources(node_id))
+
         for node_id in node_list:
-            if is_output(node_id) or is_async(node_id):
+            if is_output(node_id) or is_async(node_id) or is_concurrent(node_id):
                 return node_id
 
         #This should handle the VAEDecode -> preview case
@@ -0,0 +1,112 @@
+"""
+Look-ahead reading of the model files of upcoming loader nodes.
+
+While the executor runs the first nodes of a prompt, a background thread reads the files the later loader nodes
+will load (checkpoints, diffusion models, text encoders, VAEs, LoRAs...) into the OS page cache, so the loaders
+find them in memory instead of waiting on the disk. Which inputs name model files doesn't have to be declared: a
+combo input whose options come from folder_paths.get_filename_list() and whose value resolves to a model file in
+one of those folders is prefetched.
+
+The files are read in the order the nodes can execute in, up to a budget of bytes per prompt. The reading stops
+when the prompt ends or is interrupted, and skips the files whose loader already started.
+"""
+from __future__ import annotations
+from typing import Callable, Optional
+import logging
+import os
+import threading
+import time
+
+import folder_paths
+import nodes
+from comfy_execution.node_schema import get_node_schema
+
+CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def get_model_files(dynprompt, node_ids: list[str]) -> list[tuple[str, set[str]]]:
+    """Returns the model files node_ids load, in the order of the first node loading each, with the ids of the nodes."""
+    files: dict[str, set[str]] = {}
+    for node_id in node_ids:
+        node = dynprompt.get_node(node_id)
+        class_def = nodes.NODE_CLASS_MAPPINGS.get(node["class_type"])
+        if class_def is None:
+            continue
+        schema = get_node_schema(class_def)
+        folders = [name for kind, name in schema.dependencies if kind == "folder"]
+        if len(folders) == 0:
+            continue
+        for input_name, value in node["inputs"].items():
+            if not isinstance(value, str):
+                continue
+            info = schema.inputs.get(input_name)
+            if info is None or not isinstance(info.input_type, list) or value not in info.input_type:
+                continue
+            for folder in folders:
+                path = folder_paths.get_full_path(folder, value)
+                if path is not None and os.path.splitext(path)[1].lower() in folder_paths.supported_pt_extensions:
+                    files.setdefault(path, set()).add(node_id)
+                    break
+    return list(files.items())
+
+
+class ModelPrefetcher:
+    def __init__(self, files: list[tuple[str, set[str]]], budget: int, is_interrupted: Callable[[], bool]):
+        self.files = files
+        self.budget = budget
+        self.is_interrupted = is_interrupted
+        self.cancelled = threading.Event()
+        self.started_nodes: set[str] = set()
+        self.thread: Optional[threading.Thread] = None
+        self.prefetched_bytes = 0
+
+    def start(self):
+        if len(self.files) == 0 or self.budget <= 0:
+            return
+        self.thread = threading.Thread(target=self._run, name="model-prefetch", daemon=True)
+        self.thread.start()
+
+    def node_started(self, node_id: str):
+        self.started_nodes.add(node_id)
+
+    def cancel(self):
+        # called on the executor's event loop, the thread stops by itself after the chunk it's reading
+        self.cancelled.set()
+        self.thread = None
+
+    def _should_stop(self) -> bool:
+        return self.cancelled.is_set() or self.is_interrupted()
+
+    def _run(self):
+        start = time.perf_counter()
+        remaining = self.budget
+        buffer = bytearray(CHUNK_SIZE)
+        for path, node_ids in self.files:
+            if self._should_stop():
+                break
+            if node_ids <= self.started_nodes:
+                continue
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            if size > remaining:
+                continue
+            remaining -= size
+            try:
+                self._read(path, buffer, node_ids)
+            except OSError as e:
+                logging.debug(f"Failed to prefetch {path}: {e}")
+        if self.prefetched_bytes > 0:
+            logging.debug(f"Prefetched {self.prefetched_bytes / (1024 * 1024):.0f} MB of model files in {time.perf_counter() - start:.2f} seconds")
+
+    def _read(self, path: str, buffer: bytearray, node_ids: set[str]):
+        with open(path, "rb", buffering=0) as f:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            view = memoryview(buffer)
+            while not self._should_stop() and not node_ids <= self.started_nodes:
+                read = f.readinto(view)
+                if not read:
+                    break
+                self.prefetched_bytes += read
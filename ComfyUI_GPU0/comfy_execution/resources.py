@@ -0,0 +1,83 @@
+"""
+Resource model for running independent nodes concurrently (--concurrent-nodes).
+
+A node class declares what its function needs with EXECUTION_RESOURCES:
+
+    class LoadImage:
+        EXECUTION_RESOURCES = ("io",)
+
+Nodes that only need "cpu" and/or "io" run in a thread pool, so a ready branch that loads or preprocesses
+images doesn't wait behind another branch's sampling. Every other node, including all the ones that don't declare
+anything, needs the "gpu": it runs on the executor's own thread like before, one at a time per device (a server
+process drives a single device). Declaring "cpu" or "io" promises that the function doesn't load models through
+comfy.model_management, which isn't thread safe, and doesn't expand a subgraph.
+"""
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+
+GPU = "gpu"
+CPU = "cpu"
+IO = "io"
+
+DEFAULT_RESOURCES = frozenset((GPU,))
+CONCURRENT_RESOURCES = frozenset((CPU, IO))
+
+
+def get_node_resources(class_def: type) -> frozenset[str]:
+    resources = getattr(class_def, "EXECUTION_RESOURCES", None)
+    if resources is None or len(resources) == 0:
+        return DEFAULT_RESOURCES
+    return frozenset(resources)
+
+
+class ExecutionResources:
+    """
+    Tracks the nodes running in the thread pool. At most workers "io" nodes and as many "cpu" nodes as there are
+    cores run at once, a node declaring both counts against both. Only used from the executor's event loop.
+    """
+
+    def __init__(self, workers: int):
+        self.thread_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="comfy-node")
+        self.capacity = {CPU: min(workers, os.cpu_count() or 1), IO: workers}
+        self.in_use = {CPU: 0, IO: 0}
+        self.running: set[asyncio.Task] = set()
+
+    @staticmethod
+    def runs_concurrently(resources: frozenset[str]) -> bool:
+        return len(resources) > 0 and resources <= CONCURRENT_RESOURCES
+
+    def can_start(self, resources: frozenset[str]) -> bool:
+        if not self.runs_concurrently(resources):
+            return True
+        return all(self.in_use[r] < self.capacity[r] for r in resources)
+
+    def acquire(self, resources: frozenset[str]):
+        for r in resources:
+            self.in_use[r] += 1
+
+    def release(self, resources: frozenset[str]):
+        for r in resources:
+            self.in_use[r] -= 1
+
+    def release_when_done(self, resources: frozenset[str], tasks: list[asyncio.Task]):
+        """Releases the resources of a node once all the tasks of its calls finished."""
+        remaining = set(tasks)
+        self.running.update(tasks)
+
+        def done(task):
+            self.running.discard(task)
+            remaining.discard(task)
+            if len(remaining) == 0:
+                self.release(resources)
+        for task in tasks:
+            task.add_done_callback(done)
+
+    async def wait(self):
+        """
+        Waits for the nodes still running in the thread pool. Threads can't be cancelled like the tasks of async
+        nodes, a prompt that failed or was interrupted waits for them before the next one starts.
+        """
+        if len(self.running) > 0:
+            await asyncio.gather(*self.running, return_exceptions=True)
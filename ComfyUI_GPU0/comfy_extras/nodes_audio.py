@@ -9,7 +9,6 @@ import os
 import io
 import json
 import random
-import hashlib
 import node_helpers
 import logging
 from comfy.cli_args import args
@@ -336,10 +335,7 @@ class LoadAudio:
     @classmethod
     def IS_CHANGED(s, audio):
         image_path = folder_paths.get_annotated_filepath(audio)
-        m = hashlib.sha256()
-        with open(image_path, 'rb') as f:
-            m.update(f.read())
-        return m.digest().hex()
+        return folder_paths.get_file_fingerprint(image_path)
 
     @classmethod
     def VALIDATE_INPUTS(s, audio):
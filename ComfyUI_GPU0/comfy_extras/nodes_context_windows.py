@@ -1,4 +1,5 @@
 from __future__ import annotations
+import torch
 from comfy_api.latest import ComfyExtension, io
 import comfy.context_windows
 import nodes
@@ -26,6 +27,8 @@ class ContextWindowsManualNode(io.ComfyNode):
                 io.Boolean.Input("closed_loop", default=False, tooltip="Whether to close the context window loop; only applicable to looped schedules."),
                 io.Combo.Input("fuse_method", options=comfy.context_windows.ContextFuseMethods.LIST_STATIC, default=comfy.context_windows.ContextFuseMethods.PYRAMID, tooltip="The method to use to fuse the context windows."),
                 io.Int.Input("dim", min=0, max=5, default=0, tooltip="The dimension to apply the context windows to."),
+                io.Int.Input("max_batched_windows", min=1, max=64, default=1, optional=True, tooltip="The maximum number of context windows to evaluate together in one batch when memory allows; not applicable when dim is 0."),
+                io.String.Input("devices", default="", optional=True, tooltip="Comma separated extra devices (e.g. cuda:1,cuda:2) to spread the context windows over; a copy of the model is loaded on each of them during sampling."),
             ],
             outputs=[
                 io.Model.Output(tooltip="The model with context windows applied during sampling."),
@@ -34,8 +37,9 @@ class ContextWindowsManualNode(io.ComfyNode):
         )
 
     @classmethod
-    def execute(cls, model: io.Model.Type, context_length: int, context_overlap: int, context_schedule: str, context_stride: int, closed_loop: bool, fuse_method: str, dim: int) -> io.Model:
+    def execute(cls, model: io.Model.Type, context_length: int, context_overlap: int, context_schedule: str, context_stride: int, closed_loop: bool, fuse_method: str, dim: int, max_batched_windows: int=1, devices: str="") -> io.Model:
         model = model.clone()
+        devices = [torch.device(device.strip()) for device in devices.split(",") if device.strip() != ""]
         model.model_options["context_handler"] = comfy.context_windows.IndexListContextHandler(
             context_schedule=comfy.context_windows.get_matching_context_schedule(context_schedule),
             fuse_method=comfy.context_windows.get_matching_fuse_method(fuse_method),
@@ -43,9 +47,13 @@ class ContextWindowsManualNode(io.ComfyNode):
             context_overlap=context_overlap,
             context_stride=context_stride,
             closed_loop=closed_loop,
-            dim=dim)
+            dim=dim,
+            max_batched_windows=max_batched_windows,
+            devices=devices)
         # make memory usage calculation only take into account the context window latents
         comfy.context_windows.create_prepare_sampling_wrapper(model)
+        if len(devices) > 0:
+            comfy.context_windows.create_outer_sample_wrapper(model)
         return io.NodeOutput(model)
 
 class WanContextWindowsManualNode(ContextWindowsManualNode):
@@ -68,14 +76,16 @@ class WanContextWindowsManualNode(ContextWindowsManualNode):
                 io.Int.Input("context_stride", min=1, default=1, tooltip="The stride of the context window; only applicable to uniform schedules."),
                 io.Boolean.Input("closed_loop", default=False, tooltip="Whether to close the context window loop; only applicable to looped schedules."),
                 io.Combo.Input("fuse_method", options=comfy.context_windows.ContextFuseMethods.LIST_STATIC, default=comfy.context_windows.ContextFuseMethods.PYRAMID, tooltip="The method to use to fuse the context windows."),
+                io.Int.Input("max_batched_windows", min=1, max=64, default=1, optional=True, tooltip="The maximum number of context windows to evaluate together in one batch when memory allows."),
+                io.String.Input("devices", default="", optional=True, tooltip="Comma separated extra devices (e.g. cuda:1,cuda:2) to spread the context windows over; a copy of the model is loaded on each of them during sampling."),
         ]
         return schema
 
     @classmethod
-    def execute(cls, model: io.Model.Type, context_length: int, context_overlap: int, context_schedule: str, context_stride: int, closed_loop: bool, fuse_method: str) -> io.Model:
+    def execute(cls, model: io.Model.Type, context_length: int, context_overlap: int, context_schedule: str, context_stride: int, closed_loop: bool, fuse_method: str, max_batched_windows: int=1, devices: str="") -> io.Model:
         context_length = max(((context_length - 1) // 4) + 1, 1)  # at least length 1
         context_overlap = max(((context_overlap - 1) // 4) + 1, 0)  # at least overlap 0
-        return super().execute(model, context_length, context_overlap, context_schedule, context_stride, closed_loop, fuse_method, dim=2)
+        return super().execute(model, context_length, context_overlap, context_schedule, context_stride, closed_loop, fuse_method, dim=2, max_batched_windows=max_batched_windows, devices=devices)
 
 
 class ContextWindowsExtension(ComfyExtension):
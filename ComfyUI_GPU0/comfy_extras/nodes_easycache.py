@@ -5,6 +5,8 @@ import comfy.patcher_extension
 import logging
 import torch
 import comfy.model_patcher
+import comfy.model_management
+import comfy.model_base
 if TYPE_CHECKING:
     from uuid import UUID
 
@@ -487,11 +489,248 @@ class LazyCacheNode(io.ComfyNode):
         return io.NodeOutput(model)
 
 
+def blockcache_sample_wrapper(executor, *args, **kwargs):
+    """
+    This OUTER_SAMPLE wrapper makes sure the block cache is prepped for current run, and all memory usage is cleared at the end.
+    """
+    try:
+        guider = executor.class_obj
+        orig_model_options = guider.model_options
+        guider.model_options = comfy.model_patcher.create_model_options_clone(orig_model_options)
+        guider.model_options["transformer_options"]["blockcache"] = guider.model_options["transformer_options"]["blockcache"].clone().prepare_timesteps(guider.model_patcher.model.model_sampling)
+        blockcache: BlockCacheHolder = guider.model_options["transformer_options"]["blockcache"]
+        logging.info(f"{blockcache.name} enabled - threshold: {blockcache.reuse_threshold}, block ranges: {blockcache.block_ranges}, start_percent: {blockcache.start_percent}, end_percent: {blockcache.end_percent}")
+        return executor(*args, **kwargs)
+    finally:
+        blockcache = guider.model_options["transformer_options"]["blockcache"]
+        if blockcache.patch_calls == 0:
+            logging.warning(f"{blockcache.name} - the model never called its double_block patches, nothing was cached. This model is not supported.")
+        blockcache.log_stats()
+        blockcache.reset()
+        guider.model_options = orig_model_options
+
+
+class BlockRangeState:
+    def __init__(self):
+        self.input_prev_subsampled: torch.Tensor = None
+        self.range_input: torch.Tensor = None
+        self.residual: torch.Tensor = None
+        self.cumulative_change_rate = 0.0
+        self.skip = False
+
+
+class BlockRangeStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.errors = []
+
+    def mean_error(self) -> float:
+        if len(self.errors) == 0:
+            return 0.0
+        return sum(self.errors) / len(self.errors)
+
+
+class BlockCachePatch:
+    """
+    Replacement for a single transformer block; the holder's state lives in transformer_options so that the patch itself stays stateless.
+    """
+    def __init__(self, range_start: int, range_end: int, block_idx: int, previous_patch=None):
+        self.range_start = range_start
+        self.range_end = range_end
+        self.block_idx = block_idx
+        self.previous_patch = previous_patch
+
+    def call_block(self, args, extra_options):
+        if self.previous_patch is not None:
+            return self.previous_patch(args, extra_options)
+        return extra_options["original_block"](args)
+
+    def __call__(self, args, extra_options):
+        blockcache: BlockCacheHolder = args.get("transformer_options", {}).get("blockcache", None)
+        if blockcache is None:
+            return self.call_block(args, extra_options)
+        return blockcache.run_block(self, args, extra_options)
+
+
+class BlockCacheHolder:
+    """
+    Caches the residual (output - input) of ranges of transformer blocks and reuses it for a range when the
+    accumulated relative change of the range input since the last computed step is below reuse_threshold.
+    """
+    def __init__(self, reuse_threshold: float, block_ranges: list[tuple[int, int]], start_percent: float, end_percent: float, subsample_factor: int, offload_residuals: bool, verbose: bool=False):
+        self.name = "BlockCache"
+        self.reuse_threshold = reuse_threshold
+        self.block_ranges = block_ranges
+        self.start_percent = start_percent
+        self.end_percent = end_percent
+        self.subsample_factor = subsample_factor
+        self.offload_residuals = offload_residuals
+        self.verbose = verbose
+        # timestep values
+        self.start_t = 0.0
+        self.end_t = 0.0
+        # keyed by (range_start, uuids, context window)
+        self.range_states: dict[tuple, BlockRangeState] = {}
+        # keyed by range_start
+        self.range_stats: dict[int, BlockRangeStats] = {}
+        self.patch_calls = 0
+
+    def prepare_timesteps(self, model_sampling):
+        self.start_t = model_sampling.percent_to_sigma(self.start_percent)
+        self.end_t = model_sampling.percent_to_sigma(self.end_percent)
+        return self
+
+    def is_active(self, timestep: torch.Tensor) -> bool:
+        return (timestep[0] <= self.start_t).item() and (timestep[0] > self.end_t).item()
+
+    def subsample(self, x: torch.Tensor) -> torch.Tensor:
+        if self.subsample_factor > 1:
+            return x[:, ::self.subsample_factor].clone()
+        return x.clone()
+
+    def get_state_key(self, range_start: int, transformer_options: dict[str]) -> tuple:
+        window = transformer_options.get("context_windows", transformer_options.get("context_window", None))
+        if isinstance(window, list):
+            window_key = tuple(tuple(w.index_list) for w in window)
+        elif window is not None:
+            window_key = tuple(window.index_list)
+        else:
+            window_key = None
+        return (range_start, tuple(transformer_options.get("uuids", [])), window_key)
+
+    def run_block(self, patch: BlockCachePatch, args: dict[str], extra_options: dict[str]) -> dict[str]:
+        self.patch_calls += 1
+        transformer_options = args["transformer_options"]
+        sigmas = transformer_options.get("sigmas", None)
+        if sigmas is None or not self.is_active(sigmas):
+            return patch.call_block(args, extra_options)
+
+        state = self.range_states.setdefault(self.get_state_key(patch.range_start, transformer_options), BlockRangeState())
+        stats = self.range_stats.setdefault(patch.range_start, BlockRangeStats())
+        x: torch.Tensor = args["img"]
+        if patch.block_idx == patch.range_start:
+            state.skip = False
+            x_subsampled = self.subsample(x)
+            if state.input_prev_subsampled is not None and state.residual is not None and state.input_prev_subsampled.shape == x_subsampled.shape and state.residual.shape == x.shape:
+                input_change_rate = ((x_subsampled - state.input_prev_subsampled).abs().mean() / state.input_prev_subsampled.abs().mean()).item()
+                state.cumulative_change_rate += input_change_rate
+                state.skip = state.cumulative_change_rate < self.reuse_threshold
+            state.input_prev_subsampled = x_subsampled
+            if state.skip:
+                stats.hits += 1
+                if self.verbose:
+                    logging.info(f"{self.name} [verbose] - blocks {patch.range_start}-{patch.range_end}: reusing residual; cumulative_change_rate: {state.cumulative_change_rate}")
+                return {"img": x + state.residual.to(x.device)}
+            stats.misses += 1
+            state.cumulative_change_rate = 0.0
+            state.range_input = x
+        elif state.skip:
+            # residual of the whole range was already applied at the start of the range
+            return {"img": x}
+
+        out = patch.call_block(args, extra_options)
+        if patch.block_idx == patch.range_end and state.range_input is not None:
+            residual = out["img"] - state.range_input
+            if self.verbose and state.residual is not None and state.residual.shape == residual.shape:
+                # error that reusing the previous residual would have caused for this step
+                error = (state.residual.to(residual.device) - residual).abs().mean() / out["img"].abs().mean()
+                stats.errors.append(error.item())
+            if self.offload_residuals:
+                residual = residual.to(comfy.model_management.intermediate_device())
+            state.residual = residual
+            state.range_input = None
+        return out
+
+    def log_stats(self):
+        total_hits = sum(stats.hits for stats in self.range_stats.values())
+        total = total_hits + sum(stats.misses for stats in self.range_stats.values())
+        if self.verbose:
+            for range_start, range_end in self.block_ranges:
+                stats = self.range_stats.get(range_start, None)
+                if stats is None:
+                    continue
+                logging.info(f"{self.name} [verbose] - blocks {range_start}-{range_end}: hits {stats.hits}, misses {stats.misses}, mean relative error when computed {stats.mean_error():.5f}")
+        logging.info(f"{self.name} - reused {total_hits}/{total} block range evaluations.")
+
+    def reset(self):
+        del self.range_states
+        self.range_states = {}
+        self.range_stats = {}
+        self.patch_calls = 0
+        return self
+
+    def clone(self):
+        return BlockCacheHolder(self.reuse_threshold, self.block_ranges, self.start_percent, self.end_percent, self.subsample_factor, self.offload_residuals, self.verbose)
+
+
+def get_block_ranges(start_block: int, end_block: int, blocks_per_range: int) -> list[tuple[int, int]]:
+    ranges = []
+    for range_start in range(start_block, end_block + 1, blocks_per_range):
+        ranges.append((range_start, min(range_start + blocks_per_range - 1, end_block)))
+    return ranges
+
+
+def apply_block_cache(model: comfy.model_patcher.ModelPatcher, holder: BlockCacheHolder):
+    existing_patches = model.model_options["transformer_options"].get("patches_replace", {}).get("dit", {})
+    for range_start, range_end in holder.block_ranges:
+        for block_idx in range(range_start, range_end + 1):
+            previous_patch = existing_patches.get(("double_block", block_idx), None)
+            model.set_model_patch_replace(BlockCachePatch(range_start, range_end, block_idx, previous_patch), "dit", "double_block", block_idx)
+    model.model_options["transformer_options"]["blockcache"] = holder
+    model.add_wrapper_with_key(comfy.patcher_extension.WrappersMP.OUTER_SAMPLE, "blockcache", blockcache_sample_wrapper)
+
+
+class BlockCacheNode(io.ComfyNode):
+    @classmethod
+    def define_schema(cls) -> io.Schema:
+        return io.Schema(
+            node_id="BlockCache",
+            display_name="BlockCache",
+            description="Reuses the residuals of individual transformer blocks, or ranges of blocks, when their input barely changed since the last computed step. Works with WAN-like models.",
+            category="advanced/debug/model",
+            is_experimental=True,
+            inputs=[
+                io.Model.Input("model", tooltip="The model to add BlockCache to."),
+                io.Float.Input("reuse_threshold", min=0.0, default=0.05, max=3.0, step=0.001, tooltip="The threshold of accumulated relative input change below which a block range reuses its cached residual."),
+                io.Int.Input("blocks_per_range", min=1, default=5, max=128, tooltip="The number of consecutive blocks that are cached together; 1 caches every block separately at the cost of more memory."),
+                io.Int.Input("start_block", min=0, default=0, max=128, tooltip="The first block to cache."),
+                io.Int.Input("end_block", min=-1, default=-1, max=128, tooltip="The last block to cache; -1 means the last block of the model."),
+                io.Float.Input("start_percent", min=0.0, default=0.15, max=1.0, step=0.01, tooltip="The relative sampling step to begin use of BlockCache."),
+                io.Float.Input("end_percent", min=0.0, default=0.95, max=1.0, step=0.01, tooltip="The relative sampling step to end use of BlockCache."),
+                io.Boolean.Input("offload_residuals", default=False, tooltip="Whether to keep cached residuals in RAM instead of VRAM."),
+                io.Boolean.Input("verbose", default=False, tooltip="Whether to log verbose information, including per block hit/miss and error statistics."),
+            ],
+            outputs=[
+                io.Model.Output(tooltip="The model with BlockCache."),
+            ],
+        )
+
+    @classmethod
+    def execute(cls, model: io.Model.Type, reuse_threshold: float, blocks_per_range: int, start_block: int, end_block: int, start_percent: float, end_percent: float,
+                offload_residuals: bool, verbose: bool) -> io.NodeOutput:
+        blocks = getattr(model.get_model_object("diffusion_model"), "blocks", None)
+        if blocks is None:
+            raise ValueError("BlockCache is not supported for this model.")
+        # these models add VACE hints, audio or face features to the hidden states between blocks, outside of the
+        # block patches: a skipped range would add them again on top of a residual that already contains them
+        if isinstance(model.model, (comfy.model_base.WAN21_Vace, comfy.model_base.WAN22_S2V, comfy.model_base.WAN22_Animate)):
+            raise ValueError("BlockCache is not supported for WAN VACE, S2V and Animate models.")
+        if end_block < 0 or end_block >= len(blocks):
+            end_block = len(blocks) - 1
+        model = model.clone()
+        holder = BlockCacheHolder(reuse_threshold, get_block_ranges(start_block, end_block, blocks_per_range), start_percent, end_percent, subsample_factor=8,
+                                  offload_residuals=offload_residuals, verbose=verbose)
+        apply_block_cache(model, holder)
+        return io.NodeOutput(model)
+
+
 class EasyCacheExtension(ComfyExtension):
     async def get_node_list(self) -> list[type[io.ComfyNode]]:
         return [
             EasyCacheNode,
             LazyCacheNode,
+            BlockCacheNode,
         ]
 
 def comfy_entrypoint():
@@ -17,6 +17,7 @@ import torch
 import comfy.utils
 
 from comfy.comfy_types import FileLocator, IO
+from comfy_execution import output_writer
 from server import PromptServer
 
 MAX_RESOLUTION = nodes.MAX_RESOLUTION
@@ -128,13 +129,12 @@ class SaveAnimatedWEBP:
         filename_prefix += self.prefix_append
         full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, self.output_dir, images[0].shape[1], images[0].shape[0])
         results: list[FileLocator] = []
-        pil_images = []
+        frames = []
         for image in images:
             i = 255. * image.cpu().numpy()
-            img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-            pil_images.append(img)
+            frames.append(np.clip(i, 0, 255).astype(np.uint8))
 
-        metadata = pil_images[0].getexif()
+        metadata = Image.Exif()
         if not args.disable_metadata:
             if prompt is not None:
                 metadata[0x0110] = "prompt:{}".format(json.dumps(prompt))
@@ -145,12 +145,12 @@ class SaveAnimatedWEBP:
                     inital_exif -= 1
 
         if num_frames == 0:
-            num_frames = len(pil_images)
+            num_frames = len(frames)
 
-        c = len(pil_images)
+        c = len(frames)
         for i in range(0, c, num_frames):
             file = f"{filename}_{counter:05}_.webp"
-            pil_images[i].save(os.path.join(full_output_folder, file), save_all=True, duration=int(1000.0/fps), append_images=pil_images[i + 1:i + num_frames], exif=metadata, lossless=lossless, quality=quality, method=method)
+            output_writer.save_image(os.path.join(full_output_folder, file), frames[i:i + num_frames], "WEBP", save_all=True, duration=int(1000.0/fps), exif=metadata, lossless=lossless, quality=quality, method=method)
             results.append({
                 "filename": file,
                 "subfolder": subfolder,
@@ -189,11 +189,10 @@ class SaveAnimatedPNG:
         filename_prefix += self.prefix_append
         full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, self.output_dir, images[0].shape[1], images[0].shape[0])
         results = list()
-        pil_images = []
+        frames = []
         for image in images:
             i = 255. * image.cpu().numpy()
-            img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-            pil_images.append(img)
+            frames.append(np.clip(i, 0, 255).astype(np.uint8))
 
         metadata = None
         if not args.disable_metadata:
@@ -205,7 +204,7 @@ class SaveAnimatedPNG:
                     metadata.add(b"comf", x.encode("latin-1", "strict") + b"\0" + json.dumps(extra_pnginfo[x]).encode("latin-1", "strict"), after_idat=True)
 
         file = f"{filename}_{counter:05}_.png"
-        pil_images[0].save(os.path.join(full_output_folder, file), pnginfo=metadata, compress_level=compress_level, save_all=True, duration=int(1000.0/fps), append_images=pil_images[1:])
+        output_writer.save_image(os.path.join(full_output_folder, file), frames, "PNG", pnginfo=metadata, compress_level=compress_level, save_all=True, duration=int(1000.0/fps))
         results.append({
             "filename": file,
             "subfolder": subfolder,
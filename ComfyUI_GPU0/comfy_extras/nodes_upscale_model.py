@@ -20,6 +20,7 @@ class UpscaleModelLoader:
                              }}
     RETURN_TYPES = ("UPSCALE_MODEL",)
     FUNCTION = "load_model"
+    EXECUTION_RESOURCES = ("io",)
 
     CATEGORY = "loaders"
 
@@ -1,10 +1,7 @@
 from __future__ import annotations
 
 import os
-import av
-import torch
 import folder_paths
-import json
 from typing import Optional
 from typing_extensions import override
 from fractions import Fraction
@@ -13,6 +10,29 @@ from comfy_api.input_impl import VideoFromComponents, VideoFromFile
 from comfy_api.util import VideoCodec, VideoComponents, VideoContainer
 from comfy_api.latest import ComfyExtension, io, ui
 from comfy.cli_args import args
+import comfy.utils
+import nodes
+
+
+def get_frame_selection_inputs() -> list[io.Input]:
+    return [
+        io.Int.Input("start_frame", default=0, min=0, max=1000000, optional=True, tooltip="The first frame to load."),
+        io.Int.Input("frame_count", default=0, min=0, max=1000000, optional=True, tooltip="The maximum number of frames to load; 0 loads all frames."),
+        io.Int.Input("frame_stride", default=1, min=1, max=1000, optional=True, tooltip="Load every Nth frame; the frame rate is divided accordingly."),
+        io.Int.Input("width", default=0, min=0, max=nodes.MAX_RESOLUTION, optional=True, tooltip="Scale frames to this width while decoding; 0 keeps the aspect ratio, or the original width if height is also 0."),
+        io.Int.Input("height", default=0, min=0, max=nodes.MAX_RESOLUTION, optional=True, tooltip="Scale frames to this height while decoding; 0 keeps the aspect ratio, or the original height if width is also 0."),
+    ]
+
+
+def get_decode_options(start_frame: int, frame_count: int, frame_stride: int, width: int, height: int) -> dict:
+    return {
+        "start_frame": start_frame,
+        "max_frames": frame_count if frame_count > 0 else None,
+        "frame_stride": frame_stride,
+        "width": width if width > 0 else None,
+        "height": height if height > 0 else None,
+    }
+
 
 class SaveWEBM(io.ComfyNode):
     @classmethod
@@ -27,6 +47,7 @@ class SaveWEBM(io.ComfyNode):
                 io.Combo.Input("codec", options=["vp9", "av1"]),
                 io.Float.Input("fps", default=24.0, min=0.01, max=1000.0, step=0.01),
                 io.Float.Input("crf", default=32.0, min=0, max=63.0, step=1, tooltip="Higher crf means lower quality with a smaller file size, lower crf means higher quality higher filesize."),
+                io.Int.Input("threads", default=0, min=0, max=256, optional=True, tooltip="The number of encoder threads, 0 lets the encoder decide."),
             ],
             outputs=[],
             hidden=[io.Hidden.prompt, io.Hidden.extra_pnginfo],
@@ -34,37 +55,27 @@ class SaveWEBM(io.ComfyNode):
         )
 
     @classmethod
-    def execute(cls, images, codec, fps, filename_prefix, crf) -> io.NodeOutput:
+    def execute(cls, images, codec, fps, filename_prefix, crf, threads=0) -> io.NodeOutput:
         full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(
             filename_prefix, folder_paths.get_output_directory(), images[0].shape[1], images[0].shape[0]
         )
 
         file = f"{filename}_{counter:05}_.webm"
-        container = av.open(os.path.join(full_output_folder, file), mode="w")
-
+        metadata = {}
         if cls.hidden.prompt is not None:
-            container.metadata["prompt"] = json.dumps(cls.hidden.prompt)
-
+            metadata["prompt"] = cls.hidden.prompt
         if cls.hidden.extra_pnginfo is not None:
-            for x in cls.hidden.extra_pnginfo:
-                container.metadata[x] = json.dumps(cls.hidden.extra_pnginfo[x])
-
-        codec_map = {"vp9": "libvpx-vp9", "av1": "libsvtav1"}
-        stream = container.add_stream(codec_map[codec], rate=Fraction(round(fps * 1000), 1000))
-        stream.width = images.shape[-2]
-        stream.height = images.shape[-3]
-        stream.pix_fmt = "yuv420p10le" if codec == "av1" else "yuv420p"
-        stream.bit_rate = 0
-        stream.options = {'crf': str(crf)}
-        if codec == "av1":
-            stream.options["preset"] = "6"
-
-        for frame in images:
-            frame = av.VideoFrame.from_ndarray(torch.clamp(frame[..., :3] * 255, min=0, max=255).to(device=torch.device("cpu"), dtype=torch.uint8).numpy(), format="rgb24")
-            for packet in stream.encode(frame):
-                container.mux(packet)
-        container.mux(stream.encode())
-        container.close()
+            metadata.update(cls.hidden.extra_pnginfo)
+
+        video = VideoFromComponents(VideoComponents(images=images, frame_rate=Fraction(round(fps * 1000), 1000)))
+        video.save_to(
+            os.path.join(full_output_folder, file),
+            format=VideoContainer.WEBM,
+            codec=VideoCodec(codec),
+            metadata=metadata,
+            crf=crf,
+            thread_count=threads,
+        )
 
         return io.NodeOutput(ui=ui.PreviewVideo([ui.SavedResult(file, subfolder, io.FolderType.output)]))
 
@@ -81,6 +92,7 @@ class SaveVideo(io.ComfyNode):
                 io.String.Input("filename_prefix", default="video/ComfyUI", tooltip="The prefix for the file to save. This may include formatting information such as %date:yyyy-MM-dd% or %Empty Latent Image.width% to include values from nodes."),
                 io.Combo.Input("format", options=VideoContainer.as_input(), default="auto", tooltip="The format to save the video as."),
                 io.Combo.Input("codec", options=VideoCodec.as_input(), default="auto", tooltip="The codec to use for the video."),
+                io.Int.Input("threads", default=0, min=0, max=256, optional=True, tooltip="The number of encoder threads when the video is re-encoded, 0 lets the encoder decide."),
             ],
             outputs=[],
             hidden=[io.Hidden.prompt, io.Hidden.extra_pnginfo],
@@ -88,7 +100,7 @@ class SaveVideo(io.ComfyNode):
         )
 
     @classmethod
-    def execute(cls, video: VideoInput, filename_prefix, format, codec) -> io.NodeOutput:
+    def execute(cls, video: VideoInput, filename_prefix, format, codec, threads=0) -> io.NodeOutput:
         width, height = video.get_dimensions()
         full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(
             filename_prefix,
@@ -106,11 +118,16 @@ class SaveVideo(io.ComfyNode):
             if len(metadata) > 0:
                 saved_metadata = metadata
         file = f"{filename}_{counter:05}_.{VideoContainer.get_extension(format)}"
+        encode_options = {}
+        if threads > 0:
+            # only passed when set, VideoInput implementations outside of comfy_api may not take encoder options
+            encode_options["thread_count"] = threads
         video.save_to(
             os.path.join(full_output_folder, file),
             format=format,
             codec=codec,
-            metadata=saved_metadata
+            metadata=saved_metadata,
+            **encode_options,
         )
 
         return io.NodeOutput(ui=ui.PreviewVideo([ui.SavedResult(file, subfolder, io.FolderType.output)]))
@@ -150,7 +167,7 @@ class GetVideoComponents(io.ComfyNode):
             description="Extracts all components from a video: frames, audio, and framerate.",
             inputs=[
                 io.Video.Input("video", tooltip="The video to extract components from."),
-            ],
+            ] + get_frame_selection_inputs(),
             outputs=[
                 io.Image.Output(display_name="images"),
                 io.Audio.Output(display_name="audio"),
@@ -159,10 +176,27 @@ class GetVideoComponents(io.ComfyNode):
         )
 
     @classmethod
-    def execute(cls, video: VideoInput) -> io.NodeOutput:
-        components = video.get_components()
+    def execute(cls, video: VideoInput, start_frame: int = 0, frame_count: int = 0, frame_stride: int = 1, width: int = 0, height: int = 0) -> io.NodeOutput:
+        has_options = start_frame > 0 or frame_count > 0 or frame_stride > 1 or width > 0 or height > 0
+        if has_options and isinstance(video, VideoFromFile) and not video.has_decode_options():
+            # select and scale frames while decoding instead of after
+            video = video.with_decode_options(**get_decode_options(start_frame, frame_count, frame_stride, width, height))
+            has_options = False
 
-        return io.NodeOutput(components.images, components.audio, float(components.frame_rate))
+        components = video.get_components()
+        if not has_options:
+            return io.NodeOutput(components.images, components.audio, float(components.frame_rate))
+        images = components.images
+        frame_rate = components.frame_rate
+        if start_frame > 0 or frame_count > 0 or frame_stride > 1:
+            end_frame = images.shape[0] if frame_count <= 0 else start_frame + frame_count * frame_stride
+            images = images[start_frame:end_frame:frame_stride]
+            frame_rate = frame_rate / frame_stride
+        if width > 0 or height > 0:
+            target_width = width if width > 0 else max(1, round(images.shape[2] * height / images.shape[1]))
+            target_height = height if height > 0 else max(1, round(images.shape[1] * width / images.shape[2]))
+            images = comfy.utils.common_upscale(images.movedim(-1, 1), target_width, target_height, "bilinear", "disabled").movedim(1, -1)
+        return io.NodeOutput(images, components.audio, float(frame_rate))
 
 class LoadVideo(io.ComfyNode):
     @classmethod
@@ -176,19 +210,19 @@ class LoadVideo(io.ComfyNode):
             category="image/video",
             inputs=[
                 io.Combo.Input("file", options=sorted(files), upload=io.UploadType.video),
-            ],
+            ] + get_frame_selection_inputs(),
             outputs=[
                 io.Video.Output(),
             ],
         )
 
     @classmethod
-    def execute(cls, file) -> io.NodeOutput:
+    def execute(cls, file, start_frame: int = 0, frame_count: int = 0, frame_stride: int = 1, width: int = 0, height: int = 0) -> io.NodeOutput:
         video_path = folder_paths.get_annotated_filepath(file)
-        return io.NodeOutput(VideoFromFile(video_path))
+        return io.NodeOutput(VideoFromFile(video_path, **get_decode_options(start_frame, frame_count, frame_stride, width, height)))
 
     @classmethod
-    def fingerprint_inputs(s, file):
+    def fingerprint_inputs(s, file, **kwargs):
         video_path = folder_paths.get_annotated_filepath(file)
         mod_time = os.path.getmtime(video_path)
         # Instead of hashing the file, we can just use the modification time to avoid
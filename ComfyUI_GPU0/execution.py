@@ -1,7 +1,10 @@
+import contextvars
 import copy
 import heapq
 import inspect
+import itertools
 import logging
+import os
 import sys
 import threading
 import time
@@ -13,10 +16,14 @@ import asyncio
 import torch
 
 import comfy.model_management
+import comfy.sampling_cache
+import comfy.tracing
+import folder_paths
 import nodes
 from comfy_execution.caching import (
     BasicCache,
     CacheKeySetID,
+    CachePins,
     CacheKeySetInputSignature,
     DependencyAwareCache,
     HierarchicalCache,
@@ -26,14 +33,18 @@ from comfy_execution.graph import (
     DynamicPrompt,
     ExecutionBlocker,
     ExecutionList,
-    get_input_info,
 )
 from comfy_execution.graph_utils import GraphBuilder, is_link
+from comfy_execution.node_schema import get_node_schema, is_custom_node_class, node_schemas
+from comfy_execution.prefetch import ModelPrefetcher, get_model_files
+from comfy_execution.resources import ExecutionResources
 from comfy_execution.validation import validate_node_input
 from comfy_execution.progress import get_progress_state, reset_progress_state, add_progress_handler, WebUIProgressHandler
 from comfy_execution.utils import CurrentNodeContext
 from comfy_api.internal import _ComfyNodeInternal, _NodeOutputInternal, first_real_override, is_class, make_locked_method_func
 from comfy_api.latest import io
+from comfy.cli_args import args
+from app.history_store import HistoryFilter, HistoryStore
 
 
 class ExecutionResult(Enum):
@@ -45,10 +56,12 @@ class DuplicateNodeError(Exception):
     pass
 
 class IsChangedCache:
-    def __init__(self, prompt_id: str, dynprompt: DynamicPrompt, outputs_cache: BasicCache):
+    def __init__(self, prompt_id: str, dynprompt: DynamicPrompt, outputs_cache: BasicCache, store_in_prompt: bool = True):
         self.prompt_id = prompt_id
         self.dynprompt = dynprompt
         self.outputs_cache = outputs_cache
+        # the values computed for a queued prompt ahead of its execution mustn't be reused by the execution
+        self.store_in_prompt = store_in_prompt
         self.is_changed = {}
 
     async def get(self, node_id):
@@ -58,15 +71,8 @@ class IsChangedCache:
         node = self.dynprompt.get_node(node_id)
         class_type = node["class_type"]
         class_def = nodes.NODE_CLASS_MAPPINGS[class_type]
-        has_is_changed = False
-        is_changed_name = None
-        if issubclass(class_def, _ComfyNodeInternal) and first_real_override(class_def, "fingerprint_inputs") is not None:
-            has_is_changed = True
-            is_changed_name = "fingerprint_inputs"
-        elif hasattr(class_def, "IS_CHANGED"):
-            has_is_changed = True
-            is_changed_name = "IS_CHANGED"
-        if not has_is_changed:
+        is_changed_name = get_node_schema(class_def).is_changed_name
+        if is_changed_name is None:
             self.is_changed[node_id] = False
             return self.is_changed[node_id]
 
@@ -79,15 +85,84 @@ class IsChangedCache:
         try:
             is_changed = await _async_map_node_over_list(self.prompt_id, node_id, class_def, input_data_all, is_changed_name)
             is_changed = await resolve_map_node_over_list_results(is_changed)
-            node["is_changed"] = [None if isinstance(x, ExecutionBlocker) else x for x in is_changed]
+            is_changed = [None if isinstance(x, ExecutionBlocker) else x for x in is_changed]
         except Exception as e:
             logging.warning("WARNING: {}".format(e))
-            node["is_changed"] = float("NaN")
+            is_changed = float("NaN")
         finally:
-            self.is_changed[node_id] = node["is_changed"]
+            self.is_changed[node_id] = is_changed
+            if self.store_in_prompt:
+                node["is_changed"] = is_changed
         return self.is_changed[node_id]
 
 
+def get_input_files(node) -> list[str] | None:
+    """
+    Returns the paths of the input directory files a built-in loader node reads and fingerprints in its IS_CHANGED,
+    or None for other nodes.
+    """
+    class_def = nodes.NODE_CLASS_MAPPINGS.get(node["class_type"])
+    if class_def is None or is_custom_node_class(class_def):
+        return None
+    schema = get_node_schema(class_def)
+    if schema.is_changed_name is None or ("directory", folder_paths.get_input_directory()) not in schema.dependencies:
+        return None
+    paths = []
+    for input_name, value in node["inputs"].items():
+        info = schema.inputs.get(input_name)
+        if not isinstance(value, str) or info is None or not isinstance(info.input_type, list) or value not in info.input_type:
+            continue
+        paths.append(folder_paths.get_annotated_filepath(value))
+    return paths
+
+
+class QueuedIsChangedCache(IsChangedCache):
+    """
+    IS_CHANGED values of a queued prompt for pinning its cache keys, computed without running node code. The
+    IS_CHANGED of a built-in loader fingerprints its input file, which get_input_files() finds and the fingerprint
+    cache has ready once the prompt was prepared. Nodes with any other IS_CHANGED are unpinnable, and so are their
+    descendants, whose keys depend on them.
+    """
+    def __init__(self, prompt_id: str, dynprompt: DynamicPrompt):
+        super().__init__(prompt_id, dynprompt, None, store_in_prompt=False)
+        self.unpinnable = set()
+
+    async def get(self, node_id):
+        if node_id in self.is_changed:
+            return self.is_changed[node_id]
+
+        node = self.dynprompt.get_node(node_id)
+        class_def = nodes.NODE_CLASS_MAPPINGS[node["class_type"]]
+        if get_node_schema(class_def).is_changed_name is None:
+            is_changed = False
+        elif "is_changed" in node:
+            is_changed = node["is_changed"]
+        else:
+            paths = [path for path in get_input_files(node) or [] if os.path.isfile(path)]
+            try:
+                if len(paths) != 1:
+                    raise ValueError("not a built-in loader")
+                is_changed = [folder_paths.get_file_fingerprint(paths[0])]
+            except (OSError, ValueError):
+                is_changed = float("NaN")
+                self.unpinnable.add(node_id)
+        self.is_changed[node_id] = is_changed
+        return is_changed
+
+
+async def prepare_prompt(prompt_id, prompt):
+    """
+    Fingerprints the files of the input directory a queued prompt's built-in loaders read, ahead of its execution.
+    No node code runs here, the IS_CHANGED functions of the execution find the fingerprints cached.
+    """
+    for node_id, node in prompt.items():
+        for path in get_input_files(node) or []:
+            try:
+                folder_paths.get_file_fingerprint(path)
+            except OSError as e:
+                logging.debug(f"Failed to fingerprint {path} of node {node_id} while preparing the prompt: {e}")
+
+
 class CacheType(Enum):
     CLASSIC = 0
     LRU = 1
@@ -95,7 +170,8 @@ class CacheType(Enum):
 
 
 class CacheSet:
-    def __init__(self, cache_type=None, cache_size=None):
+    def __init__(self, cache_type=None, cache_size=None, pin_prompts=0):
+        self.pins = None
         if cache_type == CacheType.DEPENDENCY_AWARE:
             self.init_dependency_aware_cache()
             logging.info("Disabling intermediate node cache.")
@@ -106,6 +182,10 @@ class CacheSet:
             logging.info("Using LRU cache")
         else:
             self.init_classic_cache()
+            if pin_prompts > 0:
+                self.pins = CachePins(pin_prompts)
+                self.outputs.pins = self.pins
+                self.ui.pins = self.pins
 
         self.all = [self.outputs, self.ui, self.objects]
 
@@ -135,22 +215,43 @@ class CacheSet:
 
 SENSITIVE_EXTRA_DATA_KEYS = ("auth_token_comfy_org", "api_key_comfy_org")
 
+def get_model_prefetch_budget():
+    return int(args.model_prefetch_budget * (1024 ** 3))
+
+def get_tensor_bytes(value, depth=0):
+    """Bytes of the tensors in a node input or output, looking into lists, tuples and dicts like latents."""
+    if isinstance(value, torch.Tensor):
+        return value.nbytes
+    if depth >= 3:
+        return 0
+    if isinstance(value, (list, tuple)):
+        return sum(get_tensor_bytes(x, depth + 1) for x in value)
+    if isinstance(value, dict):
+        return sum(get_tensor_bytes(x, depth + 1) for x in value.values())
+    return 0
+
+def get_node_input_bytes(dynprompt, outputs, unique_id):
+    total = 0
+    for value in dynprompt.get_node(unique_id)['inputs'].values():
+        if is_link(value):
+            output = outputs.get(value[0])
+            if output is not None and value[1] < len(output):
+                total += get_tensor_bytes(output[value[1]])
+    return total
+
 def get_input_data(inputs, class_def, unique_id, outputs=None, dynprompt=None, extra_data={}):
-    is_v3 = issubclass(class_def, _ComfyNodeInternal)
-    if is_v3:
-        valid_inputs, schema = class_def.INPUT_TYPES(include_hidden=False, return_schema=True)
-    else:
-        valid_inputs = class_def.INPUT_TYPES()
+    node_schema = get_node_schema(class_def)
+    is_v3 = node_schema.is_v3
     input_data_all = {}
     missing_keys = {}
     hidden_inputs_v3 = {}
     for x in inputs:
         input_data = inputs[x]
-        _, input_category, input_info = get_input_info(class_def, x, valid_inputs)
+        input_info = node_schema.get_input(x, include_hidden=not is_v3)
         def mark_missing():
             missing_keys[x] = True
             input_data_all[x] = (None,)
-        if is_link(input_data) and (not input_info or not input_info.get("rawLink", False)):
+        if is_link(input_data) and (input_info is None or not input_info.raw_link):
             input_unique_id = input_data[0]
             output_index = input_data[1]
             if outputs is None:
@@ -165,10 +266,11 @@ def get_input_data(inputs, class_def, unique_id, outputs=None, dynprompt=None, e
                 continue
             obj = cached_output[output_index]
             input_data_all[x] = obj
-        elif input_category is not None:
+        elif input_info is not None:
             input_data_all[x] = [input_data]
 
     if is_v3:
+        schema = node_schema.v3_schema
         if schema.hidden:
             if io.Hidden.prompt in schema.hidden:
                 hidden_inputs_v3[io.Hidden.prompt] = dynprompt.get_original_prompt() if dynprompt is not None else {}
@@ -183,8 +285,8 @@ def get_input_data(inputs, class_def, unique_id, outputs=None, dynprompt=None, e
             if io.Hidden.api_key_comfy_org in schema.hidden:
                 hidden_inputs_v3[io.Hidden.api_key_comfy_org] = extra_data.get("api_key_comfy_org", None)
     else:
-        if "hidden" in valid_inputs:
-            h = valid_inputs["hidden"]
+        if len(node_schema.hidden) > 0:
+            h = node_schema.hidden
             for x in h:
                 if h[x] == "PROMPT":
                     input_data_all[x] = [dynprompt.get_original_prompt() if dynprompt is not None else {}]
@@ -214,7 +316,15 @@ async def resolve_map_node_over_list_results(results):
                 raise exc
         return [x.result() if isinstance(x, asyncio.Task) else x for x in results]
 
-async def _async_map_node_over_list(prompt_id, unique_id, obj, input_data_all, func, allow_interrupt=False, execution_block_cb=None, pre_execute_cb=None, hidden_inputs=None):
+async def _run_in_thread_pool(thread_pool, f, prompt_id, unique_id, list_index, args):
+    def run():
+        # inference mode is per thread
+        with torch.inference_mode(), CurrentNodeContext(prompt_id, unique_id, list_index):
+            return f(**args)
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(thread_pool, context.run, run)
+
+async def _async_map_node_over_list(prompt_id, unique_id, obj, input_data_all, func, allow_interrupt=False, execution_block_cb=None, pre_execute_cb=None, hidden_inputs=None, thread_pool=None):
     # check if node wants the lists
     input_is_list = getattr(obj, "INPUT_IS_LIST", False)
 
@@ -272,6 +382,9 @@ async def _async_map_node_over_list(prompt_id, unique_id, obj, input_data_all, f
                     results.append(result)
                 else:
                     results.append(task)
+            elif thread_pool is not None:
+                # Completes like an async node, the results are collected once the node is ready again
+                results.append(asyncio.create_task(_run_in_thread_pool(thread_pool, f, prompt_id, unique_id, index, inputs)))
             else:
                 with CurrentNodeContext(prompt_id, unique_id, index):
                     result = f(**inputs)
@@ -311,8 +424,8 @@ def merge_result_data(results, obj):
             output.append([o[i] for o in results])
     return output
 
-async def get_output_data(prompt_id, unique_id, obj, input_data_all, execution_block_cb=None, pre_execute_cb=None, hidden_inputs=None):
-    return_values = await _async_map_node_over_list(prompt_id, unique_id, obj, input_data_all, obj.FUNCTION, allow_interrupt=True, execution_block_cb=execution_block_cb, pre_execute_cb=pre_execute_cb, hidden_inputs=hidden_inputs)
+async def get_output_data(prompt_id, unique_id, obj, input_data_all, execution_block_cb=None, pre_execute_cb=None, hidden_inputs=None, thread_pool=None):
+    return_values = await _async_map_node_over_list(prompt_id, unique_id, obj, input_data_all, obj.FUNCTION, allow_interrupt=True, execution_block_cb=execution_block_cb, pre_execute_cb=pre_execute_cb, hidden_inputs=hidden_inputs, thread_pool=thread_pool)
     has_pending_task = any(isinstance(r, asyncio.Task) and not r.done() for r in return_values)
     if has_pending_task:
         return return_values, {}, False, has_pending_task
@@ -493,16 +606,31 @@ async def execute(server, dynprompt, caches, current_item, extra_data, executed,
             def pre_execute_cb(call_index):
                 # TODO - How to handle this with async functions without contextvars (which requires Python 3.12)?
                 GraphBuilder.set_default_prefix(unique_id, call_index, 0)
-            output_data, output_ui, has_subgraph, has_pending_tasks = await get_output_data(prompt_id, unique_id, obj, input_data_all, execution_block_cb=execution_block_cb, pre_execute_cb=pre_execute_cb, hidden_inputs=hidden_inputs)
+            resources = execution_list.resources
+            node_resources = get_node_schema(class_def).resources
+            thread_pool = None
+            if resources is not None and resources.runs_concurrently(node_resources):
+                thread_pool = resources.thread_pool
+                resources.acquire(node_resources)
+            try:
+                output_data, output_ui, has_subgraph, has_pending_tasks = await get_output_data(prompt_id, unique_id, obj, input_data_all, execution_block_cb=execution_block_cb, pre_execute_cb=pre_execute_cb, hidden_inputs=hidden_inputs, thread_pool=thread_pool)
+            except BaseException:
+                if thread_pool is not None:
+                    resources.release(node_resources)
+                raise
             if has_pending_tasks:
                 pending_async_nodes[unique_id] = output_data
                 unblock = execution_list.add_external_block(unique_id)
+                tasks = [x for x in output_data if isinstance(x, asyncio.Task)]
+                if thread_pool is not None:
+                    resources.release_when_done(node_resources, tasks)
                 async def await_completion():
-                    tasks = [x for x in output_data if isinstance(x, asyncio.Task)]
                     await asyncio.gather(*tasks, return_exceptions=True)
                     unblock()
                 asyncio.create_task(await_completion())
                 return (ExecutionResult.PENDING, None, None)
+            elif thread_pool is not None:
+                resources.release(node_resources)
         if len(output_ui) > 0:
             caches.ui.set(unique_id, {
                 "meta": {
@@ -601,10 +729,12 @@ class PromptExecutor:
         self.cache_size = cache_size
         self.cache_type = cache_type
         self.server = server
+        self.resources = ExecutionResources(args.concurrent_nodes) if args.concurrent_nodes > 0 else None
+        self.prefetcher = None
         self.reset()
 
     def reset(self):
-        self.caches = CacheSet(cache_type=self.cache_type, cache_size=self.cache_size)
+        self.caches = CacheSet(cache_type=self.cache_type, cache_size=self.cache_size, pin_prompts=args.cache_pin_prompts)
         self.status_messages = []
         self.success = True
 
@@ -617,6 +747,29 @@ class PromptExecutor:
         if self.server.client_id is not None or broadcast:
             self.server.send_sync(event, data, self.server.client_id)
 
+    async def pin_queued_prompts(self):
+        """
+        Pins the cache keys of the next queued prompts, computed once per prompt without running their IS_CHANGED
+        (QueuedIsChangedCache).
+        """
+        pins = self.caches.pins
+        queued = self.server.prompt_queue.get_current_queue()[1]
+        queued = sorted(queued)[:pins.max_prompts]
+        pins.unpin_queued(set(item.prompt_id for item in queued))
+        for item in queued:
+            if item.prompt_id in pins.prompt_keys:
+                continue
+            dynprompt = DynamicPrompt(item.prompt)
+            is_changed_cache = QueuedIsChangedCache(item.prompt_id, dynprompt)
+            key_set = CacheKeySetInputSignature(dynprompt, item.prompt.keys(), is_changed_cache)
+            await key_set.add_keys(item.prompt.keys())
+            keys = []
+            for node_id, key in key_set.keys.items():
+                ancestors, _ = key_set.get_ordered_ancestry(dynprompt, node_id)
+                if is_changed_cache.unpinnable.isdisjoint([node_id, *ancestors]):
+                    keys.append(key)
+            pins.pin_queued(item.prompt_id, itertools.chain(keys, key_set.get_used_subcache_keys()))
+
     def handle_execution_error(self, prompt_id, prompt, current_outputs, executed, error, ex):
         node_id = error["node_id"]
         class_type = prompt[node_id]["class_type"]
@@ -650,6 +803,7 @@ class PromptExecutor:
 
     async def execute_async(self, prompt, prompt_id, extra_data={}, execute_outputs=[]):
         nodes.interrupt_processing(False)
+        node_schemas.refresh()
 
         if "client_id" in extra_data:
             self.server.client_id = extra_data["client_id"]
@@ -659,6 +813,25 @@ class PromptExecutor:
         self.status_messages = []
         self.add_message("execution_start", { "prompt_id": prompt_id}, broadcast=False)
 
+        trace = None if args.disable_tracing else comfy.tracing.Trace(prompt_id)
+        trace_token = comfy.tracing.set_current_trace(trace)
+        snapshots = comfy.sampling_cache.get_snapshots()
+        if snapshots is not None:
+            snapshots.begin_prompt(prompt_id, prompt, {k: v for k, v in extra_data.items() if k not in SENSITIVE_EXTRA_DATA_KEYS}, execute_outputs)
+        try:
+            await self._execute_prompt(prompt, prompt_id, extra_data, execute_outputs, trace)
+        finally:
+            if snapshots is not None:
+                snapshots.end_prompt()
+            folder_paths.save_counter_index.release_markers()
+            if self.prefetcher is not None:
+                self.prefetcher.cancel()
+                self.prefetcher = None
+            comfy.tracing.reset_current_trace(trace_token)
+            if trace is not None:
+                comfy.tracing.finish_trace(trace, "success" if self.success else "error", args.trace_directory)
+
+    async def _execute_prompt(self, prompt, prompt_id, extra_data, execute_outputs, trace):
         with torch.inference_mode():
             dynamic_prompt = DynamicPrompt(prompt)
             reset_progress_state(prompt_id, dynamic_prompt)
@@ -666,6 +839,11 @@ class PromptExecutor:
             is_changed_cache = IsChangedCache(prompt_id, dynamic_prompt, self.caches.outputs)
             for cache in self.caches.all:
                 await cache.set_prompt(dynamic_prompt, prompt.keys(), is_changed_cache)
+            if self.caches.pins is not None:
+                key_set = self.caches.outputs.cache_key_set
+                self.caches.pins.pin_executed(prompt_id, itertools.chain(key_set.get_used_keys(), key_set.get_used_subcache_keys()))
+                await self.pin_queued_prompts()
+            for cache in self.caches.all:
                 cache.clean_unused()
 
             cached_nodes = []
@@ -680,11 +858,16 @@ class PromptExecutor:
             pending_subgraph_results = {}
             pending_async_nodes = {} # TODO - Unify this with pending_subgraph_results
             executed = set()
-            execution_list = ExecutionList(dynamic_prompt, self.caches.outputs)
+            execution_list = ExecutionList(dynamic_prompt, self.caches.outputs, self.resources)
             current_outputs = self.caches.outputs.all_node_ids()
             for node_id in list(execute_outputs):
                 execution_list.add_node(node_id)
 
+            budget = get_model_prefetch_budget()
+            if budget > 0:
+                self.prefetcher = ModelPrefetcher(get_model_files(dynamic_prompt, execution_list.get_pending_order()), budget, comfy.model_management.processing_interrupted)
+                self.prefetcher.start()
+
             while not execution_list.is_empty():
                 node_id, error, ex = await execution_list.stage_node_execution()
                 if error is not None:
@@ -692,7 +875,18 @@ class PromptExecutor:
                     break
 
                 assert node_id is not None, "Node ID should not be None at this point"
+                if self.prefetcher is not None:
+                    self.prefetcher.node_started(node_id)
+                if trace is not None:
+                    start_ns, start_cpu_ns = time.perf_counter_ns(), time.thread_time_ns()
+                    cached = self.caches.outputs.get(node_id) is not None
                 result, error, ex = await execute(self.server, dynamic_prompt, self.caches, node_id, extra_data, executed, prompt_id, execution_list, pending_subgraph_results, pending_async_nodes)
+                if trace is not None:
+                    output_bytes = 0
+                    if result == ExecutionResult.SUCCESS and not cached:
+                        output_bytes = get_tensor_bytes(self.caches.outputs.get(node_id))
+                    comfy.tracing.record_node(trace, node_id, dynamic_prompt.get_node(node_id)['class_type'], start_ns, start_cpu_ns, cached, result.name.lower(),
+                                              0 if cached else get_node_input_bytes(dynamic_prompt, self.caches.outputs, node_id), output_bytes)
                 self.success = result != ExecutionResult.FAILURE
                 if result == ExecutionResult.FAILURE:
                     self.handle_execution_error(prompt_id, dynamic_prompt.original_prompt, current_outputs, executed, error, ex)
@@ -704,6 +898,8 @@ class PromptExecutor:
             else:
                 # Only execute when the while-loop ends without break
                 self.add_message("execution_success", { "prompt_id": prompt_id }, broadcast=False)
+            if self.resources is not None:
+                await self.resources.wait()
 
             ui_outputs = {}
             meta_outputs = {}
@@ -731,29 +927,18 @@ async def validate_inputs(prompt_id, prompt, item, validated):
     class_type = prompt[unique_id]['class_type']
     obj_class = nodes.NODE_CLASS_MAPPINGS[class_type]
 
-    class_inputs = obj_class.INPUT_TYPES()
-    valid_inputs = set(class_inputs.get('required',{})).union(set(class_inputs.get('optional',{})))
+    node_schema = get_node_schema(obj_class)
 
     errors = []
     valid = True
 
-    validate_function_inputs = []
-    validate_has_kwargs = False
-    if issubclass(obj_class, _ComfyNodeInternal):
-        validate_function_name = "validate_inputs"
-        validate_function = first_real_override(obj_class, validate_function_name)
-    else:
-        validate_function_name = "VALIDATE_INPUTS"
-        validate_function = getattr(obj_class, validate_function_name, None)
-    if validate_function is not None:
-        argspec = inspect.getfullargspec(validate_function)
-        validate_function_inputs = argspec.args
-        validate_has_kwargs = argspec.varkw is not None
+    validate_function_name = node_schema.validate_function_name
+    validate_function_inputs = node_schema.validate_function_inputs
+    validate_has_kwargs = node_schema.validate_has_kwargs
     received_types = {}
 
-    for x in valid_inputs:
-        input_type, input_category, extra_info = get_input_info(obj_class, x, class_inputs)
-        assert extra_info is not None
+    for x in node_schema.valid_inputs:
+        input_type, input_category, extra_info, _, _ = node_schema.inputs[x]
         if x not in inputs:
             if input_category == "required":
                 error = {
@@ -895,6 +1080,11 @@ async def validate_inputs(prompt_id, prompt, item, validated):
 
                 if isinstance(input_type, list):
                     combo_options = input_type
+                    if val not in combo_options and (len(node_schema.dependencies) > 0 or node_schema.is_custom_node):
+                        # the file list may predate a file that was just added, like an upload
+                        rebuilt = node_schemas.rebuild(obj_class).inputs.get(x)
+                        if rebuilt is not None and isinstance(rebuilt.input_type, list):
+                            combo_options = rebuilt.input_type
                     if val not in combo_options:
                         input_config = info
                         list_info = ""
@@ -963,7 +1153,11 @@ def full_type_name(klass):
         return klass.__qualname__
     return module + '.' + klass.__qualname__
 
-async def validate_prompt(prompt_id, prompt, partial_execution_list: Union[list[str], None]):
+async def validate_prompt(prompt_id, prompt, partial_execution_list: Union[list[str], None], validated: Optional[dict] = None):
+    """
+    validated holds the validate_inputs() results of the nodes that are already known, it's filled with the
+    results of the other ones.
+    """
     outputs = set()
     for x in prompt:
         if 'class_type' not in prompt[x]:
@@ -1002,7 +1196,8 @@ async def validate_prompt(prompt_id, prompt, partial_execution_list: Union[list[
     good_outputs = set()
     errors = []
     node_errors = {}
-    validated = {}
+    if validated is None:
+        validated = {}
     for o in outputs:
         valid = False
         reasons = []
@@ -1074,6 +1269,23 @@ async def validate_prompt(prompt_id, prompt, partial_execution_list: Union[list[
 
 MAXIMUM_HISTORY_SIZE = 10000
 
+class QueueItem(NamedTuple):
+    """
+    A queued prompt. The same instance is referenced by the queue, the executing prompt and the history instead of
+    copies, so neither the item nor the prompt and extra_data it holds may be modified once it is queued.
+    """
+    number: float
+    prompt_id: str
+    prompt: dict
+    extra_data: dict
+    outputs_to_execute: list
+
+    def without_sensitive_data(self) -> 'QueueItem':
+        """Returns the item without the extra_data keys that must not leave the executing prompt."""
+        if not any(key in self.extra_data for key in SENSITIVE_EXTRA_DATA_KEYS):
+            return self
+        return self._replace(extra_data={k: v for k, v in self.extra_data.items() if k not in SENSITIVE_EXTRA_DATA_KEYS})
+
 class PromptQueue:
     def __init__(self, server):
         self.server = server
@@ -1082,10 +1294,12 @@ class PromptQueue:
         self.task_counter = 0
         self.queue = []
         self.currently_running = {}
-        self.history = {}
+        self.history = HistoryStore(MAXIMUM_HISTORY_SIZE, args.history_memory_items)
         self.flags = {}
 
     def put(self, item):
+        if not isinstance(item, QueueItem):
+            item = QueueItem(*item)
         with self.mutex:
             heapq.heappush(self.queue, item)
             self.server.queue_updated()
@@ -1099,11 +1313,18 @@ class PromptQueue:
                     return None
             item = heapq.heappop(self.queue)
             i = self.task_counter
-            self.currently_running[i] = copy.deepcopy(item)
+            self.currently_running[i] = item
             self.task_counter += 1
             self.server.queue_updated()
             return (item, i)
 
+    def peek(self) -> Optional[QueueItem]:
+        """Returns the item get() would return next, without removing it."""
+        with self.mutex:
+            if len(self.queue) == 0:
+                return None
+            return self.queue[0]
+
     class ExecutionStatus(NamedTuple):
         status_str: Literal['success', 'error']
         completed: bool
@@ -1112,41 +1333,30 @@ class PromptQueue:
     def task_done(self, item_id, history_result,
                   status: Optional['PromptQueue.ExecutionStatus']):
         with self.mutex:
-            prompt = self.currently_running.pop(item_id)
-            if len(self.history) > MAXIMUM_HISTORY_SIZE:
-                self.history.pop(next(iter(self.history)))
+            prompt = self.currently_running.pop(item_id).without_sensitive_data()
 
             status_dict: Optional[dict] = None
             if status is not None:
                 status_dict = copy.deepcopy(status._asdict())
 
-            # Remove sensitive data from extra_data before storing in history
-            for sensitive_val in SENSITIVE_EXTRA_DATA_KEYS:
-                if sensitive_val in prompt[3]:
-                    prompt[3].pop(sensitive_val)
-
-            self.history[prompt[1]] = {
+            entry = {
                 "prompt": prompt,
                 "outputs": {},
                 'status': status_dict,
             }
-            self.history[prompt[1]].update(history_result)
+            entry.update(history_result)
+            self.history.put(prompt[1], entry)
             self.server.queue_updated()
 
-    # Note: slow
     def get_current_queue(self):
         with self.mutex:
-            out = []
-            for x in self.currently_running.values():
-                out += [x]
-            return (out, copy.deepcopy(self.queue))
+            running = [x.without_sensitive_data() for x in self.currently_running.values()]
+            queued = [x.without_sensitive_data() for x in self.queue]
+            return (running, queued)
 
-    # read-safe as long as queue items are immutable
+    # kept for compatibility, queue items are immutable and get_current_queue doesn't copy them either
     def get_current_queue_volatile(self):
-        with self.mutex:
-            running = [x for x in self.currently_running.values()]
-            queued = copy.copy(self.queue)
-            return (running, queued)
+        return self.get_current_queue()
 
     def get_tasks_remaining(self):
         with self.mutex:
@@ -1170,40 +1380,29 @@ class PromptQueue:
                     return True
         return False
 
-    def get_history(self, prompt_id=None, max_items=None, offset=-1, map_function=None):
+    def get_history(self, prompt_id=None, max_items=None, offset=-1, map_function=None, status=None, since=None, until=None):
+        """
+        Returns the history entries by prompt id, oldest first. Entries are shared and must not be modified.
+        status ('success' or 'error') and since/until (the time the prompt finished, in ms) filter the entries
+        the max_items and offset pagination applies to.
+        """
         with self.mutex:
             if prompt_id is None:
-                out = {}
-                i = 0
-                if offset < 0 and max_items is not None:
-                    offset = len(self.history) - max_items
-                for k in self.history:
-                    if i >= offset:
-                        p = self.history[k]
-                        if map_function is not None:
-                            p = map_function(p)
-                        out[k] = p
-                        if max_items is not None and len(out) >= max_items:
-                            break
-                    i += 1
-                return out
-            elif prompt_id in self.history:
-                p = self.history[prompt_id]
-                if map_function is None:
-                    p = copy.deepcopy(p)
-                else:
-                    p = map_function(p)
-                return {prompt_id: p}
-            else:
+                return self.history.query(max_items=max_items, offset=offset, history_filter=HistoryFilter(status, since, until), map_function=map_function)
+            p = self.history.get(prompt_id)
+            if p is None:
                 return {}
+            if map_function is not None:
+                p = map_function(p)
+            return {prompt_id: p}
 
     def wipe_history(self):
         with self.mutex:
-            self.history = {}
+            self.history.clear()
 
     def delete_history_item(self, id_to_delete):
         with self.mutex:
-            self.history.pop(id_to_delete, None)
+            self.history.delete(id_to_delete)
 
     def set_flag(self, name, data):
         with self.mutex:
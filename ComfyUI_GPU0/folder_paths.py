@@ -2,12 +2,17 @@ from __future__ import annotations
 
 import os
 import time
+import contextlib
+import contextvars
 import mimetypes
 import logging
+import threading
 from typing import Literal, List
 from collections.abc import Collection
 
 from comfy.cli_args import args
+from app.file_index import FileIndex, get_watcher
+from app.file_fingerprint import FingerprintCache
 
 supported_pt_extensions: set[str] = {'.ckpt', '.pt', '.pt2', '.bin', '.pth', '.safetensors', '.pkl', '.sft'}
 
@@ -57,6 +62,9 @@ user_directory = os.path.join(base_path, "user")
 
 filename_list_cache: dict[str, tuple[list[str], dict[str, float], float]] = {}
 
+file_indexes: dict[str, FileIndex] = {}
+file_indexes_lock = threading.Lock()
+
 class CacheHelper:
     """
     Helper class for managing file list cache data.
@@ -92,6 +100,33 @@ extension_mimetypes_cache = {
     "fbx" : "model",
 }
 
+_dependencies: contextvars.ContextVar[set[tuple[str, str]] | None] = contextvars.ContextVar("folder_paths_dependencies", default=None)
+
+@contextlib.contextmanager
+def record_dependencies():
+    """
+    Collects the model folders and directories that are listed or looked up inside the block, like the ones the
+    INPUT_TYPES of a node reads its options from. get_dependency_version() tells when one of them changes.
+    """
+    dependencies = set()
+    token = _dependencies.set(dependencies)
+    try:
+        yield dependencies
+    finally:
+        _dependencies.reset(token)
+
+def record_dependency(kind: Literal["folder", "directory"], name: str) -> None:
+    dependencies = _dependencies.get()
+    if dependencies is not None:
+        dependencies.add((kind, name))
+
+def get_dependency_version(dependency: tuple[str, str]) -> tuple:
+    kind, name = dependency
+    if kind == "folder":
+        paths = folder_names_and_paths[name][0] if name in folder_names_and_paths else []
+        return tuple((x, get_file_index(x).get_version()) for x in paths)
+    return (name, get_file_index(name).get_version())
+
 def map_legacy(folder_name: str) -> str:
     legacy = {"unet": "diffusion_models",
               "clip": "text_encoders"}
@@ -117,14 +152,17 @@ def set_input_directory(input_dir: str) -> None:
 
 def get_output_directory() -> str:
     global output_directory
+    record_dependency("directory", output_directory)
     return output_directory
 
 def get_temp_directory() -> str:
     global temp_directory
+    record_dependency("directory", temp_directory)
     return temp_directory
 
 def get_input_directory() -> str:
     global input_directory
+    record_dependency("directory", input_directory)
     return input_directory
 
 def get_user_directory() -> str:
@@ -231,6 +269,7 @@ def add_model_folder_path(folder_name: str, full_folder_path: str, is_default: b
 
 def get_folder_paths(folder_name: str) -> list[str]:
     folder_name = map_legacy(folder_name)
+    record_dependency("folder", folder_name)
     return folder_names_and_paths[folder_name][0][:]
 
 def recursive_search(directory: str, excluded_dir_names: list[str] | None=None) -> tuple[list[str], dict[str, float]]:
@@ -309,16 +348,63 @@ def get_full_path_or_raise(folder_name: str, filename: str) -> str:
     return full_path
 
 
+def get_file_index(directory: str) -> FileIndex:
+    """
+    Returns the shared index of the files below directory, it's kept up to date incrementally instead of walking
+    the directory for every listing.
+    """
+    with file_indexes_lock:
+        index = file_indexes.get(directory)
+        if index is None:
+            index = FileIndex(directory, lambda d: recursive_search(d, excluded_dir_names=[".git"]), excluded_dir_names=[".git"], watcher=get_watcher(args.file_index_poll_interval))
+            file_indexes[directory] = index
+        return index
+
+file_fingerprints = FingerprintCache(4096, fast=args.fast_file_fingerprints)
+
+def get_file_fingerprint(file_path: str) -> str:
+    """
+    Returns a hash of the file's content for IS_CHANGED. It's only computed again when the file's size, mtime or
+    inode changed.
+    """
+    return file_fingerprints.get(file_path)
+
+def mark_file_changed(file_path: str, data: bytes | None = None) -> None:
+    """
+    Tells the indexes containing file_path that it was just written or removed, so the next listing doesn't have to
+    wait for the change to be noticed. data is the content that was written, it's fingerprinted right away.
+    """
+    if data is not None:
+        try:
+            file_fingerprints.put_data(file_path, data)
+        except OSError:
+            file_fingerprints.invalidate(file_path)
+    else:
+        file_fingerprints.invalidate(file_path)
+    directory = os.path.dirname(os.path.abspath(file_path))
+    with file_indexes_lock:
+        indexes = list(file_indexes.values())
+    for index in indexes:
+        root = os.path.abspath(index.root)
+        if os.path.commonpath((root, directory)) != root:
+            continue
+        relative = os.path.relpath(directory, root)
+        parts = [] if relative == "." else relative.split(os.sep)
+        # a new subdirectory is only found by listing its parent
+        for i in range(len(parts) + 1):
+            index.mark_dirty(os.path.join(index.root, *parts[:i]))
+
 def get_filename_list_(folder_name: str) -> tuple[list[str], dict[str, float], float]:
     folder_name = map_legacy(folder_name)
     global folder_names_and_paths
     output_list = set()
     folders = folder_names_and_paths[folder_name]
+    # the index version of each folder the list was built from
     output_folders = {}
     for x in folders[0]:
-        files, folders_all = recursive_search(x, excluded_dir_names=[".git"])
-        output_list.update(filter_files_extensions(files, folders[1]))
-        output_folders = {**output_folders, **folders_all}
+        index = get_file_index(x)
+        output_folders[x] = index.get_version()
+        output_list.update(index.list_files(folders[1]))
 
     return sorted(list(output_list)), output_folders, time.perf_counter()
 
@@ -334,22 +420,18 @@ def cached_filename_list_(folder_name: str) -> tuple[list[str], dict[str, float]
         return None
     out = filename_list_cache[folder_name]
 
-    for x in out[1]:
-        time_modified = out[1][x]
-        folder = x
-        if os.path.getmtime(folder) != time_modified:
-            return None
-
     folders = folder_names_and_paths[folder_name]
+    if len(out[1]) != len(folders[0]):
+        return None
     for x in folders[0]:
-        if os.path.isdir(x):
-            if x not in out[1]:
-                return None
+        if out[1].get(x) != get_file_index(x).get_version():
+            return None
 
     return out
 
 def get_filename_list(folder_name: str) -> list[str]:
     folder_name = map_legacy(folder_name)
+    record_dependency("folder", folder_name)
     out = cached_filename_list_(folder_name)
     if out is None:
         out = get_filename_list_(folder_name)
@@ -358,16 +440,180 @@ def get_filename_list(folder_name: str) -> list[str]:
     cache_helper.set(folder_name, out)
     return list(out[0])
 
-def get_save_image_path(filename_prefix: str, output_dir: str, image_width=0, image_height=0) -> tuple[str, str, int, str, str]:
-    def map_filename(filename: str) -> tuple[int, str]:
-        prefix_len = len(os.path.basename(filename_prefix))
-        prefix = filename[:prefix_len + 1]
+class SaveCounterIndex:
+    """
+    Index of the next free counter per (output folder, filename prefix) for get_save_image_path.
+
+    A prefix is scanned once and the counter handed out last is kept in memory along with the filename suffixes seen
+    for the prefix. On the next call the files written since are found by probing the names from that counter on
+    with the known suffixes, the folder is only scanned again when the last counter wasn't used with any of them.
+    Outputs that are still being written exist as .tmp files (comfy_execution.output_writer), which the probes
+    count.
+
+    A counter is reserved by creating a `<prefix>_<counter>_.lock` marker with O_EXCL, an instance sharing the output
+    folder that races for the same counter fails to create it and moves on to the next one. The marker is kept until
+    the output writer renamed the files of the counter into place (begin_write/end_write), markers of savers that
+    write their files themselves are removed by release_markers() once the prompt is done.
+    """
+    MAX_SUFFIXES = 8
+    MARKER_SUFFIX = "_.lock"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (folder, normcase(prefix)) -> [counter handed out last, suffixes]
+        self.entries: dict[tuple[str, str], list] = {}
+        # markers created by this instance -> writes of the output writer still using them
+        self.markers: dict[str, int] = {}
+
+    def scan(self, folder: str, prefix: str) -> tuple[int, set[str]]:
+        prefix_len = len(prefix)
+        key = os.path.normcase(prefix) + "_"
+        counter = 0
+        suffixes = set()
+        for name in os.listdir(folder):
+            if os.path.normcase(name[:prefix_len + 1]) != key:
+                continue
+            digits = name[prefix_len + 1:].split('_')[0]
+            try:
+                counter = max(counter, int(digits))
+            except ValueError:
+                continue
+            suffix = name[prefix_len + 1 + len(digits):]
+            if suffix == self.MARKER_SUFFIX:
+                continue
+            if suffix.endswith(".tmp"):
+                suffix = suffix[:-len(".tmp")]
+            if len(suffixes) < self.MAX_SUFFIXES:
+                suffixes.add(suffix)
+        return counter + 1, suffixes
+
+    @classmethod
+    def marker_path(cls, folder: str, prefix: str, counter: int) -> str:
+        return os.path.join(folder, f"{prefix}_{counter:05}{cls.MARKER_SUFFIX}")
+
+    @staticmethod
+    def probe(folder: str, prefix: str, counter: int, suffixes: set[str]) -> bool:
+        for suffix in suffixes:
+            name = os.path.join(folder, f"{prefix}_{counter:05}{suffix}")
+            # .tmp files are outputs still being written by comfy_execution.output_writer
+            if os.path.exists(name) or os.path.exists(name + ".tmp"):
+                return True
+        return False
+
+    def is_taken(self, folder: str, prefix: str, counter: int, suffixes: set[str]) -> bool:
+        return os.path.exists(self.marker_path(folder, prefix, counter)) or self.probe(folder, prefix, counter, suffixes)
+
+    def get_counter(self, folder: str, prefix: str) -> int:
+        key = (folder, os.path.normcase(prefix))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if self.probe(folder, prefix, entry[0], entry[1]):
+                    entry[0] += 1
+                    while self.is_taken(folder, prefix, entry[0], entry[1]):
+                        entry[0] += 1
+                else:
+                    # nothing was written with the last counter, or with a suffix that isn't known yet
+                    entry = None
+            if entry is None:
+                entry = list(self.scan(folder, prefix))
+                self.entries[key] = entry
+            while not self.reserve(folder, prefix, entry[0]):
+                # reserved by another instance in between
+                entry[0] += 1
+                while self.is_taken(folder, prefix, entry[0], entry[1]):
+                    entry[0] += 1
+            return entry[0]
+
+    def reserve(self, folder: str, prefix: str, counter: int) -> bool:
+        path = self.marker_path(folder, prefix, counter)
         try:
-            digits = int(filename[prefix_len + 1:].split('_')[0])
-        except:
-            digits = 0
-        return digits, prefix
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return False
+        except OSError as e:
+            # the counter is handed out unreserved where no marker can be created
+            logging.debug(f"Could not reserve {path}: {e}")
+            return True
+        self.markers[path] = 0
+        return True
+
+    def begin_write(self, path: str) -> str | None:
+        """Keeps the marker of the counter in the name of path until end_write(), returns the marker."""
+        folder, name = os.path.split(path)
+        with self.lock:
+            for marker, writes in self.markers.items():
+                if os.path.dirname(marker) == folder and name.startswith(os.path.basename(marker)[:-len(".lock")]):
+                    self.markers[marker] = writes + 1
+                    return marker
+        return None
+
+    def end_write(self, marker: str | None):
+        if marker is None:
+            return
+        with self.lock:
+            writes = self.markers.get(marker)
+            if writes is None:
+                return
+            if writes > 1:
+                self.markers[marker] = writes - 1
+            else:
+                self.remove_marker(marker)
+
+    def release_markers(self):
+        """Removes the markers that no pending write of the output writer uses."""
+        with self.lock:
+            for marker, writes in list(self.markers.items()):
+                if writes == 0:
+                    self.remove_marker(marker)
+
+    def remove_marker(self, marker: str):
+        self.markers.pop(marker, None)
+        try:
+            os.remove(marker)
+        except OSError:
+            pass
+
+    def clear(self):
+        self.release_markers()
+        with self.lock:
+            self.entries.clear()
+
 
+save_counter_index = SaveCounterIndex()
+
+# markers of a running instance are kept while its prompt runs, only ones older than this are considered left over
+STALE_MARKER_AGE = 3600
+
+
+def remove_stale_output_files(directory: str, before: float) -> int:
+    """
+    Removes the .tmp files and counter reservation markers that an instance which stopped while saving left in
+    directory, they'd keep their counters taken forever. Only files last modified before `before` (the start of
+    this process) are removed, markers need to be STALE_MARKER_AGE seconds older. Returns the number of files removed.
+    """
+    removed = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith(".tmp"):
+                limit = before
+            elif name.endswith(SaveCounterIndex.MARKER_SUFFIX):
+                limit = before - STALE_MARKER_AGE
+            else:
+                continue
+            path = os.path.join(root, name)
+            try:
+                if os.path.getmtime(path) < limit:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+    if removed > 0:
+        logging.info(f"Removed {removed} unfinished files from {directory}")
+    return removed
+
+
+def get_save_image_path(filename_prefix: str, output_dir: str, image_width=0, image_height=0) -> tuple[str, str, int, str, str]:
     def compute_vars(input: str, image_width: int, image_height: int) -> str:
         input = input.replace("%width%", str(image_width))
         input = input.replace("%height%", str(image_height))
@@ -396,13 +642,8 @@ def get_save_image_path(filename_prefix: str, output_dir: str, image_width=0, im
         logging.error(err)
         raise Exception(err)
 
-    try:
-        counter = max(filter(lambda a: os.path.normcase(a[1][:-1]) == os.path.normcase(filename) and a[1][-1] == "_", map(map_filename, os.listdir(full_output_folder))))[0] + 1
-    except ValueError:
-        counter = 1
-    except FileNotFoundError:
-        os.makedirs(full_output_folder, exist_ok=True)
-        counter = 1
+    os.makedirs(full_output_folder, exist_ok=True)
+    counter = save_counter_index.get_counter(full_output_folder, filename)
     return full_output_folder, filename, counter, subfolder, filename_prefix
 
 def get_input_subfolders() -> list[str]:
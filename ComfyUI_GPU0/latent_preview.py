@@ -25,7 +25,7 @@ class LatentPreviewer:
 
     def decode_latent_to_preview_image(self, preview_format, x0):
         preview_image = self.decode_latent_to_preview(x0)
-        return ("JPEG", preview_image, MAX_PREVIEW_RESOLUTION)
+        return (preview_format, preview_image, MAX_PREVIEW_RESOLUTION)
 
 class TAESDPreviewerImpl(LatentPreviewer):
     def __init__(self, taesd):
@@ -89,8 +89,8 @@ def get_previewer(device, latent_format):
     return previewer
 
 def prepare_callback(model, steps, x0_output_dict=None):
-    preview_format = "JPEG"
-    if preview_format not in ["JPEG", "PNG"]:
+    preview_format = args.preview_format
+    if preview_format not in ["JPEG", "PNG", "WEBP"]:
         preview_format = "JPEG"
 
     previewer = get_previewer(model.load_device, model.model.latent_format)
@@ -106,6 +106,7 @@ execute_prestartup_script()
 
 # Main code
 import asyncio
+import functools
 import shutil
 import threading
 import gc
@@ -147,9 +148,12 @@ import comfy.utils
 
 import execution
 import server
+from comfy_execution import output_writer
+from comfy_execution.pipeline import PromptPreparer
 from protocol import BinaryEventTypes
 import nodes
 import comfy.model_management
+import comfy.sampling_cache
 import comfyui_version
 import app.logger
 import hook_breaker_ac10a0
@@ -166,6 +170,18 @@ def cuda_malloc_warning():
             logging.warning("\nWARNING: this card most likely does not support cuda-malloc, if you get \"CUDA error\" please run ComfyUI with: --disable-cuda-malloc\n")
 
 
+def prompt_done(q, item_id, prompt_id, history_result, success, status_messages, write_errors):
+    if len(write_errors) > 0:
+        success = False
+        status_messages = status_messages + [("output_write_error", {"prompt_id": prompt_id, "errors": write_errors, "timestamp": int(time.time() * 1000)})]
+    q.task_done(item_id,
+                history_result,
+                status=execution.PromptQueue.ExecutionStatus(
+                    status_str='success' if success else 'error',
+                    completed=success,
+                    messages=status_messages))
+
+
 def prompt_worker(q, server_instance):
     current_time: float = 0.0
     cache_type = execution.CacheType.CLASSIC
@@ -175,6 +191,7 @@ def prompt_worker(q, server_instance):
         cache_type = execution.CacheType.DEPENDENCY_AWARE
 
     e = execution.PromptExecutor(server_instance, cache_type=cache_type, cache_size=args.cache_lru)
+    preparer = PromptPreparer(execution.prepare_prompt) if args.pipeline_prompts else None
     last_gc_collect = 0
     need_gc = False
     gc_collect_interval = 10.0
@@ -191,14 +208,15 @@ def prompt_worker(q, server_instance):
             prompt_id = item[1]
             server_instance.last_prompt_id = prompt_id
 
+            if preparer is not None:
+                preparer.wait(prompt_id)
+                preparer.prepare_next(q)
             e.execute(item[2], prompt_id, item[3], item[4])
             need_gc = True
-            q.task_done(item_id,
-                        e.history_result,
-                        status=execution.PromptQueue.ExecutionStatus(
-                            status_str='success' if e.success else 'error',
-                            completed=e.success,
-                            messages=e.status_messages))
+            # the prompt only goes to the history once the files of its save nodes are written, in queue order, the
+            # next prompt can start in the meantime
+            output_writer.get_writer().on_prompt_written(prompt_id, functools.partial(
+                prompt_done, q, item_id, prompt_id, e.history_result, e.success, e.status_messages))
             if server_instance.client_id is not None:
                 server_instance.send_sync("executing", {"node": None, "prompt_id": prompt_id}, server_instance.client_id)
 
@@ -290,6 +308,18 @@ def setup_database():
         logging.error(f"Failed to initialize database. Please ensure you have installed the latest requirements. If the error persists, please report this as in future the database will be required: {e}")
 
 
+def requeue_interrupted_prompts(q):
+    snapshot_directory = args.sampler_snapshot_directory or os.path.join(folder_paths.get_user_directory(), "sampler_snapshots")
+    snapshots = comfy.sampling_cache.SamplerSnapshots(snapshot_directory, args.sampler_snapshot_interval)
+    comfy.sampling_cache.set_snapshots(snapshots)
+
+    interrupted = [item for item in snapshots.get_interrupted_prompts() if snapshots.count_attempt(item)]
+    for i, item in enumerate(interrupted):
+        logging.info(f"Queueing prompt {item['prompt_id']} again, it was running when the server stopped.")
+        # ahead of the prompts queued from now on, in their original order
+        q.put((i - len(interrupted), item["prompt_id"], item["prompt"], item["extra_data"], item["outputs_to_execute"]))
+
+
 def start_comfyui(asyncio_loop=None):
     """
     Starts the ComfyUI server using the provided asyncio event loop or creates a new one.
@@ -300,6 +330,8 @@ def start_comfyui(asyncio_loop=None):
         logging.info(f"Setting temp directory to: {temp_dir}")
         folder_paths.set_temp_directory(temp_dir)
     cleanup_temp()
+    # walking a large output folder takes a while, the files it removes don't matter to the first saves
+    threading.Thread(target=folder_paths.remove_stale_output_files, args=(folder_paths.get_output_directory(), time.time()), daemon=True, name="StaleOutputCleanup").start()
 
     if args.windows_standalone_build:
         try:
@@ -326,6 +358,8 @@ def start_comfyui(asyncio_loop=None):
     prompt_server.add_routes()
     hijack_progress(prompt_server)
 
+    if args.sampler_snapshot_interval > 0:
+        requeue_interrupted_prompts(prompt_server.prompt_queue)
     threading.Thread(target=prompt_worker, daemon=True, args=(prompt_server.prompt_queue, prompt_server,)).start()
 
     if args.quick_test_for_ci:
@@ -0,0 +1,124 @@
+import gzip
+import json
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+
+import folder_paths
+from app.object_info_cache import ObjectInfoCache
+
+
+class StaticNode:
+    pass
+
+
+class LoraNode:
+    pass
+
+
+class CustomNode:
+    RELATIVE_PYTHON_MODULE = "custom_nodes.example"
+
+
+@pytest.fixture
+def loras_dir(tmp_path):
+    loras = tmp_path / "loras"
+    loras.mkdir()
+    (loras / "a.safetensors").write_bytes(b"x")
+    with patch.dict(folder_paths.folder_names_and_paths, {"test_loras": ([str(loras)], {".safetensors"})}):
+        yield str(loras)
+
+
+class Recorder:
+    def __init__(self):
+        self.calls = []
+        self.custom_value = 1
+
+    def __call__(self, name):
+        self.calls.append(name)
+        if name == "LoraNode":
+            return {"input": {"required": {"lora": (folder_paths.get_filename_list("test_loras"),)}}}
+        if name == "CustomNode":
+            return {"value": self.custom_value}
+        return {"name": name}
+
+
+def add_lora(directory, name):
+    with open(os.path.join(directory, name), "wb") as f:
+        f.write(b"x")
+    # directory mtimes can have a coarse resolution, make sure the change is visible
+    stat = os.stat(directory)
+    os.utime(directory, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_info_is_only_built_again_when_dependencies_change(loras_dir):
+    node_info = Recorder()
+    cache = ObjectInfoCache(node_info)
+    node_classes = {"StaticNode": StaticNode, "LoraNode": LoraNode}
+
+    version = cache.update(node_classes)
+    assert sorted(node_info.calls) == ["LoraNode", "StaticNode"]
+    node_info.calls.clear()
+    assert cache.update(node_classes) == version
+    assert node_info.calls == []
+
+    add_lora(loras_dir, "b.safetensors")
+    # the model folder index picks the change up in the background
+    deadline = time.monotonic() + 10
+    while (new_version := cache.update(node_classes)) == version:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert node_info.calls == ["LoraNode"]
+    assert cache.get_node_info("LoraNode")["input"]["required"]["lora"] == (["a.safetensors", "b.safetensors"],)
+
+    delta = cache.get_delta(version)
+    assert delta["version"] == new_version
+    assert list(delta["changed"]) == ["LoraNode"]
+    assert delta["removed"] == []
+
+
+def test_registration_changes_and_removals(loras_dir):
+    cache = ObjectInfoCache(Recorder())
+    version = cache.update({"StaticNode": StaticNode})
+
+    class Replacement:
+        pass
+
+    cache.update({"StaticNode": Replacement, "Other": StaticNode})
+    delta = cache.get_delta(version)
+    # the replacement builds the same info, only the new class changed
+    assert list(delta["changed"]) == ["Other"]
+
+    removed_version = cache.update({"Other": StaticNode})
+    delta = cache.get_delta(version)
+    assert delta["removed"] == ["StaticNode"]
+    assert cache.get_delta(removed_version) == {"version": removed_version, "changed": {}, "removed": []}
+    # versions this cache never handed out return everything
+    assert list(cache.get_delta(removed_version + 100)["changed"]) == ["Other"]
+
+
+def test_custom_nodes_are_checked_on_every_update():
+    node_info = Recorder()
+    cache = ObjectInfoCache(node_info)
+    version = cache.update({"CustomNode": CustomNode})
+    assert cache.update({"CustomNode": CustomNode}) == version
+    assert node_info.calls == ["CustomNode", "CustomNode"]
+
+    node_info.custom_value = 2
+    assert cache.update({"CustomNode": CustomNode}) > version
+    assert cache.get_node_info("CustomNode") == {"value": 2}
+
+
+def test_body_is_serialized_once_per_version():
+    cache = ObjectInfoCache(Recorder())
+    version = cache.update({"StaticNode": StaticNode})
+    body_version, body = cache.get_body()
+    assert body_version == version
+    assert json.loads(body) == {"StaticNode": {"name": "StaticNode"}}
+    assert cache.get_body()[1] is body
+    assert gzip.decompress(cache.get_body("gzip")[1]) == body
+
+    assert ObjectInfoCache.get_accepted_encoding("gzip, deflate") == "gzip"
+    assert ObjectInfoCache.get_accepted_encoding("") == "identity"
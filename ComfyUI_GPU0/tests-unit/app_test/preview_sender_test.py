@@ -0,0 +1,113 @@
+import asyncio
+import json
+import struct
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from app.preview_sender import PreviewSender, encode_preview_image
+from protocol import BinaryEventTypes
+
+pytestmark = pytest.mark.asyncio
+
+
+class FakeServer:
+    def __init__(self, client_flags):
+        self.sockets = {sid: None for sid in client_flags}
+        self.sockets_metadata = {sid: {"feature_flags": flags} for sid, flags in client_flags.items()}
+        self.sent = []
+        self.release = None
+
+    async def send_bytes(self, event, data, sid=None):
+        if self.release is not None:
+            await self.release.wait()
+        self.sent.append((event, bytes(data), sid))
+
+
+def decode_with_metadata(data):
+    length = struct.unpack(">I", data[:4])[0]
+    metadata = json.loads(data[4:4 + length])
+    return metadata, Image.open(BytesIO(data[4 + length:]))
+
+
+def make_image(value=128):
+    return Image.new("RGB", (64, 32), (value, value, value))
+
+
+@pytest.fixture
+def sender():
+    sender = PreviewSender(FakeServer({"legacy": {}, "modern": {"supports_webp_previews": True}}))
+    yield sender
+    sender.executor.shutdown(wait=True)
+
+
+async def wait_sent(sender):
+    while len(sender.senders) > 0:
+        await asyncio.sleep(0.01)
+
+
+async def test_encode_preview_image_scales_and_falls_back_to_jpeg():
+    image_type, data = encode_preview_image("WEBP", make_image(), 16)
+    assert image_type == "WEBP"
+    assert Image.open(BytesIO(data)).size == (16, 8)
+
+    image_type, data = encode_preview_image("BMP", make_image(), None)
+    assert image_type == "JPEG"
+    assert Image.open(BytesIO(data)).format == "JPEG"
+
+
+async def test_webp_only_goes_to_clients_that_support_it(sender):
+    assert sender.get_preview_type("WEBP", "modern") == "WEBP"
+    assert sender.get_preview_type("WEBP", "legacy") == "JPEG"
+    # a broadcast reaches the legacy client too
+    assert sender.get_preview_type("WEBP") == "JPEG"
+    assert sender.get_preview_type("PNG", "legacy") == "PNG"
+
+    for sid, mimetype, image_format in [("modern", "image/webp", "WEBP"), ("legacy", "image/jpeg", "JPEG")]:
+        await sender.send_image_with_metadata(("WEBP", make_image(), None), {"node_id": "1"}, sid=sid)
+        event, data, sent_sid = sender.server.sent.pop()
+        assert (event, sent_sid) == (BinaryEventTypes.PREVIEW_IMAGE_WITH_METADATA, sid)
+        metadata, image = decode_with_metadata(data)
+        assert metadata == {"node_id": "1", "image_type": mimetype}
+        assert image.format == image_format
+
+    await sender.send_image(("WEBP", make_image(), None), sid="legacy")
+    event, data, _ = sender.server.sent.pop()
+    assert event == BinaryEventTypes.PREVIEW_IMAGE
+    assert struct.unpack(">I", data[:4])[0] == 1
+    assert Image.open(BytesIO(data[4:])).format == "JPEG"
+
+
+async def test_stale_previews_of_a_node_are_dropped(sender):
+    sender.server.release = asyncio.Event()
+    sender.queue(BinaryEventTypes.PREVIEW_IMAGE_WITH_METADATA, (("JPEG", make_image(0), None), {"node_id": "a", "step": 0}), "modern")
+    while len(sender.pending) > 0:
+        await asyncio.sleep(0.01)
+
+    # the first preview of a is being sent, only the newest of the ones queued meanwhile follows it
+    for step in range(1, 4):
+        sender.queue(BinaryEventTypes.PREVIEW_IMAGE_WITH_METADATA, (("JPEG", make_image(step), None), {"node_id": "a", "step": step}), "modern")
+    sender.queue(BinaryEventTypes.PREVIEW_IMAGE_WITH_METADATA, (("JPEG", make_image(), None), {"node_id": "b", "step": 0}), "modern")
+    sender.queue(BinaryEventTypes.UNENCODED_PREVIEW_IMAGE, ("JPEG", make_image(), None), "modern")
+    sender.server.release.set()
+    await wait_sent(sender)
+
+    sent = {}
+    for event, data, _ in sender.server.sent:
+        if event == BinaryEventTypes.PREVIEW_IMAGE:
+            sent.setdefault(None, []).append(None)
+        else:
+            metadata, _ = decode_with_metadata(data)
+            sent.setdefault(metadata["node_id"], []).append(metadata["step"])
+    assert sent == {"a": [0, 3], "b": [0], None: [None]}
+    assert sender.pending == {}
+
+
+async def test_failed_preview_is_skipped(sender):
+    sender.queue(BinaryEventTypes.PREVIEW_IMAGE_WITH_METADATA, (("JPEG", None, None), {"node_id": "a"}), "modern")
+    sender.queue(BinaryEventTypes.PREVIEW_IMAGE_WITH_METADATA, (("JPEG", make_image(), None), {"node_id": "b"}), "modern")
+    await wait_sent(sender)
+    assert len(sender.server.sent) == 1
+    metadata, _ = decode_with_metadata(sender.server.sent[0][1])
+    assert metadata["node_id"] == "b"
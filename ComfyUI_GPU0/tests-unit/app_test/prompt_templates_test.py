@@ -0,0 +1,57 @@
+import pytest
+
+from app.prompt_templates import PromptTemplate, PromptTemplateError, PromptTemplates
+
+
+def make_template():
+    prompt = {
+        "1": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "model.safetensors"}},
+        "2": {"class_type": "CLIPTextEncode", "inputs": {"text": "a cat", "clip": ["1", 1]}},
+        "3": {"class_type": "KSampler", "inputs": {"seed": 1, "model": ["1", 0], "positive": ["2", 0]}},
+        "4": {"class_type": "SaveImage", "inputs": {"images": ["3", 0]}, "is_changed": [None]},
+    }
+    validated = {node_id: (True, [], node_id) for node_id in prompt}
+    return PromptTemplate("template", prompt, None, validated)
+
+
+def test_instantiate_applies_deltas():
+    template = make_template()
+    prompt, validated = template.instantiate({"2": {"text": "a dog"}})
+    assert prompt["2"]["inputs"] == {"text": "a dog", "clip": ["1", 1]}
+    assert template.prompt["2"]["inputs"]["text"] == "a cat"
+    assert "is_changed" not in prompt["4"]
+    # the changed node and the nodes downstream of it are validated again
+    assert set(validated) == {"1"}
+
+
+def test_instantiate_shares_unaffected_inputs():
+    template = make_template()
+    prompt, _ = template.instantiate({"3": {"seed": 2}})
+    assert prompt["1"] is not template.prompt["1"]
+    assert prompt["1"]["inputs"] is template.prompt["1"]["inputs"]
+    assert prompt["4"]["inputs"] is not template.prompt["4"]["inputs"]
+
+
+def test_instantiate_rejects_topology_changes():
+    template = make_template()
+    with pytest.raises(PromptTemplateError):
+        template.instantiate({"5": {"seed": 2}})
+    with pytest.raises(PromptTemplateError):
+        template.instantiate({"3": {"model": ["2", 0]}})
+    with pytest.raises(PromptTemplateError):
+        template.instantiate({"3": {"seed": ["1", 0]}})
+
+
+def test_template_store():
+    templates = PromptTemplates(max_templates=1)
+    prompt = make_template().prompt
+    assert PromptTemplates.get_template_id(prompt, None) == PromptTemplates.get_template_id(dict(reversed(prompt.items())), None)
+    assert PromptTemplates.get_template_id(prompt, None) != PromptTemplates.get_template_id(prompt, ["4"])
+
+    first = PromptTemplate("a", prompt, None, {})
+    templates.put(first)
+    assert templates.get("a") is first
+    templates.put(PromptTemplate("b", prompt, None, {}))
+    assert templates.get("a") is None
+    assert templates.delete("b")
+    assert not templates.delete("b")
@@ -0,0 +1,128 @@
+import logging
+import time
+import uuid
+
+import pytest
+import torch
+from unittest.mock import patch, MagicMock
+
+# imported before the patch below, which unloads every module imported while it's active when it exits
+import comfy.model_base
+import comfy.model_management
+import comfy.model_patcher
+import comfy.ops
+from comfy.ldm.wan.model import WanModel
+
+# Mock nodes module to prevent CUDA initialization during import
+mock_nodes = MagicMock()
+mock_nodes.MAX_RESOLUTION = 16384
+
+# Mock server module for PromptServer
+mock_server = MagicMock()
+
+with patch.dict('sys.modules', {'nodes': mock_nodes, 'server': mock_server}):
+    from comfy_extras.nodes_easycache import BlockCacheHolder, BlockCacheNode, BlockCachePatch, blockcache_sample_wrapper, get_block_ranges
+
+
+NUM_LAYERS = 6
+STEPS = 12
+
+
+def create_wan_model():
+    torch.manual_seed(0)
+    model = WanModel(model_type='t2v', patch_size=(1, 2, 2), text_len=8, in_dim=4, dim=32, ffn_dim=64, freq_dim=32, text_dim=16, out_dim=4,
+                     num_heads=2, num_layers=NUM_LAYERS, operations=comfy.ops.disable_weight_init)
+    for p in model.parameters():
+        torch.nn.init.normal_(p, std=0.05)
+    return model.eval()
+
+
+def run_steps(model, holder=None):
+    torch.manual_seed(1)
+    base = torch.randn(1, 4, 3, 16, 16)
+    delta = torch.randn(1, 4, 3, 16, 16)
+    context = torch.randn(1, 8, 16)
+    cond_uuid = uuid.uuid4()
+    transformer_options = {"uuids": [cond_uuid]}
+    if holder is not None:
+        transformer_options["blockcache"] = holder
+        transformer_options["patches_replace"] = {"dit": {}}
+        for range_start, range_end in holder.block_ranges:
+            for block_idx in range(range_start, range_end + 1):
+                transformer_options["patches_replace"]["dit"][("double_block", block_idx)] = BlockCachePatch(range_start, range_end, block_idx)
+    outputs = []
+    with torch.no_grad():
+        for step in range(STEPS):
+            sigma = torch.tensor([1.0 - step / STEPS])
+            transformer_options["sigmas"] = sigma
+            x = base + delta * (0.01 * step)
+            outputs.append(model(x, sigma, context, transformer_options=transformer_options))
+    return outputs
+
+
+def create_holder(reuse_threshold, blocks_per_range):
+    holder = BlockCacheHolder(reuse_threshold, get_block_ranges(0, NUM_LAYERS - 1, blocks_per_range), 0.0, 1.0, subsample_factor=1, offload_residuals=False, verbose=True)
+    holder.start_t = float("inf")
+    holder.end_t = float("-inf")
+    return holder
+
+
+def relative_drift(outputs, reference):
+    return max(((o - r).abs().mean() / r.abs().mean()).item() for o, r in zip(outputs, reference))
+
+
+def test_zero_threshold_never_reuses():
+    model = create_wan_model()
+    reference = run_steps(model)
+    holder = create_holder(0.0, 1)
+    outputs = run_steps(model, holder)
+
+    assert sum(stats.hits for stats in holder.range_stats.values()) == 0
+    for o, r in zip(outputs, reference):
+        assert torch.allclose(o, r, atol=1e-5)
+
+
+@pytest.mark.parametrize("blocks_per_range", [1, 2, NUM_LAYERS])
+def test_skip_rate_and_drift(blocks_per_range):
+    model = create_wan_model()
+    reference = run_steps(model)
+
+    holder = create_holder(0.2, blocks_per_range)
+    start = time.perf_counter()
+    outputs = run_steps(model, holder)
+    elapsed = time.perf_counter() - start
+
+    hits = sum(stats.hits for stats in holder.range_stats.values())
+    total = hits + sum(stats.misses for stats in holder.range_stats.values())
+    drift = relative_drift(outputs, reference)
+    logging.info(f"BlockCache benchmark - blocks_per_range {blocks_per_range}: skip rate {hits}/{total}, max relative drift {drift:.5f}, {elapsed * 1000:.1f} ms")
+    holder.log_stats()
+
+    assert hits > 0
+    assert set(holder.range_stats.keys()) == {r[0] for r in holder.block_ranges}
+    assert drift < 0.5
+
+
+def test_patch_without_transformer_options_runs_the_block():
+    block_patch = BlockCachePatch(0, 0, 0)
+    out = block_patch({"img": torch.ones(1)}, {"original_block": lambda args: {"img": args["img"] * 2}})
+    assert torch.equal(out["img"], torch.full((1,), 2.0))
+
+
+@pytest.mark.parametrize("model_class", [comfy.model_base.WAN21_Vace, comfy.model_base.WAN22_S2V, comfy.model_base.WAN22_Animate])
+def test_models_adding_features_between_blocks_are_rejected(model_class):
+    model = MagicMock()
+    model.model = model_class.__new__(model_class)
+    model.get_model_object.return_value.blocks = [None] * NUM_LAYERS
+    with pytest.raises(ValueError):
+        BlockCacheNode.execute(model, 0.05, 1, 0, -1, 0.0, 1.0, False, False)
+
+
+def test_warns_when_the_model_never_calls_block_patches(caplog):
+    holder = create_holder(0.2, 1)
+    executor = MagicMock()
+    executor.class_obj.model_options = {"transformer_options": {"blockcache": holder}}
+    executor.class_obj.model_patcher.model.model_sampling.percent_to_sigma.return_value = 1.0
+    with caplog.at_level(logging.WARNING):
+        blockcache_sample_wrapper(executor)
+    assert "never called" in caplog.text
@@ -0,0 +1,158 @@
+import torch
+
+import comfy.context_windows
+import comfy.model_patcher
+import comfy.patcher_extension
+import comfy.utils
+from comfy.conds import CONDRegular
+from comfy.context_windows import ContextFuseMethods, ContextSchedules, IndexListCallbacks, IndexListContextHandler
+
+FRAMES = 20
+
+
+class FakeModel:
+    def memory_required(self, input_shape, cond_shapes={}):
+        return 0
+
+
+class FakeCalcCondBatch:
+    """Computes every batch entry on its own like a model would, and records the windows each call exposes."""
+
+    def __init__(self):
+        self.calls = []
+        self.models = []
+
+    def __call__(self, model, conds, x, timestep, model_options):
+        transformer_options = model_options["transformer_options"]
+        self.calls.append((transformer_options.get("context_window"), transformer_options.get("context_windows")))
+        self.models.append(model)
+        out = []
+        for cond in conds:
+            if cond is None:
+                out.append(torch.zeros_like(x))
+                continue
+            c = cond[0]
+            frames = comfy.utils.repeat_to_batch_size(c["frames"], x.shape[0])
+            out.append(x * timestep.view(-1, 1, 1, 1, 1) + frames * c["model_conds"]["c_crossattn"].cond.mean())
+        return out
+
+
+def make_handler(max_batched_windows: int, fuse_method=ContextFuseMethods.PYRAMID):
+    return IndexListContextHandler(
+        context_schedule=comfy.context_windows.get_matching_context_schedule(ContextSchedules.STATIC_STANDARD),
+        fuse_method=comfy.context_windows.get_matching_fuse_method(fuse_method),
+        context_length=8,
+        context_overlap=4,
+        dim=2,
+        max_batched_windows=max_batched_windows)
+
+
+def make_inputs():
+    torch.manual_seed(0)
+    x_in = torch.randn(1, 4, FRAMES, 2, 2)
+    positive = [{"frames": torch.randn(1, 4, FRAMES, 2, 2), "model_conds": {"c_crossattn": CONDRegular(torch.randn(1, 3, 8))}}]
+    conds = [positive, None]
+    timestep = torch.tensor([0.5])
+    return x_in, conds, timestep
+
+
+def execute(handler: IndexListContextHandler, calc_cond_batch: FakeCalcCondBatch, model=None):
+    x_in, conds, timestep = make_inputs()
+    model_options = {"transformer_options": {"sample_sigmas": torch.tensor([1.0, 0.5, 0.0])}}
+    return handler.execute(calc_cond_batch, model if model is not None else FakeModel(), conds, x_in, timestep, model_options)
+
+
+def test_batched_windows_match_unbatched():
+    for fuse_method in [ContextFuseMethods.PYRAMID, ContextFuseMethods.RELATIVE]:
+        unbatched_calls = FakeCalcCondBatch()
+        unbatched = execute(make_handler(1, fuse_method), unbatched_calls)
+        batched_calls = FakeCalcCondBatch()
+        batched = execute(make_handler(3, fuse_method), batched_calls)
+
+        windows = len(unbatched_calls.calls)
+        assert windows > 3
+        assert len(batched_calls.calls) == (windows + 2) // 3
+        for a, b in zip(unbatched, batched):
+            assert torch.allclose(a, b, atol=1e-6)
+
+
+def test_batched_call_exposes_its_windows():
+    calc_cond_batch = FakeCalcCondBatch()
+    execute(make_handler(2), calc_cond_batch)
+    for context_window, context_windows in calc_cond_batch.calls:
+        if context_windows is not None:
+            assert context_window is None
+            assert len(context_windows) == 2
+        else:
+            assert context_window is not None
+
+
+def test_window_callbacks_disable_batching():
+    seen = []
+
+    def on_evaluate(handler, model, x_in, conds, timestep, model_options, window_idx, window, *args):
+        seen.append(window)
+
+    handler = make_handler(4)
+    comfy.patcher_extension.add_callback(IndexListCallbacks.EVALUATE_CONTEXT_WINDOWS, on_evaluate, handler.callbacks)
+    calc_cond_batch = FakeCalcCondBatch()
+    execute(handler, calc_cond_batch)
+    assert [context_window for context_window, _ in calc_cond_batch.calls] == seen
+    assert all(context_windows is None for _, context_windows in calc_cond_batch.calls)
+
+
+def test_merge_resized_conds():
+    handler = make_handler(2)
+    x_in, conds, _ = make_inputs()
+    windows = handler.get_context_windows(FakeModel(), x_in, {})[:2]
+    windows_conds = [[handler.get_resized_cond(cond, x_in, window) for cond in conds] for window in windows]
+    merged = handler.merge_resized_conds(windows_conds)
+
+    assert merged[1] is None
+    positive = merged[0][0]
+    assert torch.equal(positive["frames"], torch.cat([windows[0].get_tensor(conds[0][0]["frames"]), windows[1].get_tensor(conds[0][0]["frames"])]))
+    # items that are the same for every window are shared, the model repeats them to the batch size
+    assert positive["model_conds"]["c_crossattn"] is conds[0][0]["model_conds"]["c_crossattn"]
+
+
+def test_window_groups_are_spread_over_devices():
+    for max_batched_windows in [1, 2]:
+        single_calls = FakeCalcCondBatch()
+        single = execute(make_handler(max_batched_windows), single_calls)
+
+        handler = make_handler(max_batched_windows)
+        model = FakeModel()
+        device_models = {torch.device("cpu", 0): FakeModel(), torch.device("cpu", 1): FakeModel()}
+        handler.device_models = device_models
+        calc_cond_batch = FakeCalcCondBatch()
+        spread = execute(handler, calc_cond_batch, model)
+
+        for a, b in zip(single, spread):
+            assert torch.allclose(a, b, atol=1e-6)
+        # every group is evaluated once, round-robin on the main model and the devices
+        groups = len(single_calls.calls)
+        assert groups >= 2
+        targets = [model] + list(device_models.values())
+        assert len(calc_cond_batch.models) == groups
+        for target in targets[:groups]:
+            assert sum(m is target for m in calc_cond_batch.models) == len(range(targets.index(target), groups, len(targets)))
+
+
+def test_clone_model_to_device_copies_the_original_weights():
+    model = comfy.model_patcher.ModelPatcher(torch.nn.Sequential(torch.nn.Linear(4, 4)), load_device=torch.device("cpu"), offload_device=torch.device("cpu"))
+    original = model.model[0].weight.detach().clone()
+    model.add_patches({"0.weight": (torch.ones(4, 4),)}, strength_patch=0.5)
+    model.patch_model()
+    patched = model.model[0].weight.detach().clone()
+    assert not torch.equal(patched, original)
+
+    device_patcher = comfy.context_windows.clone_model_to_device(model, torch.device("cpu", 1))
+    assert device_patcher.load_device == torch.device("cpu", 1)
+    assert device_patcher.model is not model.model
+    assert torch.equal(device_patcher.model[0].weight, original)
+    # the copy gets the patches of the source model when it is loaded
+    device_patcher.patch_model()
+    assert torch.equal(device_patcher.model[0].weight, patched)
+    assert torch.equal(model.model[0].weight, patched)
+    model.unpatch_model()
+    assert torch.equal(model.model[0].weight, original)
@@ -0,0 +1,127 @@
+"""
+Time-to-abort of the long operations that check for /interrupt between their steps, measured on CPU.
+Each operation is interrupted from another thread while it runs and must stop within MAX_ABORT_SECONDS.
+"""
+import threading
+import time
+
+import pytest
+import torch
+
+import comfy.model_management
+import comfy.model_patcher
+import comfy.ops
+import comfy.utils
+from comfy.ldm.wan.vae import WanVAE
+
+MAX_ABORT_SECONDS = 0.5
+
+
+@pytest.fixture(autouse=True)
+def reset_interrupt():
+    comfy.model_management.interrupt_current_processing(False)
+    yield
+    comfy.model_management.interrupt_current_processing(False)
+
+
+def time_to_abort(function, interrupt_after: float) -> float:
+    """Interrupts function after interrupt_after seconds, returns the seconds it took to stop."""
+    interrupted_at = []
+
+    def interrupt():
+        interrupted_at.append(time.perf_counter())
+        comfy.model_management.interrupt_current_processing(True)
+
+    timer = threading.Timer(interrupt_after, interrupt)
+    timer.start()
+    try:
+        with pytest.raises(comfy.model_management.InterruptProcessingException):
+            function()
+    finally:
+        timer.cancel()
+    assert len(interrupted_at) == 1, "the operation ended before it was interrupted"
+    return time.perf_counter() - interrupted_at[0]
+
+
+def test_tiled_scale_multidim():
+    def upscale_tile(tile):
+        time.sleep(0.05)
+        return tile.repeat_interleave(2, dim=-1).repeat_interleave(2, dim=-2)
+
+    def tiled_upscale():
+        # 256 tiles, 12.8 seconds without the interrupt
+        comfy.utils.tiled_scale(torch.zeros(1, 3, 512, 512), upscale_tile, tile_x=32, tile_y=32, overlap=0, upscale_amount=2)
+
+    assert time_to_abort(tiled_upscale, 0.2) < MAX_ABORT_SECONDS
+
+
+def test_wan_vae_decode():
+    vae = WanVAE(dim=8, z_dim=4, dim_mult=[1], num_res_blocks=1, temperal_downsample=[])
+    decode_frame = vae.decoder.forward
+
+    def slow_decode_frame(*args, **kwargs):
+        time.sleep(0.05)
+        return decode_frame(*args, **kwargs)
+    vae.decoder.forward = slow_decode_frame
+
+    def wan_vae_decode():
+        with torch.no_grad():
+            vae.decode(torch.zeros(1, 4, 100, 4, 4))
+
+    assert time_to_abort(wan_vae_decode, 0.2) < MAX_ABORT_SECONDS
+    # the features cached for the next frame were freed
+    assert all(x is None for x in vae._feat_map)
+
+
+def test_load_torch_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "model.safetensors")
+    comfy.utils.save_torch_file({f"w{i}": torch.zeros(4) for i in range(200)}, path)
+
+    get_tensor_calls = []
+    original_safe_open = comfy.utils.safetensors.safe_open
+
+    class SlowSafeOpen:
+        def __init__(self, *args, **kwargs):
+            self.f = original_safe_open(*args, **kwargs)
+
+        def __enter__(self):
+            self.f.__enter__()
+            return self
+
+        def __exit__(self, *args):
+            return self.f.__exit__(*args)
+
+        def keys(self):
+            return self.f.keys()
+
+        def get_tensor(self, k):
+            get_tensor_calls.append(k)
+            time.sleep(0.01)
+            return self.f.get_tensor(k)
+
+    monkeypatch.setattr(comfy.utils.safetensors, "safe_open", SlowSafeOpen)
+
+    def load_torch_file():
+        comfy.utils.load_torch_file(path)
+
+    assert time_to_abort(load_torch_file, 0.2) < MAX_ABORT_SECONDS
+    assert len(get_tensor_calls) < 200
+
+
+def test_model_patcher_load():
+    model = torch.nn.Sequential(*[comfy.ops.disable_weight_init.Linear(16, 16) for _ in range(100)])
+    patcher = comfy.model_patcher.ModelPatcher(model, load_device=torch.device("cpu"), offload_device=torch.device("cpu"))
+    patch_weight_to_device = patcher.patch_weight_to_device
+
+    def slow_patch_weight_to_device(*args, **kwargs):
+        time.sleep(0.01)
+        return patch_weight_to_device(*args, **kwargs)
+    patcher.patch_weight_to_device = slow_patch_weight_to_device
+
+    def model_patcher_load():
+        patcher.partially_load(torch.device("cpu"), extra_memory=1e32)
+
+    assert time_to_abort(model_patcher_load, 0.2) < MAX_ABORT_SECONDS
+    # the partial load was undone
+    assert patcher.model.model_loaded_weight_memory == 0
+    assert not any(getattr(m, "comfy_patched_weights", False) for m in model)
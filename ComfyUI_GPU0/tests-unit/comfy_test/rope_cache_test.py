@@ -0,0 +1,64 @@
+import torch
+
+import comfy.ops
+from comfy.ldm.flux.layers import EmbedND
+from comfy.ldm.wan.model import WanModel
+
+
+def create_wan_model():
+    return WanModel(model_type='t2v', in_dim=4, dim=32, ffn_dim=64, freq_dim=32, text_dim=16, out_dim=4, num_heads=2, num_layers=1,
+                    operations=comfy.ops.disable_weight_init)
+
+
+def test_embednd_cache_matches_uncached():
+    embedder = EmbedND(dim=16, theta=10000, axes_dim=[8, 4, 4])
+    ids = torch.rand(1, 64, 3) * 10
+    with torch.no_grad():
+        first = embedder(ids)
+        second = embedder(ids.clone())
+        assert second is first
+        assert torch.equal(first, embedder.embed(ids))
+
+        other_ids = ids + 1
+        other = embedder(other_ids)
+        assert other is not first
+        assert torch.equal(other, embedder.embed(other_ids))
+
+
+def test_embednd_cache_disabled_with_grad():
+    embedder = EmbedND(dim=16, theta=10000, axes_dim=[8, 4, 4])
+    ids = torch.rand(1, 64, 3)
+    with torch.enable_grad():
+        embedder(ids)
+    assert len(embedder.rope_cache.entries) == 0
+
+
+def test_wan_rope_encode_cache():
+    model = create_wan_model()
+    with torch.no_grad():
+        freqs = model.rope_encode(21, 90, 160, device=torch.device("cpu"), dtype=torch.float32)
+        assert model.rope_encode(21, 90, 160, device=torch.device("cpu"), dtype=torch.float32) is freqs
+        assert torch.equal(freqs, model._rope_encode(21, 90, 160, device=torch.device("cpu"), dtype=torch.float32))
+
+        shifted = model.rope_encode(21, 90, 160, t_start=4, device=torch.device("cpu"), dtype=torch.float32)
+        assert not torch.equal(shifted, freqs)
+
+
+def test_wan_rope_encode_cache_hits_across_steps():
+    model = create_wan_model()
+    computed = []
+    rope_encode = model._rope_encode
+
+    def counting_rope_encode(*args, **kwargs):
+        computed.append(args)
+        return rope_encode(*args, **kwargs)
+    model._rope_encode = counting_rope_encode
+
+    x = torch.randn(1, 4, 3, 16, 16)
+    context = torch.randn(1, 8, 16)
+    with torch.no_grad():
+        for step in range(4):
+            model(x, torch.tensor([1.0 - step / 4]), context)
+    # every step after the first one reuses the embeddings
+    assert len(computed) == 1
+    assert len(model.rope_embedder.rope_cache.entries) == 1
@@ -0,0 +1,223 @@
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+import torch
+
+import comfy.clip_vision
+import comfy.extra_samplers.uni_pc
+import comfy.k_diffusion.sampling
+import comfy.model_patcher
+import comfy.sampler_helpers
+import comfy.sampling_cache
+from comfy.sampling_cache import ANCESTRAL_SAMPLER_FUNCTIONS, REPLAYABLE_SAMPLER_FUNCTIONS, RESUMABLE_SAMPLER_FUNCTIONS, SamplerSnapshots, SamplingCheckpointCache, SamplingCheckpoints, get_signature
+
+
+def test_get_deepest_matches_sigma_prefix():
+    cache = SamplingCheckpointCache(1024 * 1024)
+    sigmas = [1.0, 0.75, 0.5, 0.25, 0.0]
+    cache.put("job", tuple(sigmas[:2]), torch.full((4,), 1.0))
+    cache.put("job", tuple(sigmas[:3]), torch.full((4,), 2.0))
+
+    step, x = cache.get_deepest("job", sigmas)
+    assert step == 2
+    assert torch.equal(x, torch.full((4,), 2.0))
+
+    # a different schedule after step 1 can only reuse the step 1 checkpoint
+    step, x = cache.get_deepest("job", [1.0, 0.75, 0.6, 0.0])
+    assert step == 1
+    assert torch.equal(x, torch.full((4,), 1.0))
+
+    assert cache.get_deepest("other_job", sigmas) == (0, None)
+
+
+def test_lru_eviction_respects_byte_budget():
+    tensor_bytes = 16 * 4
+    cache = SamplingCheckpointCache(tensor_bytes * 2)
+    cache.put("job", (1.0, 0.9), torch.zeros(16))
+    cache.put("job", (1.0, 0.8), torch.zeros(16))
+    # touch the first entry so the second one is the least recently used
+    assert cache.get_deepest("job", [1.0, 0.9])[0] == 1
+    cache.put("job", (1.0, 0.7), torch.zeros(16))
+
+    assert cache.current_bytes == tensor_bytes * 2
+    assert cache.get_deepest("job", [1.0, 0.8])[0] == 0
+    assert cache.get_deepest("job", [1.0, 0.9])[0] == 1
+    assert cache.get_deepest("job", [1.0, 0.7])[0] == 1
+
+
+def test_signature_ignores_uuids_and_follows_tensor_content():
+    a = {"cross_attn": torch.ones(2, 3), "uuid": "a"}
+    b = {"cross_attn": torch.ones(2, 3), "uuid": "b"}
+    c = {"cross_attn": torch.zeros(2, 3), "uuid": "a"}
+    assert get_signature([a]) == get_signature([b])
+    assert get_signature([a]) != get_signature([c])
+
+
+@pytest.mark.parametrize("sampler_function", sorted(RESUMABLE_SAMPLER_FUNCTIONS))
+def test_resumed_run_matches_full_run(sampler_function):
+    sample = getattr(comfy.k_diffusion.sampling, sampler_function)
+
+    def model(x, sigma):
+        return torch.tanh(x) * (1 - sigma.view(-1, 1) * 0.1)
+
+    sigmas = torch.tensor([14.6, 7.0, 3.1, 1.4, 0.6, 0.2, 0.0])
+    x = torch.randn(2, 8, generator=torch.Generator().manual_seed(0)) * sigmas[0]
+    checkpoints = {}
+    full = sample(model, x, sigmas, callback=lambda d: checkpoints.setdefault(d["i"], d["x"].clone()), disable=True)
+    for step in range(1, len(sigmas) - 1):
+        resumed = sample(model, checkpoints[step], sigmas[step:], disable=True)
+        assert torch.allclose(resumed, full, atol=1e-6), f"resuming at step {step}"
+
+
+def test_snapshots_survive_until_the_prompt_ends(tmp_path):
+    sigmas = [1.0, 0.75, 0.5, 0.25, 0.0]
+    prompt = {"1": {"class_type": "KSampler", "inputs": {}, "is_changed": [None]}}
+    snapshots = SamplerSnapshots(str(tmp_path), interval=0)
+    snapshots.begin_prompt("prompt", prompt, {"client_id": "a"}, ["1"])
+    snapshots.save("job", 1, sigmas[:2], torch.full((4,), 1.0))
+    snapshots.save("job", 2, sigmas[:3], torch.full((4,), 2.0))
+
+    # a new process finds the prompt and resumes from the last snapshot
+    restarted = SamplerSnapshots(str(tmp_path), interval=0)
+    interrupted = restarted.get_interrupted_prompts()
+    assert interrupted == [{"prompt_id": "prompt", "prompt": {"1": {"class_type": "KSampler", "inputs": {}}}, "extra_data": {"client_id": "a"}, "outputs_to_execute": ["1"]}]
+    restarted.begin_prompt("prompt", interrupted[0]["prompt"], {}, ["1"])
+    step, x, state = restarted.load("job", sigmas)
+    assert (step, state) == (2, {})
+    assert torch.equal(x, torch.full((4,), 2.0))
+    # a different schedule doesn't match
+    assert restarted.load("job", [1.0, 0.75, 0.6, 0.0]) == (0, None, {})
+
+    restarted.end_prompt()
+    assert SamplerSnapshots(str(tmp_path), interval=0).get_interrupted_prompts() == []
+
+
+def test_snapshots_are_written_every_interval(tmp_path):
+    snapshots = SamplerSnapshots(str(tmp_path), interval=60)
+    snapshots.begin_prompt("prompt", {}, {}, [])
+    snapshots.save("job", 1, [1.0, 0.5], torch.zeros(4))
+    assert not (tmp_path / "prompt").exists()
+
+    snapshots.last_write["job"] = time.monotonic() - 61
+    snapshots.save("job", 2, [1.0, 0.5, 0.0], torch.zeros(4))
+    assert (tmp_path / "prompt" / "job.safetensors").exists()
+
+
+class FakeControl:
+    def __init__(self, strength):
+        self.strength = strength
+        self.control_model = torch.nn.Linear(4, 4)
+
+
+def make_snapshot_key(cond_value=1.0, control_strength=0.5):
+    """Builds the snapshot key of a sampler run from new objects, like a new process would."""
+    clip_vision_output = comfy.clip_vision.Output()
+    clip_vision_output.image_embeds = torch.ones(1, 4)
+    positive = [[torch.full((1, 2, 4), cond_value), {"pooled_output": torch.ones(1, 4), "clip_vision_output": clip_vision_output, "control": FakeControl(control_strength)}]]
+    model_patcher = comfy.model_patcher.ModelPatcher(torch.nn.Linear(4, 4), load_device=torch.device("cpu"), offload_device=torch.device("cpu"))
+    model_patcher.set_model_attn1_patch(lambda q, k, v, extra_options: (q, k, v))
+    model_wrap = SimpleNamespace(model_patcher=model_patcher, cfg=7.0, original_conds={"positive": comfy.sampler_helpers.convert_cond(positive)})
+    sampler = SimpleNamespace(sampler_function=comfy.k_diffusion.sampling.sample_euler, extra_options={}, inpaint_options={})
+    checkpoints = SamplingCheckpoints.create(sampler, model_wrap, torch.tensor([1.0, 0.5, 0.0]), torch.ones(1, 4, 2, 2), torch.zeros(1, 4, 2, 2), None, 0)
+    return checkpoints.snapshot_key
+
+
+def test_snapshot_key_is_rebuilt_from_new_objects(tmp_path, monkeypatch):
+    monkeypatch.setattr(comfy.sampling_cache, "_cache", None)
+    monkeypatch.setattr(comfy.sampling_cache, "_snapshots", SamplerSnapshots(str(tmp_path), interval=0))
+    key = make_snapshot_key()
+    assert make_snapshot_key() == key
+    assert make_snapshot_key(cond_value=2.0) != key
+    assert make_snapshot_key(control_strength=1.0) != key
+
+
+def test_interrupted_prompt_is_dropped_after_max_attempts(tmp_path):
+    snapshots = SamplerSnapshots(str(tmp_path), interval=0, max_attempts=2)
+    snapshots.begin_prompt("prompt", {}, {}, [])
+    snapshots.save("job", 1, [1.0, 0.5], torch.zeros(4))
+
+    for attempt in range(1, 3):
+        # every start of the server queues it again and counts it
+        restarted = SamplerSnapshots(str(tmp_path), interval=0, max_attempts=2)
+        interrupted = restarted.get_interrupted_prompts()
+        assert len(interrupted) == 1
+        assert restarted.count_attempt(interrupted[0])
+        # running it again keeps the count
+        restarted.begin_prompt("prompt", interrupted[0]["prompt"], {}, [])
+        restarted.save("job", 2, [1.0, 0.5, 0.0], torch.zeros(4))
+        with open(tmp_path / "prompt" / "prompt.json", encoding="utf-8") as f:
+            assert json.load(f)["attempts"] == attempt
+
+    restarted = SamplerSnapshots(str(tmp_path), interval=0, max_attempts=2)
+    assert not restarted.count_attempt(restarted.get_interrupted_prompts()[0])
+    assert restarted.get_interrupted_prompts() == []
+    assert not (tmp_path / "prompt").exists()
+
+
+class CountingModel:
+    """A denoiser for the k-diffusion samplers, counts its calls."""
+    def __init__(self):
+        self.calls = 0
+        self.inner_model = SimpleNamespace(inner_model=SimpleNamespace(model_sampling=None))
+
+    def __call__(self, x, sigma, **kwargs):
+        self.calls += 1
+        return torch.tanh(x) * (1 - sigma.view(-1, 1) * 0.01)
+
+
+class StopSampling(Exception):
+    pass
+
+
+def sampler_inputs(sampler_function):
+    sample = getattr(comfy.k_diffusion.sampling, sampler_function, None) or getattr(comfy.extra_samplers.uni_pc, sampler_function)
+    sigmas = torch.tensor([14.6, 7.0, 3.1, 1.4, 0.6, 0.2, 0.0])
+    noise = torch.randn(2, 8, generator=torch.Generator().manual_seed(0))
+    return sample, sigmas, noise
+
+
+def run_sampler(sampler_function, directory, stop_at=None):
+    """Runs the sampler like KSAMPLER.sample does with snapshots written at every step, stops at step stop_at."""
+    sample, sigmas, noise = sampler_inputs(sampler_function)
+    snapshots = SamplerSnapshots(directory, interval=0)
+    snapshots.begin_prompt("prompt", {}, {}, [])
+    comfy.sampling_cache.set_snapshots(snapshots)
+    model_patcher = comfy.model_patcher.ModelPatcher(torch.nn.Linear(4, 4), load_device=torch.device("cpu"), offload_device=torch.device("cpu"))
+    sampler = SimpleNamespace(sampler_function=sample, extra_options={}, inpaint_options={})
+    checkpoints = SamplingCheckpoints.create(sampler, SimpleNamespace(model_patcher=model_patcher), sigmas, noise, None, None, 7)
+    start_step, x = checkpoints.resume()
+    x = noise * sigmas[0] if x is None else x
+    model = CountingModel()
+    sampler_model, extra_options = checkpoints.wrap(model, x, sampler.extra_options)
+
+    def callback(d):
+        if checkpoints.replaying:
+            return
+        if start_step + d["i"] == stop_at:
+            raise StopSampling()
+        checkpoints.store(start_step + d["i"], d["x"])
+
+    try:
+        result = sample(sampler_model, x, sigmas[start_step:], extra_args={"seed": 7}, callback=callback, disable=True, **extra_options)
+    except StopSampling:
+        result = None
+    return result, model.calls
+
+
+@pytest.mark.parametrize("sampler_function", sorted(ANCESTRAL_SAMPLER_FUNCTIONS | REPLAYABLE_SAMPLER_FUNCTIONS))
+def test_restarted_run_matches_full_run(sampler_function, tmp_path):
+    try:
+        full, full_calls = run_sampler(sampler_function, str(tmp_path / "full"))
+        # the server stops during step 4, a new process resumes from the snapshot of step 3
+        assert run_sampler(sampler_function, str(tmp_path / "restarted"), stop_at=4)[0] is None
+        resumed, resumed_calls = run_sampler(sampler_function, str(tmp_path / "restarted"))
+    finally:
+        comfy.sampling_cache.set_snapshots(None)
+    assert torch.equal(resumed, full)
+    # the checkpoints don't change the result of a run
+    sample, sigmas, noise = sampler_inputs(sampler_function)
+    assert torch.equal(sample(CountingModel(), noise * sigmas[0], sigmas, extra_args={"seed": 7}, disable=True), full)
+    # the model is only evaluated for the steps after the snapshot
+    assert resumed_calls < full_calls
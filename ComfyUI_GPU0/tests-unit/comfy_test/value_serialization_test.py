@@ -0,0 +1,74 @@
+import pytest
+import safetensors.torch
+import torch
+
+import comfy.value_serialization as value_serialization
+
+
+def make_conditioning():
+    pooled = torch.randn(1, 1280)
+    return [
+        [torch.randn(1, 77, 2048), {"pooled_output": pooled, "strength": 0.5, "area": (64, 64, 0, 0)}],
+        [torch.randn(1, 77, 2048, dtype=torch.float16), {"pooled_output": pooled, "timestep_start": 1.0, "mask": None}],
+    ]
+
+
+def assert_equal(a, b):
+    assert type(a) is type(b)
+    if isinstance(a, torch.Tensor):
+        assert a.dtype == b.dtype and torch.equal(a, b)
+    elif isinstance(a, (list, tuple)):
+        assert len(a) == len(b)
+        for x, y in zip(a, b):
+            assert_equal(x, y)
+    elif isinstance(a, dict):
+        assert a.keys() == b.keys()
+        for k in a:
+            assert_equal(a[k], b[k])
+    else:
+        assert a == b
+
+
+def test_round_trip_bytes():
+    value = {"samples": torch.randn(2, 4, 8, 8), "batch_index": [0, 1], "noise_mask": torch.ones(2, 1, 8, 8, dtype=torch.bool)}
+    data = value_serialization.dumps(value, metadata={"prompt": "{}"})
+    loaded, metadata = value_serialization.loads(data, return_metadata=True)
+    assert_equal(loaded, value)
+    assert metadata == {"prompt": "{}"}
+
+
+def test_round_trip_file_shares_tensors(tmp_path):
+    conditioning = make_conditioning()
+    path = str(tmp_path / "cond.conditioning")
+    value_serialization.save(conditioning, path)
+
+    loaded = value_serialization.load(path)
+    assert_equal(loaded, conditioning)
+    assert loaded[0][1]["pooled_output"] is loaded[1][1]["pooled_output"]
+
+    # standard safetensors readers can open the file
+    tensors = safetensors.torch.load_file(path)
+    assert len(tensors) == 3
+
+
+def test_loaded_tensors_are_aligned(tmp_path):
+    value = [torch.ones(3, dtype=torch.uint8), torch.ones(5, dtype=torch.float64), torch.ones(7, dtype=torch.float16)]
+    path = str(tmp_path / "value")
+    value_serialization.save(value, path)
+    for tensor in value_serialization.load(path):
+        assert tensor.data_ptr() % tensor.element_size() == 0
+
+
+def test_mmap_load_is_copy_on_write(tmp_path):
+    path = str(tmp_path / "image")
+    value_serialization.save(torch.zeros(4, 4), path)
+    loaded = value_serialization.load(path)
+    loaded += 1
+    assert torch.equal(value_serialization.load(path), torch.zeros(4, 4))
+
+
+def test_unsupported_values():
+    with pytest.raises(TypeError):
+        value_serialization.dumps([torch.zeros(1), {"control": object()}])
+    with pytest.raises(TypeError):
+        value_serialization.dumps({1: torch.zeros(1)})
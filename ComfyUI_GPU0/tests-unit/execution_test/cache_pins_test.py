@@ -0,0 +1,43 @@
+from comfy_execution.caching import BasicCache, CacheKeySetID, CachePins
+
+
+def test_reference_counts():
+    pins = CachePins(2)
+    pins.pin_queued("b", ["shared", "b"])
+    pins.pin_executed("a", ["shared", "a"])
+    assert "shared" in pins and "a" in pins and "b" in pins
+
+    # b left the queue without executing
+    pins.unpin_queued(set())
+    assert "b" not in pins
+    assert "shared" in pins
+
+
+def test_executed_prompts_replace_their_queued_keys():
+    pins = CachePins(2)
+    pins.pin_queued("a", ["queued key"])
+    pins.pin_executed("a", ["executed key"])
+    assert "queued key" not in pins
+    pins.unpin_queued(set())
+    assert "executed key" in pins
+
+
+def test_only_the_last_executed_prompts_stay_pinned():
+    pins = CachePins(2)
+    for prompt_id in ("a", "b", "c"):
+        pins.pin_executed(prompt_id, [prompt_id, "shared"])
+    assert "a" not in pins
+    assert "b" in pins and "c" in pins
+    assert pins.counts["shared"] == 2
+
+
+def test_clean_unused_keeps_pinned_results():
+    cache = BasicCache(CacheKeySetID)
+    cache.cache = {"current": 1, "pinned": 2, "unused": 3}
+    cache.initialized = True
+    cache.cache_key_set = CacheKeySetID(None, [], None)
+    cache.cache_key_set.keys = {"1": "current"}
+    cache.pins = CachePins(1)
+    cache.pins.pin_executed("previous", ["pinned"])
+    cache.clean_unused()
+    assert set(cache.cache) == {"current", "pinned"}
@@ -0,0 +1,60 @@
+import pytest
+
+from app.history_store import HistoryFilter, HistoryStore, MemorySpill
+
+
+def make_entry(i, status="success"):
+    return {"prompt": [i, f"p{i}", {"1": {"class_type": "Node"}}, {}, ["1"]], "outputs": {"1": {"value": i}},
+            "status": {"status_str": status, "completed": status == "success", "messages": []}}
+
+
+@pytest.fixture
+def store():
+    store = HistoryStore(max_items=10, memory_items=3)
+    for i in range(8):
+        store.put(f"p{i}", make_entry(i, "error" if i % 3 == 0 else "success"))
+    return store
+
+
+def test_older_entries_are_spilled(store):
+    assert list(store.recent) == ["p5", "p6", "p7"]
+    assert isinstance(store.spill, MemorySpill)
+    assert len(store) == 8
+    # spilled entries come back decoded, recent ones as they were stored
+    assert store.get("p1")["outputs"] == {"1": {"value": 1}}
+    assert store.get("p7") is store.recent["p7"]
+    assert "p0" in store and "missing" not in store
+
+
+def test_pagination_spans_spill_and_memory(store):
+    assert list(store.query()) == [f"p{i}" for i in range(8)]
+    assert list(store.query(max_items=3)) == ["p5", "p6", "p7"]
+    assert list(store.query(max_items=4, offset=3)) == ["p3", "p4", "p5", "p6"]
+    assert list(store.query(max_items=2, offset=7)) == ["p7"]
+
+
+def test_filters(store):
+    assert list(store.query(history_filter=HistoryFilter(status="error"))) == ["p0", "p3", "p6"]
+    assert list(store.query(max_items=2, history_filter=HistoryFilter(status="success"))) == ["p5", "p7"]
+    assert store.query(history_filter=HistoryFilter(since=store.records["p7"].end_time + 1)) == {}
+    assert list(store.query(history_filter=HistoryFilter(until=0))) == []
+
+
+def test_size_is_bounded_and_ids_are_replaced(store):
+    for i in range(8, 20):
+        store.put(f"p{i}", make_entry(i))
+    assert len(store) == 10
+    assert list(store.query()) == [f"p{i}" for i in range(10, 20)]
+
+    store.put("p12", make_entry(42))
+    assert list(store.query())[-1] == "p12"
+    assert store.get("p12")["prompt"][0] == 42
+    assert len(store) == 10
+
+
+def test_delete_and_clear(store):
+    store.delete("p1")
+    store.delete("p6")
+    assert list(store.query()) == ["p0", "p2", "p3", "p4", "p5", "p7"]
+    store.clear()
+    assert len(store) == 0 and store.query() == {}
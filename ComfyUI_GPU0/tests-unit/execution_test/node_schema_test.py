@@ -0,0 +1,115 @@
+import asyncio
+import os
+
+import pytest
+
+import execution
+import folder_paths
+import nodes
+from comfy_execution.node_schema import NodeSchemaCache, node_schemas
+
+
+@pytest.fixture
+def input_dir(tmp_path):
+    original = folder_paths.get_input_directory()
+    folder_paths.set_input_directory(str(tmp_path))
+    yield tmp_path
+    folder_paths.set_input_directory(original)
+
+
+def make_loader():
+    class Loader:
+        calls = 0
+
+        @classmethod
+        def INPUT_TYPES(cls):
+            cls.calls += 1
+            files = sorted(os.listdir(folder_paths.get_input_directory()))
+            return {
+                "required": {"image": (files,), "strength": ("FLOAT", {"min": 0.0, "max": 1.0})},
+                "optional": {"mask": ("MASK", {"lazy": True}), "raw": ("*", {"rawLink": True})},
+                "hidden": {"unique_id": "UNIQUE_ID"},
+            }
+
+        @classmethod
+        def VALIDATE_INPUTS(cls, image, **kwargs):
+            return True
+
+        @classmethod
+        def IS_CHANGED(cls, image):
+            return image
+
+    return Loader
+
+
+def test_lookup_tables(input_dir):
+    schema = NodeSchemaCache().get(make_loader())
+    assert schema.valid_inputs == ("image", "strength", "mask", "raw")
+    assert schema.inputs["strength"].category == "required"
+    assert schema.inputs["strength"].extra_info == {"min": 0.0, "max": 1.0}
+    assert schema.inputs["mask"].lazy and not schema.inputs["mask"].raw_link
+    assert schema.inputs["raw"].raw_link
+    assert schema.inputs["unique_id"].category == "hidden"
+    assert schema.get_input("unique_id", include_hidden=False) is None
+    assert schema.hidden == {"unique_id": "UNIQUE_ID"}
+    assert schema.validate_function_name == "VALIDATE_INPUTS"
+    assert schema.validate_function_inputs == ["cls", "image"]
+    assert schema.validate_has_kwargs
+    assert schema.is_changed_name == "IS_CHANGED"
+
+
+def test_schema_is_rebuilt_when_its_file_list_changes(input_dir):
+    loader = make_loader()
+    cache = NodeSchemaCache()
+    (input_dir / "a.png").write_bytes(b"")
+    assert cache.get(loader).inputs["image"].input_type == ["a.png"]
+    cache.refresh()
+    assert cache.get(loader) is cache.get(loader)
+    assert loader.calls == 1
+
+    (input_dir / "b.png").write_bytes(b"")
+    folder_paths.mark_file_changed(str(input_dir / "b.png"))
+    cache.refresh()
+    assert cache.get(loader).inputs["image"].input_type == ["a.png", "b.png"]
+    assert loader.calls == 2
+
+
+def test_custom_node_schemas_are_rebuilt_on_every_refresh():
+    class CustomNode:
+        RELATIVE_PYTHON_MODULE = "custom_nodes.example"
+
+        @classmethod
+        def INPUT_TYPES(cls):
+            return {"required": {"value": ("INT",)}}
+
+    cache = NodeSchemaCache()
+    schema = cache.get(CustomNode)
+    assert cache.get(CustomNode) is schema
+    cache.refresh()
+    assert cache.get(CustomNode) is not schema
+
+
+def test_validation_rebuilds_a_schema_only_for_missing_combo_values(input_dir, monkeypatch):
+    # without VALIDATE_INPUTS for the image the combo options are checked
+    loader = type("PlainLoader", (make_loader(),), {"VALIDATE_INPUTS": None, "RETURN_TYPES": (), "OUTPUT_NODE": True})
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "TestLoader", loader)
+    # validation runs on the event loop, only the executor refreshes the cache
+    monkeypatch.setattr(node_schemas, "refresh", lambda: pytest.fail("validation refreshed the node schemas"))
+    (input_dir / "a.png").write_bytes(b"")
+
+    def validate(image):
+        prompt = {"1": {"class_type": "TestLoader", "inputs": {"image": image, "strength": 0.5}}}
+        return asyncio.run(execution.validate_prompt("prompt", prompt, None))[0]
+
+    try:
+        assert validate("a.png")
+        assert validate("a.png")
+        assert loader.calls == 1
+
+        # an upload that isn't in the cached file list yet
+        (input_dir / "b.png").write_bytes(b"")
+        assert validate("b.png")
+        assert loader.calls == 2
+        assert not validate("c.png")
+    finally:
+        node_schemas.invalidate(loader)
@@ -0,0 +1,157 @@
+import asyncio
+import os
+import threading
+from types import SimpleNamespace
+
+import execution
+import folder_paths
+import nodes
+from comfy_execution.caching import CacheKeySetInputSignature, CachePins
+from comfy_execution.graph import DynamicPrompt
+from comfy_execution.node_schema import node_schemas
+from comfy_execution.pipeline import PromptPreparer
+
+
+class FakeQueue:
+    def __init__(self, items):
+        self.items = items
+
+    def peek(self):
+        return self.items[0] if len(self.items) > 0 else None
+
+
+def test_prepares_head_of_queue_once():
+    prepared = []
+
+    async def prepare(prompt_id, prompt):
+        prepared.append((prompt_id, prompt))
+
+    preparer = PromptPreparer(prepare)
+    queue = FakeQueue([SimpleNamespace(prompt_id="b", prompt={"1": {}})])
+    preparer.prepare_next(queue)
+    preparer.prepare_next(queue)
+    preparer.wait("b")
+    assert prepared == [("b", {"1": {}})]
+
+    preparer.prepare_next(FakeQueue([]))
+    assert preparer.prepared_prompt_id == "b"
+
+
+def test_wait_blocks_until_prepared():
+    release = threading.Event()
+    done = []
+
+    async def prepare(prompt_id, prompt):
+        release.wait()
+        done.append(prompt_id)
+
+    preparer = PromptPreparer(prepare)
+    preparer.prepare_next(FakeQueue([SimpleNamespace(prompt_id="a", prompt={})]))
+    # another prompt doesn't wait for it
+    preparer.wait("other")
+    assert done == []
+    release.set()
+    preparer.wait("a")
+    assert done == ["a"]
+
+
+def test_errors_are_left_to_the_execution():
+    async def prepare(prompt_id, prompt):
+        raise ValueError("broken input")
+
+    preparer = PromptPreparer(prepare)
+    preparer.prepare_next(FakeQueue([SimpleNamespace(prompt_id="a", prompt={})]))
+    preparer.wait("a")
+
+
+def test_prepare_prompt_only_fingerprints_input_files(tmp_path, monkeypatch):
+    calls = []
+
+    class Loader:
+        @classmethod
+        def INPUT_TYPES(cls):
+            return {"required": {"image": (sorted(os.listdir(folder_paths.get_input_directory())),)}}
+
+        @classmethod
+        def IS_CHANGED(cls, image):
+            calls.append(image)
+
+    class CustomLoader(Loader):
+        RELATIVE_PYTHON_MODULE = "custom_nodes.example"
+
+    (tmp_path / "a.png").write_bytes(b"a")
+    original = folder_paths.get_input_directory()
+    folder_paths.set_input_directory(str(tmp_path))
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "TestLoader", Loader)
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "TestCustomLoader", CustomLoader)
+    fingerprinted = []
+    monkeypatch.setattr(folder_paths, "get_file_fingerprint", fingerprinted.append)
+    try:
+        prompt = {
+            "1": {"class_type": "TestLoader", "inputs": {"image": "a.png"}},
+            "2": {"class_type": "TestLoader", "inputs": {"image": "missing.png"}},
+            "3": {"class_type": "TestCustomLoader", "inputs": {"image": "a.png"}},
+        }
+        asyncio.run(execution.prepare_prompt("prompt", prompt))
+    finally:
+        folder_paths.set_input_directory(original)
+        node_schemas.invalidate()
+
+    # no IS_CHANGED runs next to the executing prompt, and custom nodes are left alone
+    assert calls == []
+    assert fingerprinted == [str(tmp_path / "a.png")]
+
+
+def test_queued_prompt_keys_are_pinned_without_running_is_changed(tmp_path, monkeypatch):
+    calls = []
+
+    class Loader:
+        @classmethod
+        def INPUT_TYPES(cls):
+            return {"required": {"image": (sorted(os.listdir(folder_paths.get_input_directory())),)}}
+
+        @classmethod
+        def IS_CHANGED(cls, image):
+            calls.append(image)
+            return folder_paths.get_file_fingerprint(folder_paths.get_annotated_filepath(image))
+
+    class CustomLoader(Loader):
+        RELATIVE_PYTHON_MODULE = "custom_nodes.example"
+
+    class Consumer:
+        @classmethod
+        def INPUT_TYPES(cls):
+            return {"required": {"image": ("IMAGE",)}}
+
+    (tmp_path / "a.png").write_bytes(b"a")
+    original = folder_paths.get_input_directory()
+    folder_paths.set_input_directory(str(tmp_path))
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "TestLoader", Loader)
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "TestCustomLoader", CustomLoader)
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "TestConsumer", Consumer)
+    prompt = {
+        "1": {"class_type": "TestLoader", "inputs": {"image": "a.png"}},
+        "2": {"class_type": "TestConsumer", "inputs": {"image": ["1", 0]}},
+        "3": {"class_type": "TestCustomLoader", "inputs": {"image": "a.png"}},
+        "4": {"class_type": "TestConsumer", "inputs": {"image": ["3", 0]}},
+    }
+    pins = CachePins(2)
+    executor = SimpleNamespace(
+        caches=SimpleNamespace(pins=pins),
+        server=SimpleNamespace(prompt_queue=SimpleNamespace(get_current_queue=lambda: ([], [execution.QueueItem(1, "queued", prompt, {}, [])]))),
+    )
+    try:
+        asyncio.run(execution.PromptExecutor.pin_queued_prompts(executor))
+        assert calls == []
+
+        # the keys the execution computes with IS_CHANGED
+        dynprompt = DynamicPrompt(prompt)
+        key_set = CacheKeySetInputSignature(dynprompt, prompt.keys(), execution.IsChangedCache("queued", dynprompt, None, store_in_prompt=False))
+        asyncio.run(key_set.add_keys(prompt.keys()))
+    finally:
+        folder_paths.set_input_directory(original)
+        node_schemas.invalidate()
+
+    # the built-in loader and its consumer are pinned, the custom IS_CHANGED and what depends on it aren't
+    pinned = pins.prompt_keys["queued"] - set(key_set.get_used_subcache_keys())
+    assert pinned == {key_set.get_data_key("1"), key_set.get_data_key("2")}
@@ -0,0 +1,74 @@
+import threading
+
+from comfy_execution import prefetch
+from comfy_execution.prefetch import ModelPrefetcher
+
+
+def make_files(tmp_path, sizes):
+    files = []
+    for i, size in enumerate(sizes):
+        path = tmp_path / f"model{i}.safetensors"
+        path.write_bytes(b"\0" * size)
+        files.append((str(path), {str(i)}))
+    return files
+
+
+def run(prefetcher):
+    prefetcher.start()
+    if prefetcher.thread is not None:
+        prefetcher.thread.join()
+
+
+def test_reads_files_within_budget(tmp_path):
+    files = make_files(tmp_path, [1000, 5000, 2000])
+    prefetcher = ModelPrefetcher(files, 3500, lambda: False)
+    run(prefetcher)
+    # the second file doesn't fit in what's left of the budget, the third one does
+    assert prefetcher.prefetched_bytes == 3000
+
+
+def test_skips_files_of_started_nodes(tmp_path):
+    files = make_files(tmp_path, [1000, 2000])
+    prefetcher = ModelPrefetcher(files, 10000, lambda: False)
+    prefetcher.node_started("0")
+    run(prefetcher)
+    assert prefetcher.prefetched_bytes == 2000
+
+
+def test_stops_when_interrupted(tmp_path, monkeypatch):
+    monkeypatch.setattr(prefetch, "CHUNK_SIZE", 100)
+    files = make_files(tmp_path, [1000, 1000])
+    checks = []
+
+    def is_interrupted():
+        checks.append(None)
+        return len(checks) > 3
+
+    prefetcher = ModelPrefetcher(files, 10000, is_interrupted)
+    run(prefetcher)
+    assert prefetcher.prefetched_bytes == 200
+
+
+def test_cancel_does_not_wait_for_the_thread(tmp_path, monkeypatch):
+    monkeypatch.setattr(prefetch, "CHUNK_SIZE", 100)
+    files = make_files(tmp_path, [1000])
+    reading = threading.Event()
+    release = threading.Event()
+
+    def is_interrupted():
+        # blocks the thread between two chunks like a slow read would
+        reading.set()
+        release.wait()
+        return False
+
+    prefetcher = ModelPrefetcher(files, 10000, is_interrupted)
+    prefetcher.start()
+    thread = prefetcher.thread
+    assert reading.wait(5)
+    prefetcher.cancel()
+    assert prefetcher.thread is None
+    assert thread.is_alive()
+
+    release.set()
+    thread.join()
+    assert prefetcher.prefetched_bytes < 1000
@@ -0,0 +1,142 @@
+import os
+import tempfile
+import time
+
+import pytest
+
+from folder_paths import STALE_MARKER_AGE, SaveCounterIndex, get_save_image_path, remove_stale_output_files
+
+
+def touch(*parts):
+    with open(os.path.join(*parts), "w") as f:
+        f.write("x")
+
+
+@pytest.fixture
+def output_dir():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield os.path.realpath(temp_dir)
+
+
+def test_counter_starts_after_existing_files(output_dir):
+    touch(output_dir, "ComfyUI_00007_.png")
+    touch(output_dir, "ComfyUI_00003_.png")
+    touch(output_dir, "Other_00042_.png")
+    full_output_folder, filename, counter, subfolder, _ = get_save_image_path("ComfyUI", output_dir)
+    assert (os.path.normpath(full_output_folder), filename, subfolder) == (output_dir, "ComfyUI", "")
+    assert counter == 8
+
+
+class CountingSaveCounterIndex(SaveCounterIndex):
+    def __init__(self):
+        super().__init__()
+        self.scans = 0
+
+    def scan(self, folder, prefix):
+        self.scans += 1
+        return super().scan(folder, prefix)
+
+
+def test_counter_follows_written_files(output_dir):
+    index = CountingSaveCounterIndex()
+    assert index.get_counter(output_dir, "ComfyUI") == 1
+    # the counter stays reserved until the prompt is done
+    assert index.get_counter(output_dir, "ComfyUI") == 2
+    index.release_markers()
+    # nothing written, the counter is handed out again
+    assert index.get_counter(output_dir, "ComfyUI") == 1
+    index.release_markers()
+
+    for counter in range(1, 5):
+        touch(output_dir, f"ComfyUI_{counter:05}_.png")
+    assert index.get_counter(output_dir, "ComfyUI") == 5
+
+    # known suffixes are found by probing instead of listing the folder
+    scans = index.scans
+    touch(output_dir, "ComfyUI_00005_.png")
+    touch(output_dir, "ComfyUI_00006_.png.tmp")
+    assert index.get_counter(output_dir, "ComfyUI") == 7
+    assert index.scans == scans
+    index.release_markers()
+    assert sorted(os.listdir(output_dir))[-1] == "ComfyUI_00006_.png.tmp"
+
+
+def test_counter_rescans_on_unknown_suffix(output_dir):
+    index = SaveCounterIndex()
+    touch(output_dir, "ComfyUI_00001_.png")
+    assert index.get_counter(output_dir, "ComfyUI") == 2
+    touch(output_dir, "ComfyUI_00002_.webp")
+    assert index.get_counter(output_dir, "ComfyUI") == 3
+    touch(output_dir, "ComfyUI_00010_.png")
+    touch(output_dir, "ComfyUI_00003_.mp4")
+    assert index.get_counter(output_dir, "ComfyUI") == 11
+
+
+def test_rapid_saves_never_reuse_a_counter(output_dir, monkeypatch):
+    # the folder mtime doesn't change on filesystems with coarse timestamps, the counter must not depend on it
+    stat = os.stat
+    monkeypatch.setattr(os, "stat", lambda path, *args, **kwargs: os.stat_result(stat(path, *args, **kwargs)[:8] + (0, 0)))
+    index = SaveCounterIndex()
+    counters = []
+    for _ in range(50):
+        counter = index.get_counter(output_dir, "ComfyUI")
+        counters.append(counter)
+        touch(output_dir, f"ComfyUI_{counter:05}_.png.tmp")
+    assert counters == list(range(1, 51))
+
+
+def test_instances_sharing_a_folder_never_get_the_same_counter(output_dir):
+    first = SaveCounterIndex()
+    second = SaveCounterIndex()
+    touch(output_dir, "ComfyUI_00001_.png")
+    assert first.get_counter(output_dir, "ComfyUI") == 2
+    # the first instance hasn't written anything yet, its reservation is skipped
+    assert second.get_counter(output_dir, "ComfyUI") == 3
+    touch(output_dir, "ComfyUI_00002_.png.tmp")
+    touch(output_dir, "ComfyUI_00003_.png")
+    assert first.get_counter(output_dir, "ComfyUI") == 4
+    assert second.get_counter(output_dir, "ComfyUI") == 5
+    first.release_markers()
+    second.release_markers()
+    # nothing is left in the folder besides the outputs
+    assert sorted(os.listdir(output_dir)) == ["ComfyUI_00001_.png", "ComfyUI_00002_.png.tmp", "ComfyUI_00003_.png"]
+
+
+def test_reservation_race_moves_to_the_next_counter(output_dir):
+    index = SaveCounterIndex()
+    assert index.get_counter(output_dir, "ComfyUI") == 1
+    index.release_markers()
+    # another instance reserved the counter the probes still consider free
+    touch(output_dir, "ComfyUI_00001_.lock")
+    assert index.get_counter(output_dir, "ComfyUI") == 2
+    index.release_markers()
+    assert os.listdir(output_dir) == ["ComfyUI_00001_.lock"]
+
+
+def test_marker_is_kept_until_the_writer_is_done(output_dir):
+    index = SaveCounterIndex()
+    counter = index.get_counter(output_dir, "ComfyUI")
+    marker = index.begin_write(os.path.join(output_dir, f"ComfyUI_{counter:05}_.png"))
+    assert marker == os.path.join(output_dir, "ComfyUI_00001_.lock")
+    assert index.begin_write(os.path.join(output_dir, "Other_00001_.png")) is None
+    index.release_markers()
+    assert os.path.exists(marker)
+    index.end_write(marker)
+    assert not os.path.exists(marker)
+
+
+def test_files_left_by_a_stopped_instance_are_removed(output_dir):
+    os.mkdir(os.path.join(output_dir, "sub"))
+    for name in ["ComfyUI_00001_.png", "ComfyUI_00002_.png.tmp", "ComfyUI_00003_.lock", os.path.join("sub", "ComfyUI_00001_.png.tmp")]:
+        touch(output_dir, name)
+    old = time.time() - STALE_MARKER_AGE - 10
+    for name in ["ComfyUI_00002_.png.tmp", "ComfyUI_00003_.lock", os.path.join("sub", "ComfyUI_00001_.png.tmp")]:
+        os.utime(os.path.join(output_dir, name), (old, old))
+    # written since this process started
+    touch(output_dir, "ComfyUI_00004_.png.tmp")
+    touch(output_dir, "ComfyUI_00005_.lock")
+
+    assert remove_stale_output_files(output_dir, time.time() - 5) == 3
+    assert sorted(os.listdir(output_dir)) == ["ComfyUI_00001_.png", "ComfyUI_00004_.png.tmp", "ComfyUI_00005_.lock", "sub"]
+    assert os.listdir(os.path.join(output_dir, "sub")) == []
+    assert SaveCounterIndex().get_counter(os.path.join(output_dir, "sub"), "ComfyUI") == 1
@@ -0,0 +1,153 @@
+import pytest
+import time
+import torch
+import numpy as np
+import subprocess
+
+from pytest import fixture
+from comfy_execution.graph_utils import GraphBuilder
+from tests.execution.test_execution import ComfyClient, run_warmup
+
+
+@pytest.mark.execution
+class TestConcurrentNodes:
+    @fixture(scope="class", autouse=True, params=[
+        (False, 0),
+        (True, 0),
+        (True, 100),
+    ])
+    def _server(self, args_pytest, request):
+        pargs = [
+            'python','main.py',
+            '--output-directory', args_pytest["output_dir"],
+            '--listen', args_pytest["listen"],
+            '--port', str(args_pytest["port"]),
+            '--extra-model-paths-config', 'tests/execution/extra_model_paths.yaml',
+            '--cpu',
+            '--concurrent-nodes', '2',
+        ]
+        use_lru, lru_size = request.param
+        if use_lru:
+            pargs += ['--cache-lru', str(lru_size)]
+        # Running server with args: pargs
+        p = subprocess.Popen(pargs)
+        yield
+        p.kill()
+        torch.cuda.empty_cache()
+
+    @fixture(scope="class", autouse=True)
+    def shared_client(self, args_pytest, _server):
+        client = ComfyClient()
+        n_tries = 5
+        for i in range(n_tries):
+            time.sleep(4)
+            try:
+                client.connect(listen=args_pytest["listen"], port=args_pytest["port"])
+            except ConnectionRefusedError:
+                # Retrying...
+                pass
+            else:
+                break
+        yield client
+        del client
+        torch.cuda.empty_cache()
+
+    @fixture
+    def client(self, shared_client, request):
+        shared_client.set_test_name(f"concurrent_nodes[{request.node.name}]")
+        yield shared_client
+
+    @fixture
+    def builder(self, request):
+        yield GraphBuilder(prefix=request.node.name)
+
+    def test_independent_branches_run_concurrently(self, client: ComfyClient, builder: GraphBuilder, skip_timing_checks):
+        run_warmup(client)
+
+        g = builder
+        image = g.node("StubImage", content="BLACK", height=512, width=512, batch_size=1)
+        sleep1 = g.node("TestThreadSleep", value=image.out(0), seconds=0.4)
+        sleep2 = g.node("TestThreadSleep", value=image.out(0), seconds=0.5)
+        output1 = g.node("PreviewImage", images=sleep1.out(0))
+        output2 = g.node("PreviewImage", images=sleep2.out(0))
+
+        start_time = time.time()
+        result = client.run(g)
+        elapsed_time = time.time() - start_time
+
+        # Should take ~0.5s (max duration) not 0.9s (sum of durations)
+        if not skip_timing_checks:
+            assert elapsed_time < 0.8, f"Concurrent execution took {elapsed_time}s, expected < 0.8s"
+        assert result.did_run(sleep1) and result.did_run(sleep2)
+        assert len(result.get_images(output1)) == 1 and len(result.get_images(output2)) == 1
+
+    def test_concurrency_is_limited_by_resources(self, client: ComfyClient, builder: GraphBuilder, skip_timing_checks):
+        run_warmup(client)
+
+        g = builder
+        image = g.node("StubImage", content="BLACK", height=512, width=512, batch_size=1)
+        sleeps = [g.node("TestThreadSleep", value=image.out(0), seconds=0.3) for _ in range(4)]
+        for sleep in sleeps:
+            g.node("PreviewImage", images=sleep.out(0))
+
+        start_time = time.time()
+        result = client.run(g)
+        elapsed_time = time.time() - start_time
+
+        # --concurrent-nodes 2 runs the four nodes in two rounds
+        if not skip_timing_checks:
+            assert elapsed_time >= 0.6, f"Execution took {elapsed_time}s, more than 2 nodes ran at once"
+            assert elapsed_time < 1.1, f"Execution took {elapsed_time}s, expected two rounds"
+        assert all(result.did_run(sleep) for sleep in sleeps)
+
+    def test_threaded_and_inline_nodes_mix(self, client: ComfyClient, builder: GraphBuilder):
+        g = builder
+        image1 = g.node("StubImage", content="BLACK", height=512, width=512, batch_size=1)
+        image2 = g.node("StubImage", content="WHITE", height=512, width=512, batch_size=1)
+        mask = g.node("StubMask", value=0.5, height=512, width=512, batch_size=1)
+
+        sleep1 = g.node("TestThreadSleep", value=image1.out(0), seconds=0.2)
+        sleep2 = g.node("TestSleep", value=image2.out(0), seconds=0.1)
+        # depends on both the thread pool and the async branch
+        mix = g.node("TestLazyMixImages", image1=sleep1.out(0), image2=sleep2.out(0), mask=mask.out(0))
+        chained = g.node("TestThreadSleep", value=mix.out(0), seconds=0.1)
+        output = g.node("SaveImage", images=chained.out(0))
+
+        result = client.run(g)
+
+        assert result.did_run(sleep1) and result.did_run(sleep2) and result.did_run(chained)
+        result_images = result.get_images(output)
+        assert len(result_images) == 1
+        assert abs(int(np.array(result_images[0]).max()) - 127) <= 1, "Both images should have been mixed"
+
+    def test_threaded_nodes_are_cached(self, client: ComfyClient, builder: GraphBuilder):
+        g = builder
+        image = g.node("StubImage", content="BLACK", height=512, width=512, batch_size=1)
+        sleep = g.node("TestThreadSleep", value=image.out(0), seconds=0.1)
+        g.node("SaveImage", images=sleep.out(0))
+
+        result1 = client.run(g)
+        assert result1.did_run(sleep)
+
+        result2 = client.run(g)
+        assert not result2.did_run(sleep), "Threaded node should have been cached"
+
+    def test_threaded_node_error(self, client: ComfyClient, builder: GraphBuilder):
+        g = builder
+        image = g.node("StubImage", content="BLACK", height=512, width=512, batch_size=1)
+        error_node = g.node("TestThreadError", value=image.out(0))
+        g.node("SaveImage", images=error_node.out(0))
+
+        try:
+            client.run(g)
+            assert False, "Should have raised an error"
+        except Exception as e:
+            assert 'prompt_id' in e.args[0], f"Did not get proper error message: {e}"
+            assert e.args[0]['node_id'] == error_node.id, "Error should be from the threaded node"
+
+        # the failed node released its resources, later prompts still run concurrently
+        g2 = GraphBuilder(prefix="after_error")
+        image2 = g2.node("StubImage", content="WHITE", height=64, width=64, batch_size=1)
+        sleep = g2.node("TestThreadSleep", value=image2.out(0), seconds=0.1)
+        g2.node("SaveImage", images=sleep.out(0))
+        assert client.run(g2).did_run(sleep)
@@ -0,0 +1,40 @@
+"""Add the history table
+
+Revision ID: 0001_history
+Revises:
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001_history'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('history',
+    sa.Column('sequence', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('prompt_id', sa.String(), nullable=False),
+    sa.Column('end_time', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('data', sa.Text(), nullable=False),
+    sa.PrimaryKeyConstraint('sequence'),
+    sa.UniqueConstraint('prompt_id')
+    )
+    op.create_index('ix_history_end_time', 'history', ['end_time'], unique=False)
+    op.create_index('ix_history_status', 'history', ['status'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_history_status', table_name='history')
+    op.drop_index('ix_history_end_time', table_name='history')
+    op.drop_table('history')
@@ -0,0 +1,92 @@
+"""
+Cached content hashes of files, for the IS_CHANGED of the nodes that load a file.
+
+A file is only hashed again when its size, mtime or inode changed, so a sweep that queues the same input image
+hundreds of times reads it once. The fast mode uses xxhash or BLAKE3 when one of them is installed and BLAKE2b
+otherwise, the default SHA-256 matches the fingerprints the nodes returned before.
+"""
+from __future__ import annotations
+from typing import Any, Callable, Optional
+import collections
+import hashlib
+import os
+import threading
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def get_hash_function(fast: bool) -> Callable[[], Any]:
+    if not fast:
+        return hashlib.sha256
+    if xxhash is not None:
+        return xxhash.xxh3_128
+    if blake3 is not None:
+        return blake3.blake3
+    return hashlib.blake2b
+
+
+class FingerprintCache:
+    def __init__(self, max_entries: int, fast: bool = False):
+        self.max_entries = max_entries
+        self.hash_function = get_hash_function(fast)
+        self.lock = threading.Lock()
+        # absolute path -> ((size, mtime_ns, inode), hex digest)
+        self.entries: collections.OrderedDict[str, tuple[tuple[int, int, int], str]] = collections.OrderedDict()
+
+    @staticmethod
+    def _get_key(stat: os.stat_result) -> tuple[int, int, int]:
+        return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+    def get(self, path: str) -> str:
+        """Returns the hex digest of the file's content. Raises OSError like open() when it can't be read."""
+        path = os.path.abspath(path)
+        key = self._get_key(os.stat(path))
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[0] == key:
+                self.entries.move_to_end(path)
+                return entry[1]
+
+        m = self.hash_function()
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                m.update(chunk)
+        digest = m.hexdigest()
+        # the stat of the file that was read, it may have been replaced since the first one
+        self._put(path, self._get_key(stat), digest)
+        return digest
+
+    def put_data(self, path: str, data: bytes):
+        """Records the content just written to path, so its first fingerprint doesn't have to read it back."""
+        path = os.path.abspath(path)
+        m = self.hash_function()
+        m.update(data)
+        self._put(path, self._get_key(os.stat(path)), m.hexdigest())
+
+    def _put(self, path: str, key: tuple[int, int, int], digest: str):
+        with self.lock:
+            self.entries[path] = (key, digest)
+            self.entries.move_to_end(path)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, path: Optional[str] = None):
+        with self.lock:
+            if path is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(os.path.abspath(path), None)
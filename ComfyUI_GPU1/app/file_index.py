@@ -0,0 +1,399 @@
+"""
+Incrementally updated index of the files below a directory.
+
+A FileIndex lists the directory tree once and keeps it in memory. Changes are picked up per directory: inotify
+(on Linux) marks the directories it reports changes for, and a background thread polls the directory mtimes for
+the changes inotify can't see, like other machines writing to network storage. Only the marked directories are
+listed again before the next lookup, so a listing costs O(result) instead of a walk over the whole tree.
+"""
+from __future__ import annotations
+from typing import Callable, Collection, Optional
+import ctypes
+import ctypes.util
+import errno
+import itertools
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+
+_versions = itertools.count(1)
+
+
+class DirectoryEntry:
+    __slots__ = ("prefix", "mtime", "files", "subdirs")
+
+    def __init__(self, prefix: str, mtime: Optional[float]):
+        # path relative to the root of the index, "" for the root itself
+        self.prefix = prefix
+        self.mtime = mtime
+        self.files: set[str] = set()
+        self.subdirs: set[str] = set()
+
+    def relative_path(self, name: str) -> str:
+        return os.path.join(self.prefix, name) if self.prefix else name
+
+
+class FileIndex:
+    """
+    Index of the files below root. scan(directory) has to return the relative paths of all files below directory
+    and the mtimes of its subdirectories, like folder_paths.recursive_search, it is used for the first listing and
+    for directories that are added later.
+    """
+
+    def __init__(self, root: str, scan: Callable[[str], tuple[list[str], dict[str, float]]], excluded_dir_names: Collection[str] = (), watcher: Optional[DirectoryWatcher] = None):
+        self.root = os.path.normpath(root)
+        self.scan = scan
+        self.excluded_dir_names = set(excluded_dir_names)
+        self.watcher = watcher
+        self.lock = threading.RLock()
+        self.dirs: dict[str, DirectoryEntry] = {}
+        self.files: set[str] = set()
+        self.stats: dict[str, os.stat_result] = {}
+        self.lists: dict[tuple[str, ...], list[str]] = {}
+        self.version = next(_versions)
+        self.loaded = False
+        self.dirty_lock = threading.Lock()
+        self.dirty: set[str] = set()
+
+    def mark_dirty(self, directory: str):
+        with self.dirty_lock:
+            self.dirty.add(directory)
+
+    def mark_all_dirty(self):
+        with self.lock:
+            directories = list(self.dirs)
+        with self.dirty_lock:
+            self.dirty.update(directories)
+
+    def poll(self):
+        """Marks the directories whose mtime changed since they were listed."""
+        with self.lock:
+            entries = [(directory, entry.mtime) for directory, entry in self.dirs.items()]
+        for directory, mtime in entries:
+            try:
+                current = os.path.getmtime(directory)
+            except OSError:
+                current = None
+            if current != mtime:
+                self.mark_dirty(directory)
+
+    def refresh(self):
+        """Brings the index up to date with the changes reported since the last call."""
+        with self.lock:
+            if not self.loaded:
+                self.loaded = True
+                if self.watcher is not None:
+                    self.watcher.add(self)
+                self._merge(self.root, *self.scan(self.root))
+                self._changed()
+            elif self.root not in self.dirs and os.path.isdir(self.root):
+                self._merge(self.root, *self.scan(self.root))
+                self._changed()
+
+            if self.watcher is None or not self.watcher.is_watching(self):
+                self.poll()
+
+            with self.dirty_lock:
+                dirty = self.dirty
+                self.dirty = set()
+            # parents first, a new subdirectory is listed completely when its parent is
+            for directory in sorted(dirty, key=len):
+                self._rescan(directory)
+
+    def get_version(self) -> int:
+        """Returns a number that changes whenever a file is added to or removed from the index."""
+        with self.lock:
+            self.refresh()
+            return self.version
+
+    def list_files(self, extensions: Collection[str] = ()) -> list[str]:
+        """
+        Returns the sorted relative paths of the files with one of the given extensions, or of all files when
+        extensions is empty. The returned list is shared and must not be modified.
+        """
+        with self.lock:
+            self.refresh()
+            key = tuple(sorted(extensions))
+            files = self.lists.get(key)
+            if files is None:
+                if len(extensions) == 0:
+                    files = sorted(self.files)
+                else:
+                    files = sorted(f for f in self.files if os.path.splitext(f)[-1].lower() in extensions)
+                self.lists[key] = files
+            return files
+
+    def get_stat(self, relative_path: str) -> Optional[os.stat_result]:
+        """Returns the stat of an indexed file, cached until its directory changes."""
+        with self.lock:
+            stat = self.stats.get(relative_path)
+            if stat is None and relative_path in self.files:
+                try:
+                    stat = os.stat(os.path.join(self.root, relative_path))
+                except OSError:
+                    return None
+                self.stats[relative_path] = stat
+            return stat
+
+    def _changed(self):
+        self.version = next(_versions)
+        self.lists.clear()
+
+    def _add_dir(self, directory: str, mtime: Optional[float]) -> DirectoryEntry:
+        prefix = "" if directory == self.root else os.path.relpath(directory, self.root)
+        entry = DirectoryEntry(prefix, mtime)
+        self.dirs[directory] = entry
+        if self.watcher is not None:
+            self.watcher.watch(self, directory)
+        return entry
+
+    def _merge(self, base: str, files: list[str], dirs: dict[str, float]):
+        for directory, mtime in dirs.items():
+            self._add_dir(directory, mtime)
+        if base not in self.dirs:
+            self._add_dir(base, None)
+        for directory in dirs:
+            parent = os.path.dirname(directory)
+            if directory != base and parent in self.dirs:
+                self.dirs[parent].subdirs.add(os.path.basename(directory))
+        for relative_path in files:
+            parent, name = os.path.split(relative_path)
+            directory = os.path.join(base, parent) if parent else base
+            entry = self.dirs.get(directory)
+            if entry is None:
+                entry = self._add_dir(directory, None)
+            entry.files.add(name)
+            self.files.add(entry.relative_path(name))
+
+    def _remove_dir(self, directory: str):
+        entry = self.dirs.pop(directory, None)
+        if entry is None:
+            return
+        for name in entry.files:
+            relative_path = entry.relative_path(name)
+            self.files.discard(relative_path)
+            self.stats.pop(relative_path, None)
+        for name in entry.subdirs:
+            self._remove_dir(os.path.join(directory, name))
+        if self.watcher is not None:
+            self.watcher.unwatch(self, directory)
+        parent = self.dirs.get(os.path.dirname(directory))
+        if directory != self.root and parent is not None:
+            parent.subdirs.discard(os.path.basename(directory))
+
+    def _rescan(self, directory: str):
+        entry = self.dirs.get(directory)
+        if entry is None:
+            # removed together with its parent, or found when the parent is listed
+            return
+        files = set()
+        subdirs = set()
+        try:
+            mtime = os.path.getmtime(directory)
+            with os.scandir(directory) as it:
+                for item in it:
+                    try:
+                        is_dir = item.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        if item.name not in self.excluded_dir_names:
+                            subdirs.add(item.name)
+                    else:
+                        files.add(item.name)
+        except OSError:
+            self._remove_dir(directory)
+            self._changed()
+            return
+
+        entry.mtime = mtime
+        for name in entry.files:
+            # the files that are still there may have been rewritten
+            self.stats.pop(entry.relative_path(name), None)
+        changed = entry.files != files or entry.subdirs != subdirs
+        for name in entry.files - files:
+            self.files.discard(entry.relative_path(name))
+        for name in files - entry.files:
+            self.files.add(entry.relative_path(name))
+        entry.files = files
+        for name in entry.subdirs - subdirs:
+            self._remove_dir(os.path.join(directory, name))
+        for name in subdirs - entry.subdirs:
+            path = os.path.join(directory, name)
+            self._remove_dir(path)
+            self._merge(path, *self.scan(path))
+        entry.subdirs = subdirs
+        if changed:
+            self._changed()
+
+
+class Inotify:
+    """Minimal ctypes binding of the Linux inotify API."""
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def add_watch(self, path: str) -> int:
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), ctypes.c_uint32(self.WATCH_MASK))
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def rm_watch(self, wd: int):
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self) -> list[tuple[int, int]]:
+        """Blocks until events are available and returns them as (wd, mask) pairs."""
+        data = os.read(self.fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset + self.EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_len = self.EVENT_HEADER.unpack_from(data, offset)
+            events.append((wd, mask))
+            offset += self.EVENT_HEADER.size + name_len
+        return events
+
+
+class DirectoryWatcher:
+    """
+    Reports changes in the directories of the registered indexes through inotify when it's available, and polls
+    the directory mtimes of all indexes every poll_interval seconds when that's larger than 0.
+    """
+
+    def __init__(self, poll_interval: float):
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.indexes: list[FileIndex] = []
+        # indexes with directories inotify couldn't watch
+        self.unwatched: set[FileIndex] = set()
+        self.watches: dict[int, set[tuple[FileIndex, str]]] = {}
+        self.watch_ids: dict[tuple[FileIndex, str], int] = {}
+        self.inotify: Optional[Inotify] = None
+        self.warned = False
+
+        if sys.platform.startswith("linux"):
+            try:
+                self.inotify = Inotify()
+            except (OSError, AttributeError) as e:
+                logging.info(f"inotify is not available, model folders are polled for changes: {e}")
+        if self.inotify is not None:
+            threading.Thread(target=self._inotify_loop, name="FileIndexInotify", daemon=True).start()
+        if self.poll_interval > 0:
+            threading.Thread(target=self._poll_loop, name="FileIndexPoll", daemon=True).start()
+
+    def add(self, index: FileIndex):
+        with self.lock:
+            self.indexes.append(index)
+
+    def is_watching(self, index: FileIndex) -> bool:
+        """False when changes in the index can only be found by polling it."""
+        if self.poll_interval > 0:
+            return True
+        with self.lock:
+            return self.inotify is not None and index not in self.unwatched
+
+    def watch(self, index: FileIndex, directory: str):
+        if self.inotify is None:
+            return
+        try:
+            wd = self.inotify.add_watch(directory)
+        except OSError as e:
+            with self.lock:
+                self.unwatched.add(index)
+            if e.errno == errno.ENOSPC and not self.warned:
+                self.warned = True
+                logging.warning("The inotify watch limit is reached, raise fs.inotify.max_user_watches to get model folder changes right away.")
+            return
+        with self.lock:
+            self.watches.setdefault(wd, set()).add((index, directory))
+            self.watch_ids[(index, directory)] = wd
+
+    def unwatch(self, index: FileIndex, directory: str):
+        if self.inotify is None:
+            return
+        with self.lock:
+            wd = self.watch_ids.pop((index, directory), None)
+            if wd is None:
+                return
+            targets = self.watches.get(wd)
+            if targets is not None:
+                targets.discard((index, directory))
+                if len(targets) > 0:
+                    return
+                self.watches.pop(wd)
+        self.inotify.rm_watch(wd)
+
+    def _inotify_loop(self):
+        while True:
+            try:
+                events = self.inotify.read_events()
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                logging.warning(f"Stopped watching model folders with inotify: {e}")
+                with self.lock:
+                    self.unwatched.update(self.indexes)
+                return
+
+            for wd, mask in events:
+                if mask & Inotify.IN_Q_OVERFLOW:
+                    with self.lock:
+                        indexes = list(self.indexes)
+                    for index in indexes:
+                        index.mark_all_dirty()
+                    continue
+                with self.lock:
+                    if mask & Inotify.IN_IGNORED:
+                        targets = self.watches.pop(wd, set())
+                        for target in targets:
+                            self.watch_ids.pop(target, None)
+                        continue
+                    targets = list(self.watches.get(wd, ()))
+                for index, directory in targets:
+                    if mask & (Inotify.IN_DELETE_SELF | Inotify.IN_MOVE_SELF):
+                        index.mark_dirty(os.path.dirname(directory))
+                    index.mark_dirty(directory)
+
+    def _poll_loop(self):
+        while True:
+            time.sleep(self.poll_interval)
+            with self.lock:
+                indexes = list(self.indexes)
+            for index in indexes:
+                try:
+                    index.poll()
+                except Exception as e:
+                    logging.warning(f"Failed to check {index.root} for changes: {e}")
+
+
+_watcher: Optional[DirectoryWatcher] = None
+_watcher_lock = threading.Lock()
+
+
+def get_watcher(poll_interval: float) -> DirectoryWatcher:
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = DirectoryWatcher(poll_interval)
+        return _watcher
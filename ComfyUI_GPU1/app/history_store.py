@@ -0,0 +1,250 @@
+"""
+Storage of the prompt history of PromptQueue.
+
+The newest entries are kept in memory as they are. Older ones are moved to a spill: the history table of the
+database when it's available, otherwise zlib compressed JSON in memory. The spill keeps the metadata queries filter
+on next to the encoded entry, so /history pages are found without decoding whole prompts and only the entries that
+are returned are decoded.
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Optional
+import json
+import logging
+import time
+import zlib
+
+
+class HistoryRecord(NamedTuple):
+    sequence: int
+    prompt_id: str
+    # time the prompt finished in ms
+    end_time: int
+    status: Optional[str]
+
+
+class HistoryFilter(NamedTuple):
+    status: Optional[str] = None
+    since: Optional[int] = None
+    until: Optional[int] = None
+
+    def matches(self, record: HistoryRecord) -> bool:
+        if self.status is not None and record.status != self.status:
+            return False
+        if self.since is not None and record.end_time < self.since:
+            return False
+        if self.until is not None and record.end_time > self.until:
+            return False
+        return True
+
+
+class MemorySpill:
+    def __init__(self):
+        self.entries: OrderedDict[str, tuple[HistoryRecord, bytes]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, items: list[tuple[HistoryRecord, dict]]):
+        for record, entry in items:
+            self.entries[record.prompt_id] = (record, zlib.compress(json.dumps(entry).encode("utf-8"), 1))
+
+    def get(self, prompt_id: str) -> Optional[dict]:
+        item = self.entries.get(prompt_id)
+        if item is None:
+            return None
+        return json.loads(zlib.decompress(item[1]))
+
+    def count(self, history_filter: HistoryFilter) -> int:
+        if history_filter == HistoryFilter():
+            return len(self.entries)
+        return sum(1 for record, _ in self.entries.values() if history_filter.matches(record))
+
+    def query(self, history_filter: HistoryFilter, offset: int, limit: int) -> list[tuple[str, dict]]:
+        out = []
+        for record, data in self.entries.values():
+            if len(out) >= limit:
+                break
+            if not history_filter.matches(record):
+                continue
+            if offset > 0:
+                offset -= 1
+                continue
+            out.append((record.prompt_id, json.loads(zlib.decompress(data))))
+        return out
+
+    def delete(self, prompt_id: str):
+        self.entries.pop(prompt_id, None)
+
+    def trim(self, max_items: int):
+        while len(self.entries) > max_items:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class DatabaseSpill:
+    def __init__(self):
+        from app.database.db import create_session
+        from app.database.models import HistoryEntry
+        self.create_session = create_session
+        self.model = HistoryEntry
+        # the history starts empty with every run, like the in memory one
+        with self.create_session() as session:
+            session.query(self.model).delete()
+            session.commit()
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _filtered(self, session, history_filter: HistoryFilter):
+        query = session.query(self.model)
+        if history_filter.status is not None:
+            query = query.filter(self.model.status == history_filter.status)
+        if history_filter.since is not None:
+            query = query.filter(self.model.end_time >= history_filter.since)
+        if history_filter.until is not None:
+            query = query.filter(self.model.end_time <= history_filter.until)
+        return query
+
+    def add(self, items: list[tuple[HistoryRecord, dict]]):
+        with self.create_session() as session:
+            session.add_all([self.model(sequence=record.sequence, prompt_id=record.prompt_id, end_time=record.end_time,
+                                        status=record.status, data=json.dumps(entry)) for record, entry in items])
+            session.commit()
+        self.size += len(items)
+
+    def get(self, prompt_id: str) -> Optional[dict]:
+        with self.create_session() as session:
+            data = session.query(self.model.data).filter(self.model.prompt_id == prompt_id).scalar()
+        return json.loads(data) if data is not None else None
+
+    def count(self, history_filter: HistoryFilter) -> int:
+        if history_filter == HistoryFilter():
+            return self.size
+        with self.create_session() as session:
+            return self._filtered(session, history_filter).count()
+
+    def query(self, history_filter: HistoryFilter, offset: int, limit: int) -> list[tuple[str, dict]]:
+        with self.create_session() as session:
+            rows = self._filtered(session, history_filter).order_by(self.model.sequence).offset(offset).limit(limit).with_entities(self.model.prompt_id, self.model.data).all()
+        return [(prompt_id, json.loads(data)) for prompt_id, data in rows]
+
+    def delete(self, prompt_id: str):
+        with self.create_session() as session:
+            self.size -= session.query(self.model).filter(self.model.prompt_id == prompt_id).delete()
+            session.commit()
+
+    def trim(self, max_items: int):
+        if self.size <= max_items:
+            return
+        with self.create_session() as session:
+            newest_removed = session.query(self.model.sequence).order_by(self.model.sequence.desc()).offset(max_items).limit(1).scalar()
+            if newest_removed is not None:
+                self.size -= session.query(self.model).filter(self.model.sequence <= newest_removed).delete()
+                session.commit()
+
+    def clear(self):
+        with self.create_session() as session:
+            session.query(self.model).delete()
+            session.commit()
+        self.size = 0
+
+
+class HistoryStore:
+    """
+    The history of finished prompts, oldest first. At most max_items entries are kept, memory_items of them in
+    memory. Entries must not be modified once they are stored, they are returned without copying them.
+    """
+
+    def __init__(self, max_items: int, memory_items: int):
+        self.max_items = max_items
+        self.memory_items = memory_items
+        self.recent: dict[str, dict] = {}
+        self.records: dict[str, HistoryRecord] = {}
+        self.spill: Optional[MemorySpill | DatabaseSpill] = None
+        self.sequence = 0
+
+    def __len__(self) -> int:
+        return len(self.recent) + (len(self.spill) if self.spill is not None else 0)
+
+    def __contains__(self, prompt_id: str) -> bool:
+        return self.get(prompt_id) is not None
+
+    def _get_spill(self) -> MemorySpill | DatabaseSpill:
+        if self.spill is None:
+            try:
+                # imported here like in DatabaseSpill, the database is optional
+                from app.database.db import can_create_session
+                if can_create_session():
+                    self.spill = DatabaseSpill()
+            except Exception as e:
+                logging.warning(f"Failed to use the database for the history, older entries are kept compressed in memory: {e}")
+            if self.spill is None:
+                self.spill = MemorySpill()
+        return self.spill
+
+    def put(self, prompt_id: str, entry: dict):
+        self.delete(prompt_id)
+        self.sequence += 1
+        status = entry.get("status")
+        status_str = status.get("status_str") if isinstance(status, dict) else None
+        self.recent[prompt_id] = entry
+        self.records[prompt_id] = HistoryRecord(self.sequence, prompt_id, int(time.time() * 1000), status_str)
+
+        if len(self.recent) > self.memory_items:
+            items = []
+            while len(self.recent) > self.memory_items:
+                oldest = next(iter(self.recent))
+                items.append((self.records.pop(oldest), self.recent.pop(oldest)))
+            spill = self._get_spill()
+            try:
+                spill.add(items)
+                spill.trim(max(self.max_items - len(self.recent), 0))
+            except Exception as e:
+                logging.error(f"Failed to move history entries out of memory, they are dropped: {e}")
+
+    def get(self, prompt_id: str) -> Optional[dict]:
+        entry = self.recent.get(prompt_id)
+        if entry is None and self.spill is not None:
+            entry = self.spill.get(prompt_id)
+        return entry
+
+    def query(self, max_items: Optional[int] = None, offset: int = -1, history_filter: HistoryFilter = HistoryFilter(),
+              map_function: Optional[Callable[[dict], dict]] = None) -> dict[str, dict]:
+        """
+        Returns up to max_items matching entries starting at offset, in the order they were stored. A negative
+        offset returns the newest max_items entries.
+        """
+        recent_ids = [prompt_id for prompt_id, record in self.records.items() if history_filter.matches(record)]
+        spill_count = self.spill.count(history_filter) if self.spill is not None else 0
+        total = spill_count + len(recent_ids)
+        if offset < 0:
+            offset = max(total - max_items, 0) if max_items is not None else 0
+        limit = total if max_items is None else max_items
+
+        out = {}
+        if offset < spill_count and limit > 0:
+            for prompt_id, entry in self.spill.query(history_filter, offset, limit):
+                out[prompt_id] = entry
+        start = max(offset - spill_count, 0)
+        for prompt_id in recent_ids[start:start + limit - len(out)]:
+            out[prompt_id] = self.recent[prompt_id]
+
+        if map_function is not None:
+            out = {prompt_id: map_function(entry) for prompt_id, entry in out.items()}
+        return out
+
+    def delete(self, prompt_id: str):
+        if self.recent.pop(prompt_id, None) is not None:
+            self.records.pop(prompt_id)
+        elif self.spill is not None:
+            self.spill.delete(prompt_id)
+
+    def clear(self):
+        self.recent.clear()
+        self.records.clear()
+        if self.spill is not None:
+            self.spill.clear()
@@ -0,0 +1,107 @@
+"""
+Registered prompt templates, for clients that queue the same graph over and over with different widget values.
+
+A client registers the full prompt once with POST /prompt_templates. Afterwards, it queues the template with
+POST /prompt and {"template_id": ..., "inputs": {node_id: {input_name: value}}}, which sends only the values
+that changed. Only the nodes whose inputs changed and the nodes downstream of them are validated again. The
+other nodes reuse the validation done at registration.
+
+A delta can only change the constant inputs of existing nodes. The links between the nodes are the template's.
+"""
+from __future__ import annotations
+from typing import Optional
+import collections
+import hashlib
+import json
+import threading
+
+from comfy_execution.graph_utils import is_link
+
+
+class PromptTemplateError(ValueError):
+    pass
+
+
+class PromptTemplate:
+    def __init__(self, template_id: str, prompt: dict, partial_execution_targets: Optional[list[str]], validated: dict):
+        self.template_id = template_id
+        self.prompt = prompt
+        self.partial_execution_targets = partial_execution_targets
+        # node id -> the result of execution.validate_inputs() for the registered prompt
+        self.validated = validated
+        self.descendants: dict[str, set[str]] = collections.defaultdict(set)
+        for node_id, node in prompt.items():
+            for value in node["inputs"].values():
+                if is_link(value):
+                    self.descendants[value[0]].add(node_id)
+
+    def get_affected_nodes(self, node_ids) -> set[str]:
+        """Returns node_ids and all the nodes downstream of them."""
+        affected = set()
+        to_visit = list(node_ids)
+        while len(to_visit) > 0:
+            node_id = to_visit.pop()
+            if node_id in affected:
+                continue
+            affected.add(node_id)
+            to_visit.extend(self.descendants.get(node_id, ()))
+        return affected
+
+    def instantiate(self, deltas: dict[str, dict]) -> tuple[dict, dict]:
+        """
+        Returns a prompt with the input values of deltas applied and the validation results it can reuse. Every node
+        is a copy since the execution stores IS_CHANGED results in them, the inputs are only copied for the nodes
+        that have to be validated again, which may convert their values.
+        """
+        for node_id, inputs in deltas.items():
+            node = self.prompt.get(node_id)
+            if node is None:
+                raise PromptTemplateError(f"Node {node_id} is not in the template")
+            if not isinstance(inputs, dict):
+                raise PromptTemplateError(f"The inputs of node {node_id} must be an object")
+            for input_name, value in inputs.items():
+                if is_link(node["inputs"].get(input_name)) or is_link(value):
+                    raise PromptTemplateError(f"Input {input_name} of node {node_id} is a link, templates can only change constant inputs")
+
+        affected = self.get_affected_nodes(deltas.keys())
+        prompt = {}
+        for node_id, node in self.prompt.items():
+            node = {k: v for k, v in node.items() if k != "is_changed"}
+            if node_id in affected:
+                node["inputs"] = {**node["inputs"], **deltas.get(node_id, {})}
+            prompt[node_id] = node
+        validated = {node_id: result for node_id, result in self.validated.items() if node_id not in affected}
+        return prompt, validated
+
+
+class PromptTemplates:
+    """The registered templates, the least recently used ones are dropped beyond max_templates."""
+
+    def __init__(self, max_templates: int = 256):
+        self.max_templates = max_templates
+        self.lock = threading.Lock()
+        self.templates: collections.OrderedDict[str, PromptTemplate] = collections.OrderedDict()
+
+    @staticmethod
+    def get_template_id(prompt: dict, partial_execution_targets: Optional[list[str]]) -> str:
+        """The same graph with the same values always gets the same id, registering it again is a no-op."""
+        data = json.dumps([prompt, partial_execution_targets], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(data.encode()).hexdigest()[:32]
+
+    def get(self, template_id: str) -> Optional[PromptTemplate]:
+        with self.lock:
+            template = self.templates.get(template_id)
+            if template is not None:
+                self.templates.move_to_end(template_id)
+            return template
+
+    def put(self, template: PromptTemplate):
+        with self.lock:
+            self.templates[template.template_id] = template
+            self.templates.move_to_end(template.template_id)
+            while len(self.templates) > self.max_templates:
+                self.templates.popitem(last=False)
+
+    def delete(self, template_id: str) -> bool:
+        with self.lock:
+            return self.templates.pop(template_id, None) is not None
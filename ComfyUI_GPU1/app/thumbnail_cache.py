@@ -0,0 +1,92 @@
+import collections
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Optional
+
+
+class ThumbnailCache:
+    """
+    On disk LRU cache for the images /view re-encodes for the preview and channel query parameters.
+
+    Entries are keyed by the source file's path, mtime and size together with the encoding parameters, so a
+    changed source file never hits an old entry. The least recently used entries are removed once the cache
+    grows past max_bytes.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries: collections.OrderedDict[str, int] = collections.OrderedDict()
+        self.total_bytes = 0
+        self._load()
+
+    def _load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(".tmp"):
+                os.remove(entry.path)
+                continue
+            stat = entry.stat()
+            files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total_bytes += size
+        self._evict()
+
+    @staticmethod
+    def get_key(path: str, stat: os.stat_result, **params) -> str:
+        return hashlib.sha256(json.dumps([os.path.abspath(path), stat.st_mtime_ns, stat.st_size, sorted(params.items())]).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+        path = os.path.join(self.directory, key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # keep the recency across restarts
+            os.utime(path)
+            return data
+        except OSError:
+            with self.lock:
+                size = self.entries.pop(key, None)
+                if size is not None:
+                    self.total_bytes -= size
+            return None
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        path = os.path.join(self.directory, key)
+        try:
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logging.warning(f"Failed to write thumbnail cache entry: {e}")
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= previous
+            self.entries[key] = len(data)
+            self.total_bytes += len(data)
+            self._evict()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self.entries) > 0:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(os.path.join(self.directory, key))
+            except OSError:
+                pass
@@ -100,11 +100,18 @@ class LatentPreviewMethod(enum.Enum):
 parser.add_argument("--preview-method", type=LatentPreviewMethod, default=LatentPreviewMethod.NoPreviews, help="Default preview method for sampler nodes.", action=EnumAction)
 
 parser.add_argument("--preview-size", type=int, default=512, help="Sets the maximum preview size for sampler nodes.")
+parser.add_argument("--preview-format", type=str.upper, default="JPEG", choices=["JPEG", "PNG", "WEBP"], help="Image format of the sampler previews sent to the frontend. WEBP is only sent to clients with the supports_webp_previews feature flag, the others get JPEG.")
+parser.add_argument("--preview-quality", type=int, default=95, help="Quality of JPEG and WEBP previews, from 0 to 100.")
 
 cache_group = parser.add_mutually_exclusive_group()
 cache_group.add_argument("--cache-classic", action="store_true", help="Use the old style (aggressive) caching.")
 cache_group.add_argument("--cache-lru", type=int, default=0, help="Use LRU caching with a maximum of N node results cached. May use more RAM/VRAM.")
 cache_group.add_argument("--cache-none", action="store_true", help="Reduced RAM/VRAM usage at the expense of executing every node for each run.")
+parser.add_argument("--cache-pin-prompts", type=int, default=0, metavar="N", help="With the classic cache, also keep the node results that the next N queued and the last N executed prompts use, instead of only the ones of the current prompt. Lets prompts of a graph that run different outputs reuse each other's intermediate results while prompts of other graphs run in between. May use more RAM/VRAM.")
+
+parser.add_argument("--sampling-checkpoint-cache-mb", type=int, default=0, help="Keep up to N MB of intermediate sampling latents in RAM so that later jobs with the same model, conds, latent, noise and sampler can resume from the deepest shared step instead of step 0. Only applies to deterministic single step samplers.")
+parser.add_argument("--sampler-snapshot-interval", type=float, default=0, metavar="SECONDS", help="Write the latent of the running sampler to disk every SECONDS seconds. The prompts that were running when the server stopped are queued again on startup, at most 3 times, and their samplers continue from their last snapshot. Applies to euler, heun, dpm_2, euler_ancestral and dpm_2_ancestral (with their noise generator state), dpmpp_2m and uni_pc (by replaying the model outputs of the earlier steps). 0 disables it.")
+parser.add_argument("--sampler-snapshot-directory", type=str, default=None, help="Directory of the sampler snapshots, defaults to sampler_snapshots in the user directory. Every ComfyUI process needs its own.")
 
 attn_group = parser.add_mutually_exclusive_group()
 attn_group.add_argument("--use-split-cross-attention", action="store_true", help="Use the split cross attention optimization. Ignored when xformers is used.")
@@ -155,6 +162,8 @@ parser.add_argument("--quick-test-for-ci", action="store_true", help="Quick test
 parser.add_argument("--windows-standalone-build", action="store_true", help="Windows standalone build: Enable convenient things that most people using the standalone windows build will probably enjoy (like auto opening the page on startup).")
 
 parser.add_argument("--disable-metadata", action="store_true", help="Disable saving prompt metadata in files.")
+parser.add_argument("--output-writer-threads", type=int, default=2, help="Number of background threads encoding and writing the files of save nodes so the next node can run right away. 0 writes files on the prompt worker thread.")
+parser.add_argument("--output-writer-max-mb", type=int, default=2048, help="Maximum MB of image data waiting for the background output writer. Save nodes wait when the limit is reached.")
 parser.add_argument("--disable-all-custom-nodes", action="store_true", help="Disable loading all custom nodes.")
 parser.add_argument("--whitelist-custom-nodes", type=str, nargs='+', default=[], help="Specify custom node folders to load even when --disable-all-custom-nodes is enabled.")
 parser.add_argument("--disable-api-nodes", action="store_true", help="Disable loading all api nodes.")
@@ -201,6 +210,15 @@ parser.add_argument(
 parser.add_argument("--user-directory", type=is_valid_directory, default=None, help="Set the ComfyUI user directory with an absolute path. Overrides --base-directory.")
 
 parser.add_argument("--enable-compress-response-body", action="store_true", help="Enable compressing response body.")
+parser.add_argument("--thumbnail-cache-mb", type=int, default=512, help="Maximum size in MB of the on disk cache of the previews /view re-encodes images to. 0 disables the cache.")
+parser.add_argument("--file-index-poll-interval", type=float, default=5.0, help="Seconds between the checks of the model folders for changes inotify doesn't report, like files written to network storage by other machines. 0 disables the checks, without inotify the folders are then checked on every listing.")
+parser.add_argument("--fast-file-fingerprints", action="store_true", help="Fingerprint the files of nodes like LoadImage with xxhash or BLAKE3 (when installed, BLAKE2b otherwise) instead of SHA-256 to tell whether they changed.")
+parser.add_argument("--history-memory-items", type=int, default=64, help="Number of the newest prompt history entries kept in memory. Older entries are moved to the database, or compressed when it isn't available.")
+parser.add_argument("--concurrent-nodes", type=int, default=0, metavar="N", help="Run up to N ready nodes that declare they only need the CPU or IO (EXECUTION_RESOURCES), like image loaders, in a thread pool next to the node running on the GPU. 0 runs one node at a time.")
+parser.add_argument("--model-prefetch-budget", type=float, default=0, metavar="GB", help="While a prompt runs, read the model files of its upcoming loader nodes into the page cache in the background, up to this many GB per prompt. 0 disables it.")
+parser.add_argument("--pipeline-prompts", action="store_true", help="While a prompt executes, prepare the next queued one in a background thread: fingerprint the input files its built-in loaders read, so their IS_CHANGED finds them cached.")
+parser.add_argument("--disable-tracing", action="store_true", help="Don't record the execution traces and metrics served by /trace/{prompt_id} and /metrics.")
+parser.add_argument("--trace-directory", type=str, default=None, help="Also write the execution trace of every prompt to this directory as <prompt_id>.json, viewable in chrome://tracing or Perfetto.")
 
 parser.add_argument(
     "--comfy-api-base",
@@ -1,3 +1,4 @@
+import collections
 import math
 from dataclasses import dataclass
 
@@ -9,14 +10,48 @@ import comfy.ops
 import comfy.ldm.common_dit
 
 
+class RopeCache:
+    """
+    Small LRU cache for rotary embeddings. They only depend on token positions, so they are the same for every
+    step, cond and context window of a sampling run.
+    """
+    def __init__(self, max_size: int = 4):
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+
+    @staticmethod
+    def is_enabled() -> bool:
+        # cached tensors must not end up in an autograd graph (training)
+        return not torch.is_grad_enabled()
+
+    def make_key(self, *key):
+        return key + (torch.is_inference_mode_enabled(),)
+
+    def get(self, key):
+        value = self.entries.get(key, None)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
 class EmbedND(nn.Module):
-    def __init__(self, dim: int, theta: int, axes_dim: list):
+    def __init__(self, dim: int, theta: int, axes_dim: list, cache_size: int = 4):
         super().__init__()
         self.dim = dim
         self.theta = theta
         self.axes_dim = axes_dim
+        self.rope_cache = RopeCache(cache_size)
 
-    def forward(self, ids: Tensor) -> Tensor:
+    def embed(self, ids: Tensor) -> Tensor:
         n_axes = ids.shape[-1]
         emb = torch.cat(
             [rope(ids[..., i], self.axes_dim[i], self.theta) for i in range(n_axes)],
@@ -25,6 +60,18 @@ class EmbedND(nn.Module):
 
         return emb.unsqueeze(1)
 
+    def forward(self, ids: Tensor) -> Tensor:
+        if not self.rope_cache.is_enabled():
+            return self.embed(ids)
+        # ids are much smaller than the embedding, so comparing them is cheaper than recomputing
+        key = self.rope_cache.make_key(tuple(ids.shape), ids.device, ids.dtype)
+        cached = self.rope_cache.get(key)
+        if cached is not None and torch.equal(cached[0], ids):
+            return cached[1]
+        emb = self.embed(ids)
+        self.rope_cache.put(key, (ids.clone(), emb))
+        return emb
+
 
 def timestep_embedding(t: Tensor, dim, max_period=10000, time_factor: float = 1000.0):
     """
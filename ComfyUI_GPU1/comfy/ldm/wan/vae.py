@@ -7,6 +7,7 @@ import torch.nn.functional as F
 from einops import rearrange
 from comfy.ldm.modules.diffusionmodules.model import vae_attention
 
+import comfy.model_management
 import comfy.ops
 ops = comfy.ops.disable_weight_init
 
@@ -440,6 +441,13 @@ def count_conv3d(model):
     return count
 
 
+def throw_exception_if_processing_interrupted(vae):
+    """Checked between the frames of the temporal loops, frees the features cached for the next frame first."""
+    if comfy.model_management.processing_interrupted():
+        vae.clear_cache()
+        comfy.model_management.throw_exception_if_processing_interrupted()
+
+
 class WanVAE(nn.Module):
 
     def __init__(self,
@@ -474,6 +482,7 @@ class WanVAE(nn.Module):
         iter_ = 1 + (t - 1) // 4
         ## 对encode输入的x，按时间拆分为1、4、4、4....
         for i in range(iter_):
+            throw_exception_if_processing_interrupted(self)
             self._enc_conv_idx = [0]
             if i == 0:
                 out = self.encoder(
@@ -497,6 +506,7 @@ class WanVAE(nn.Module):
         iter_ = z.shape[2]
         x = self.conv2(z)
         for i in range(iter_):
+            throw_exception_if_processing_interrupted(self)
             self._conv_idx = [0]
             if i == 0:
                 out = self.decoder(
@@ -5,7 +5,7 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from einops import rearrange
-from .vae import AttentionBlock, CausalConv3d, RMS_norm
+from .vae import AttentionBlock, CausalConv3d, RMS_norm, throw_exception_if_processing_interrupted
 
 import comfy.ops
 ops = comfy.ops.disable_weight_init
@@ -662,6 +662,7 @@ class WanVAE(nn.Module):
         t = x.shape[2]
         iter_ = 1 + (t - 1) // 4
         for i in range(iter_):
+            throw_exception_if_processing_interrupted(self)
             self._enc_conv_idx = [0]
             if i == 0:
                 out = self.encoder(
@@ -685,6 +686,7 @@ class WanVAE(nn.Module):
         iter_ = z.shape[2]
         x = self.conv2(z)
         for i in range(iter_):
+            throw_exception_if_processing_interrupted(self)
             self._conv_idx = [0]
             if i == 0:
                 out = self.decoder(
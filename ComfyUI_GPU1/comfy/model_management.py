@@ -20,6 +20,7 @@ import psutil
 import logging
 from enum import Enum
 from comfy.cli_args import args, PerformanceFeature
+import comfy.tracing
 import torch
 import sys
 import importlib
@@ -483,6 +484,7 @@ class LoadedModel:
         else:
             return self.model_memory()
 
+    @comfy.tracing.traced("model_load", "model")
     def model_load(self, lowvram_model_memory=0, force_patch_weights=False):
         self.model.model_patches_to(self.device)
         self.model.model_patches_to(self.model.model_dtype())
@@ -507,6 +509,7 @@ class LoadedModel:
             return True
         return False
 
+    @comfy.tracing.traced("model_unload", "model")
     def model_unload(self, memory_to_free=None, unpatch_weights=True):
         if memory_to_free is not None:
             if memory_to_free < self.model.loaded_size():
@@ -602,6 +605,7 @@ def free_memory(memory_required, device, keep_loaded=[]):
                 soft_empty_cache()
     return unloaded_models
 
+@comfy.tracing.traced("load_models_gpu", "model")
 def load_models_gpu(models, memory_required=0, force_patch_weights=False, minimum_memory_required=None, force_full_load=False):
     cleanup_models_gc()
     global vram_state
@@ -696,6 +696,8 @@ class ModelPatcher:
                     if m.comfy_patched_weights == True:
                         continue
 
+                # an interrupted load is undone by the caller, see partially_load()
+                comfy.model_management.throw_exception_if_processing_interrupted()
                 for param in params:
                     self.patch_weight_to_device("{}.{}".format(n, param), device_to=device_to)
 
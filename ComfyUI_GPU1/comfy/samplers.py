@@ -17,6 +17,8 @@ import comfy.model_patcher
 import comfy.patcher_extension
 import comfy.hooks
 import comfy.context_windows
+import comfy.sampling_cache
+import comfy.tracing
 import comfy.utils
 import scipy.stats
 import numpy
@@ -749,14 +751,31 @@ class KSAMPLER(Sampler):
         else:
             model_k.noise = noise
 
-        noise = model_wrap.inner_model.model_sampling.noise_scaling(sigmas[0], noise, latent_image, self.max_denoise(model_wrap, sigmas))
+        checkpoints = comfy.sampling_cache.SamplingCheckpoints.create(self, model_wrap, sigmas, noise, latent_image, denoise_mask, extra_args.get("seed", None))
+        start_step, x = (0, None) if checkpoints is None else checkpoints.resume()
+        if x is not None:
+            noise = x.to(device=noise.device, dtype=noise.dtype)
+        else:
+            noise = model_wrap.inner_model.model_sampling.noise_scaling(sigmas[0], noise, latent_image, self.max_denoise(model_wrap, sigmas))
+
+        sampler_model, extra_options = model_k, self.extra_options
+        if checkpoints is not None:
+            sampler_model, extra_options = checkpoints.wrap(model_k, noise, extra_options)
 
         k_callback = None
         total_steps = len(sigmas) - 1
-        if callback is not None:
-            k_callback = lambda x: callback(x["i"], x["denoised"], x["x"], total_steps)
-
-        samples = self.sampler_function(model_k, noise, sigmas, extra_args=extra_args, callback=k_callback, disable=disable_pbar, **self.extra_options)
+        if callback is not None or checkpoints is not None:
+            def k_callback(x):
+                if checkpoints is not None:
+                    if checkpoints.replaying:
+                        return
+                    checkpoints.store(start_step + x["i"], x["x"])
+                if callback is not None:
+                    callback(start_step + x["i"], x["denoised"], x["x"], total_steps)
+
+        samples = self.sampler_function(sampler_model, noise, sigmas[start_step:], extra_args=extra_args, callback=k_callback, disable=disable_pbar, **extra_options)
+        if checkpoints is not None:
+            checkpoints.store(total_steps, samples)
         samples = model_wrap.inner_model.model_sampling.inverse_noise_scaling(sigmas[-1], samples)
         return samples
 
@@ -973,7 +992,8 @@ class CFGGuider:
         if latent_image is not None and torch.count_nonzero(latent_image) > 0: #Don't shift the empty latent image.
             latent_image = self.inner_model.process_latent_in(latent_image)
 
-        self.conds = process_conds(self.inner_model, noise, self.conds, device, latent_image, denoise_mask, seed)
+        with comfy.tracing.span("process_conds", "sampler"):
+            self.conds = process_conds(self.inner_model, noise, self.conds, device, latent_image, denoise_mask, seed)
 
         extra_model_options = comfy.model_patcher.create_model_options_clone(self.model_options)
         extra_model_options.setdefault("transformer_options", {})["sample_sigmas"] = sigmas
@@ -988,7 +1008,8 @@ class CFGGuider:
         return self.inner_model.process_latent_out(samples.to(torch.float32))
 
     def outer_sample(self, noise, latent_image, sampler, sigmas, denoise_mask=None, callback=None, disable_pbar=False, seed=None):
-        self.inner_model, self.conds, self.loaded_models = comfy.sampler_helpers.prepare_sampling(self.model_patcher, noise.shape, self.conds, self.model_options)
+        with comfy.tracing.span("prepare_sampling", "sampler"):
+            self.inner_model, self.conds, self.loaded_models = comfy.sampler_helpers.prepare_sampling(self.model_patcher, noise.shape, self.conds, self.model_options)
         device = self.model_patcher.load_device
 
         if denoise_mask is not None:
@@ -1001,7 +1022,8 @@ class CFGGuider:
 
         try:
             self.model_patcher.pre_run()
-            output = self.inner_sample(noise, latent_image, device, sampler, sigmas, denoise_mask, callback, disable_pbar, seed)
+            with comfy.tracing.span("sample", "sampler", sampler=type(sampler).__name__, steps=sigmas.shape[-1] - 1):
+                output = self.inner_sample(noise, latent_image, device, sampler, sigmas, denoise_mask, callback, disable_pbar, seed)
         finally:
             self.model_patcher.cleanup()
 
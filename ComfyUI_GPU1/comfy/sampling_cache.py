@@ -0,0 +1,465 @@
+"""
+Sampling checkpoint cache.
+
+Jobs that share the same model, conds, latent, noise and sampler and only differ in the later part of their
+sigma schedule (end step, extra steps, ...) produce the exact same intermediate latents for the shared part of
+the schedule. The cache snapshots the latent at every step of a run and lets a later run resume from the deepest
+snapshot whose sigma prefix matches its own schedule.
+
+Only samplers whose state at step i is fully described by the latent at step i can be resumed exactly, so
+multistep and stochastic samplers are never cached.
+
+The same snapshots can also be written to disk every few seconds (--sampler-snapshot-interval). A prompt that was
+running when the server process died is then queued again when it starts, and its samplers continue from their
+last snapshot instead of step 0. The snapshots on disk also hold the rest of the sampler state: the noise generator
+state of ancestral samplers, and the model outputs of multistep samplers, which are replayed through the sampler to
+rebuild its history.
+"""
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any, Optional
+import collections
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+import torch
+import comfy.value_serialization
+from comfy.cli_args import args
+if TYPE_CHECKING:
+    from comfy.samplers import KSAMPLER
+
+
+# single step, deterministic k-diffusion samplers whose step i only reads sigmas[i] and sigmas[i + 1], so running them
+# on sigmas[k:] from the latent of step k gives the same result as the full run (heunpp2 reads sigmas[0] and sigmas[-1])
+RESUMABLE_SAMPLER_FUNCTIONS = {"sample_euler", "sample_heun", "sample_dpm_2"}
+
+# ancestral samplers that take a noise_sampler, they get one drawing from a generator seeded like k-diffusion's
+# default_noise_sampler and the generator state is snapshotted along with the latent
+ANCESTRAL_SAMPLER_FUNCTIONS = {"sample_euler_ancestral", "sample_dpm_2_ancestral"}
+
+# multistep samplers whose model calls have no side effects. Their history (old_denoised, uni_pc's model_prev_list)
+# depends on every step before, so their snapshots hold the model outputs so far and a resumed run replays them
+# through the sampler from step 0, which rebuilds the history without evaluating the model
+REPLAYABLE_SAMPLER_FUNCTIONS = {"sample_dpmpp_2m", "sample_unipc", "sample_unipc_bh2"}
+
+
+def _hash_tensor(h, tensor: torch.Tensor):
+    tensor = tensor.detach().to("cpu").contiguous()
+    h.update(f"{tensor.dtype}{tuple(tensor.shape)}".encode())
+    h.update(tensor.reshape(-1).view(torch.uint8).numpy())
+
+
+def _update_signature(h, obj, depth=0, stable=False):
+    if depth > 16:
+        h.update(b"<deep>")
+    elif obj is None or isinstance(obj, (bool, int, float, str)):
+        h.update(repr(obj).encode())
+    elif isinstance(obj, torch.Tensor):
+        _hash_tensor(h, obj)
+    elif isinstance(obj, dict):
+        h.update(b"{")
+        for k in sorted(obj.keys(), key=repr):
+            # uuids are regenerated every time conds are converted, they don't affect results
+            if k == "uuid" or isinstance(obj[k], uuid.UUID):
+                continue
+            h.update(repr(k).encode())
+            _update_signature(h, obj[k], depth + 1, stable)
+        h.update(b"}")
+    elif isinstance(obj, (list, tuple)):
+        h.update(b"[")
+        for v in obj:
+            _update_signature(h, v, depth + 1, stable)
+        h.update(b"]")
+    elif hasattr(obj, "cond") and isinstance(obj.cond, torch.Tensor):
+        # CONDRegular and subclasses
+        h.update(type(obj).__name__.encode())
+        _hash_tensor(h, obj.cond)
+    elif not stable:
+        # functions, models, control objects... only identical instances match
+        h.update(f"{type(obj).__qualname__}@{id(obj)}".encode())
+    elif callable(obj) and hasattr(obj, "__qualname__"):
+        # functions and classes
+        h.update(f"{getattr(obj, '__module__', None)}.{obj.__qualname__}".encode())
+    else:
+        # patches, control objects, clip vision outputs... are matched by their class and their plain attributes
+        h.update(f"{type(obj).__module__}.{type(obj).__qualname__}".encode())
+        attributes = getattr(obj, "__dict__", {})
+        for k in sorted(attributes):
+            v = attributes[k]
+            if v is None or isinstance(v, (bool, int, float, str, torch.Tensor)):
+                h.update(k.encode())
+                _update_signature(h, v, depth + 1, stable)
+
+
+def get_signature(*objs) -> str:
+    h = hashlib.sha256()
+    for obj in objs:
+        _update_signature(h, obj)
+    return h.hexdigest()
+
+
+def get_stable_signature(*objs) -> str:
+    """
+    Like get_signature(), but the same in every process: objects other than tensors and plain data are hashed by
+    their class and their plain attributes instead of their identity.
+    """
+    h = hashlib.sha256()
+    for obj in objs:
+        _update_signature(h, obj, stable=True)
+    return h.hexdigest()
+
+
+class SamplingCheckpointCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.entries: collections.OrderedDict[tuple[str, tuple[float, ...]], torch.Tensor] = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def put(self, job_key: str, sigma_prefix: tuple[float, ...], x: torch.Tensor):
+        size = x.numel() * x.element_size()
+        if size > self.max_bytes:
+            return
+        key = (job_key, sigma_prefix)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return
+            while self.current_bytes + size > self.max_bytes and len(self.entries) > 0:
+                _, evicted = self.entries.popitem(last=False)
+                self.current_bytes -= evicted.numel() * evicted.element_size()
+            self.entries[key] = x
+            self.current_bytes += size
+
+    def get_deepest(self, job_key: str, sigmas: list[float]) -> tuple[int, torch.Tensor | None]:
+        """
+        Returns (step index, latent) of the deepest checkpoint matching the sigmas, or (0, None).
+        """
+        with self.lock:
+            for step in range(len(sigmas) - 1, 0, -1):
+                key = (job_key, tuple(sigmas[:step + 1]))
+                x = self.entries.get(key, None)
+                if x is not None:
+                    self.entries.move_to_end(key)
+                    return step, x
+        return 0, None
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+
+_cache: SamplingCheckpointCache | None = None
+
+
+def get_cache() -> SamplingCheckpointCache | None:
+    global _cache
+    if _cache is None:
+        if args.sampling_checkpoint_cache_mb <= 0:
+            return None
+        _cache = SamplingCheckpointCache(args.sampling_checkpoint_cache_mb * 1024 * 1024)
+    return _cache
+
+
+def set_cache(cache: SamplingCheckpointCache | None):
+    global _cache
+    _cache = cache
+
+
+class SamplerSnapshots:
+    """
+    Sampling snapshots on disk, in a directory per running prompt that also holds the prompt. The directory is
+    deleted when the prompt ends, so the ones left at startup belong to the prompts a restart interrupted.
+
+    A prompt that stops the server itself would be queued again on every start, it's dropped once it was queued
+    again max_attempts times.
+    """
+    def __init__(self, directory: str, interval: float, max_attempts: int = 3):
+        self.directory = directory
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.prompt_id: Optional[str] = None
+        self.prompt_data: Optional[dict[str, Any]] = None
+        self.prompt_written = False
+        # snapshot key -> time of the last snapshot, or of the first step
+        self.last_write: dict[str, float] = {}
+
+    def _prompt_directory(self, prompt_id: str) -> str:
+        if re.fullmatch(r"[\w\-]+", prompt_id) is None:
+            prompt_id = hashlib.sha256(prompt_id.encode()).hexdigest()
+        return os.path.join(self.directory, prompt_id)
+
+    def begin_prompt(self, prompt_id: str, prompt: dict, extra_data: dict, outputs_to_execute: list):
+        """Nothing is written until a sampler of the prompt runs for longer than the interval."""
+        self.prompt_id = prompt_id
+        self.prompt_data = {"prompt_id": prompt_id, "prompt": prompt, "extra_data": extra_data, "outputs_to_execute": outputs_to_execute}
+        # a prompt queued again after a restart keeps its prompt.json and the attempts counted in it
+        self.prompt_written = os.path.isfile(os.path.join(self._prompt_directory(prompt_id), "prompt.json"))
+        self.last_write = {}
+
+    def end_prompt(self):
+        # also deletes the snapshots a prompt queued again after a restart resumed from
+        if self.prompt_id is not None:
+            shutil.rmtree(self._prompt_directory(self.prompt_id), ignore_errors=True)
+        self.prompt_id = None
+        self.prompt_data = None
+
+    def _write_prompt(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        data = dict(self.prompt_data)
+        # IS_CHANGED is evaluated again when the prompt runs again
+        data["prompt"] = {node_id: {k: v for k, v in node.items() if k != "is_changed"} for node_id, node in data["prompt"].items()}
+        self._write_json(os.path.join(directory, "prompt.json"), data)
+        self.prompt_written = True
+
+    def _write_json(self, path: str, data: dict[str, Any]):
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(path + ".tmp", path)
+
+    def save(self, key: str, step: int, sigmas: list[float], x: torch.Tensor, state: Optional[dict[str, Any]] = None):
+        """state holds the rest of the sampler state at the step, tensors and plain data."""
+        if self.prompt_id is None:
+            return
+        now = time.monotonic()
+        if now - self.last_write.setdefault(key, now) < self.interval:
+            return
+        self.last_write[key] = now
+        directory = self._prompt_directory(self.prompt_id)
+        try:
+            if not self.prompt_written:
+                self._write_prompt(directory)
+            path = os.path.join(directory, f"{key}.safetensors")
+            comfy.value_serialization.save(dict(state or {}, x=x.detach().to("cpu"), step=step, sigmas=sigmas), path + ".tmp")
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logging.warning(f"Failed to write the sampling snapshot of prompt {self.prompt_id}: {e}")
+
+    def load(self, key: str, sigmas: list[float]) -> tuple[int, torch.Tensor | None, dict[str, Any]]:
+        """Returns the step, latent and state of the snapshot matching the sigmas, or (0, None, {})."""
+        if self.prompt_id is None:
+            return 0, None, {}
+        path = os.path.join(self._prompt_directory(self.prompt_id), f"{key}.safetensors")
+        if not os.path.isfile(path):
+            return 0, None, {}
+        try:
+            snapshot = comfy.value_serialization.load(path, mmap_file=False)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Failed to read the sampling snapshot {path}: {e}")
+            return 0, None, {}
+        step = snapshot.pop("step")
+        if snapshot.pop("sigmas") != sigmas[:step + 1]:
+            return 0, None, {}
+        return step, snapshot.pop("x"), snapshot
+
+    def get_interrupted_prompts(self) -> list[dict[str, Any]]:
+        """Returns the prompts that were running when the server stopped, oldest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        prompts = []
+        for entry in os.scandir(self.directory):
+            path = os.path.join(entry.path, "prompt.json")
+            if not entry.is_dir() or not os.path.isfile(path):
+                continue
+            try:
+                with open(path, encoding="utf-8") as f:
+                    prompts.append((entry.stat().st_mtime, json.load(f)))
+            except (OSError, ValueError) as e:
+                logging.warning(f"Failed to read the interrupted prompt {path}: {e}")
+        prompts.sort(key=lambda p: p[0])
+        return [p[1] for p in prompts]
+
+    def count_attempt(self, prompt_data: dict[str, Any]) -> bool:
+        """
+        Counts that an interrupted prompt is queued again. Returns False and deletes its snapshots when it already
+        was queued again max_attempts times.
+        """
+        directory = self._prompt_directory(prompt_data["prompt_id"])
+        attempts = prompt_data.get("attempts", 0)
+        if attempts >= self.max_attempts:
+            logging.warning(f"Not queueing prompt {prompt_data['prompt_id']} again, the server stopped while it was running {attempts + 1} times.")
+            shutil.rmtree(directory, ignore_errors=True)
+            return False
+        try:
+            self._write_json(os.path.join(directory, "prompt.json"), dict(prompt_data, attempts=attempts + 1))
+        except OSError as e:
+            # without the count it could be queued again forever
+            logging.warning(f"Not queueing prompt {prompt_data['prompt_id']} again, failed to count the attempt: {e}")
+            return False
+        return True
+
+
+_snapshots: SamplerSnapshots | None = None
+
+
+def get_snapshots() -> SamplerSnapshots | None:
+    return _snapshots
+
+
+def set_snapshots(snapshots: SamplerSnapshots | None):
+    global _snapshots
+    _snapshots = snapshots
+
+
+class GeneratorNoiseSampler:
+    """
+    k-diffusion's default_noise_sampler for a seed, with the generator kept around so its state can be saved and
+    restored.
+    """
+    def __init__(self, x: torch.Tensor, seed: int):
+        self.size = x.size()
+        self.dtype = x.dtype
+        self.layout = x.layout
+        self.device = x.device
+        self.generator = torch.Generator(device=x.device)
+        self.generator.manual_seed(seed)
+
+    def __call__(self, sigma, sigma_next):
+        return torch.randn(self.size, dtype=self.dtype, layout=self.layout, device=self.device, generator=self.generator)
+
+
+class ReplayModel:
+    """
+    Wraps the model a multistep sampler calls. Records every output, and returns the recorded outputs of a snapshot
+    in place of the first calls.
+    """
+    def __init__(self, model, replay: list[torch.Tensor]):
+        self.model = model
+        self.replay = replay
+        self.history: list[torch.Tensor] = []
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    @property
+    def replaying(self) -> bool:
+        return len(self.history) < len(self.replay)
+
+    def __call__(self, x, sigma, **kwargs):
+        if self.replaying:
+            out = self.replay[len(self.history)]
+            self.history.append(out)
+            return out.to(x.device)
+        out = self.model(x, sigma, **kwargs)
+        self.history.append(out.detach().to("cpu", copy=True))
+        return out
+
+
+class SamplingCheckpoints:
+    """
+    Checkpoints of a single KSAMPLER run.
+    """
+    def __init__(self, cache: SamplingCheckpointCache | None, job_key: str | None, sigmas: list[float], snapshots: SamplerSnapshots | None = None, snapshot_key: str | None = None,
+                 sampler_function: str | None = None, seed: int | None = None):
+        self.cache = cache
+        self.job_key = job_key
+        self.sigmas = sigmas
+        self.snapshots = snapshots
+        self.snapshot_key = snapshot_key
+        self.sampler_function = sampler_function
+        self.seed = seed
+        # sampler state of the snapshot resumed from
+        self.state: dict[str, Any] = {}
+        self.noise_sampler: GeneratorNoiseSampler | None = None
+        self.model: ReplayModel | None = None
+
+    @classmethod
+    def create(cls, sampler: KSAMPLER, model_wrap, sigmas: torch.Tensor, noise: torch.Tensor, latent_image: torch.Tensor, denoise_mask: torch.Tensor, seed) -> SamplingCheckpoints | None:
+        cache = get_cache()
+        snapshots = get_snapshots()
+        if cache is None and snapshots is None:
+            return None
+        sampler_function = getattr(sampler.sampler_function, "__name__", None)
+        if sampler_function in ANCESTRAL_SAMPLER_FUNCTIONS:
+            if seed is None or "noise_sampler" in sampler.extra_options:
+                return None
+        elif sampler_function not in RESUMABLE_SAMPLER_FUNCTIONS and sampler_function not in REPLAYABLE_SAMPLER_FUNCTIONS:
+            return None
+        if sampler.extra_options.get("s_churn", 0) > 0:
+            return None
+        if sampler_function not in RESUMABLE_SAMPLER_FUNCTIONS:
+            # the cache only keeps latents, the other samplers can only resume from snapshots
+            cache = None
+            if snapshots is None:
+                return None
+        model_patcher = getattr(model_wrap, "model_patcher", None)
+        if model_patcher is None:
+            return None
+        job = (
+            model_patcher.model_options,
+            getattr(model_wrap, "cfg", None),
+            getattr(model_wrap, "original_conds", None),
+            sampler_function,
+            sampler.extra_options,
+            sampler.inpaint_options,
+            seed,
+            noise,
+            latent_image,
+            denoise_mask,
+        )
+        job_key = None
+        if cache is not None:
+            job_key = get_signature(type(model_wrap).__qualname__, id(model_patcher.model), str(model_patcher.patches_uuid), *job)
+        snapshot_key = None
+        if snapshots is not None:
+            # the model instance and the patches uuid change with every process, the snapshots of a prompt that runs
+            # again after a restart are matched by the model class, size and the strengths of its patches instead
+            patches = [(k, [(p[0], p[2]) for p in v]) for k, v in sorted(model_patcher.patches.items())]
+            # a multistep sampler's first steps can depend on the whole schedule (uni_pc's order), replayed outputs
+            # are only valid for the same one
+            schedule = sigmas if sampler_function in REPLAYABLE_SAMPLER_FUNCTIONS else None
+            snapshot_key = get_stable_signature(type(model_wrap).__qualname__, type(model_patcher.model).__qualname__, model_patcher.model_size(), patches, schedule, *job)
+        return cls(cache, job_key, sigmas.tolist(), snapshots, snapshot_key, sampler_function, seed)
+
+    def resume(self) -> tuple[int, torch.Tensor | None]:
+        """
+        Returns the step to start at and its latent, or (0, None). Multistep samplers always start at step 0 and
+        replay the model outputs of the snapshot.
+        """
+        step, x = (0, None) if self.cache is None else self.cache.get_deepest(self.job_key, self.sigmas)
+        if x is not None:
+            logging.info(f"Resuming sampling from cached checkpoint at step {step}/{len(self.sigmas) - 1}.")
+        if self.snapshots is not None:
+            snapshot_step, snapshot_x, state = self.snapshots.load(self.snapshot_key, self.sigmas)
+            if snapshot_x is not None and snapshot_step > step:
+                logging.info(f"Resuming sampling from the snapshot written before the restart at step {snapshot_step}/{len(self.sigmas) - 1}.")
+                step, x, self.state = snapshot_step, snapshot_x, state
+        if self.sampler_function in REPLAYABLE_SAMPLER_FUNCTIONS:
+            return 0, None
+        return step, x
+
+    def wrap(self, model, x: torch.Tensor, extra_options: dict[str, Any]) -> tuple[Any, dict[str, Any]]:
+        """Returns the model and the extra options to call the sampler function with, x is the latent it starts from."""
+        if self.sampler_function in ANCESTRAL_SAMPLER_FUNCTIONS:
+            self.noise_sampler = GeneratorNoiseSampler(x, self.seed)
+            if "rng_state" in self.state:
+                self.noise_sampler.generator.set_state(self.state["rng_state"])
+            return model, dict(extra_options, noise_sampler=self.noise_sampler)
+        if self.sampler_function in REPLAYABLE_SAMPLER_FUNCTIONS:
+            self.model = ReplayModel(model, self.state.get("history", []))
+            return self.model, extra_options
+        return model, extra_options
+
+    @property
+    def replaying(self) -> bool:
+        """True while the steps before the snapshot are replayed, their callbacks were already run."""
+        return self.model is not None and self.model.replaying
+
+    def store(self, step: int, x: torch.Tensor):
+        if step <= 0 or self.replaying:
+            return
+        if self.cache is not None:
+            self.cache.put(self.job_key, tuple(self.sigmas[:step + 1]), x.detach().to("cpu", copy=True))
+        if self.snapshots is not None:
+            state = None
+            if self.noise_sampler is not None:
+                state = {"rng_state": self.noise_sampler.generator.get_state()}
+            elif self.model is not None:
+                state = {"history": list(self.model.history)}
+            self.snapshots.save(self.snapshot_key, step, self.sigmas[:step + 1], x, state)
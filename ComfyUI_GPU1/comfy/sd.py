@@ -24,6 +24,7 @@ import math
 import os
 
 import comfy.utils
+import comfy.tracing
 
 from . import clip_vision
 from . import gligen
@@ -633,6 +634,7 @@ class VAE:
         encode_fn = lambda a: self.first_stage_model.encode((self.process_input(a)).to(self.vae_dtype).to(self.device)).float()
         return comfy.utils.tiled_scale_multidim(samples, encode_fn, tile=(tile_t, tile_x, tile_y), overlap=overlap, upscale_amount=self.downscale_ratio, out_channels=self.latent_channels, downscale=True, index_formulas=self.downscale_index_formula, output_device=self.output_device)
 
+    @comfy.tracing.traced("vae_decode", "vae")
     def decode(self, samples_in, vae_options={}):
         self.throw_exception_if_invalid()
         pixel_samples = None
@@ -644,6 +646,7 @@ class VAE:
             batch_number = max(1, batch_number)
 
             for x in range(0, samples_in.shape[0], batch_number):
+                model_management.throw_exception_if_processing_interrupted()
                 samples = samples_in[x:x+batch_number].to(self.vae_dtype).to(self.device)
                 out = self.process_output(self.first_stage_model.decode(samples, **vae_options).to(self.output_device).float())
                 if pixel_samples is None:
@@ -664,6 +667,7 @@ class VAE:
         pixel_samples = pixel_samples.to(self.output_device).movedim(1,-1)
         return pixel_samples
 
+    @comfy.tracing.traced("vae_decode_tiled", "vae")
     def decode_tiled(self, samples, tile_x=None, tile_y=None, overlap=None, tile_t=None, overlap_t=None):
         self.throw_exception_if_invalid()
         memory_used = self.memory_used_decode(samples.shape, self.vae_dtype) #TODO: calculate mem required for tile
@@ -693,6 +697,7 @@ class VAE:
             output = self.decode_tiled_3d(samples, **args)
         return output.movedim(1, -1)
 
+    @comfy.tracing.traced("vae_encode", "vae")
     def encode(self, pixel_samples):
         self.throw_exception_if_invalid()
         pixel_samples = self.vae_encode_crop_pixels(pixel_samples)
@@ -729,6 +734,7 @@ class VAE:
 
         return samples
 
+    @comfy.tracing.traced("vae_encode_tiled", "vae")
     def encode_tiled(self, pixel_samples, tile_x=None, tile_y=None, overlap=None, tile_t=None, overlap_t=None):
         self.throw_exception_if_invalid()
         pixel_samples = self.vae_encode_crop_pixels(pixel_samples)
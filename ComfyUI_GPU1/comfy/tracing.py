@@ -0,0 +1,206 @@
+"""
+Execution tracing.
+
+While a prompt executes, the executor sets a Trace as the current one and the node executions, model loads and
+unloads, sampling and VAE phases are recorded into it as Chrome trace events (chrome://tracing, Perfetto). The
+finished traces of the latest prompts are kept for /trace/{prompt_id} and can be written to --trace-directory, and
+every recorded span is also aggregated into the process wide metrics served by /metrics in the Prometheus text
+format.
+
+Spans outside of a traced prompt cost a context variable lookup, inside of one two clock reads each, so tracing
+is left on by default. It's only recorded at the granularity of nodes and phases, never per step or per layer.
+"""
+from __future__ import annotations
+from typing import Any, Callable, Optional
+import collections
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+MAX_RECENT_TRACES = 64
+
+
+class Trace:
+    """The trace events of one prompt."""
+
+    def __init__(self, prompt_id: str):
+        self.prompt_id = prompt_id
+        self.pid = os.getpid()
+        self.start_ns = time.perf_counter_ns()
+        self.events: list[dict[str, Any]] = []
+
+    def add_complete(self, name: str, category: str, start_ns: int, end_ns: int, args: Optional[dict] = None):
+        event = {"name": name, "cat": category, "ph": "X", "pid": self.pid, "tid": threading.get_ident(),
+                 "ts": (start_ns - self.start_ns) / 1000, "dur": (end_ns - start_ns) / 1000}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def add_instant(self, name: str, category: str, args: Optional[dict] = None):
+        event = {"name": name, "cat": category, "ph": "i", "s": "t", "pid": self.pid, "tid": threading.get_ident(),
+                 "ts": (time.perf_counter_ns() - self.start_ns) / 1000}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"traceEvents": self.events, "displayTimeUnit": "ms", "otherData": {"prompt_id": self.prompt_id}}
+
+
+class Metrics:
+    """Counters and summaries (count and sum) by name and labels, rendered in the Prometheus text format."""
+
+    HELP = {
+        "comfyui_prompts": ("summary", "Executed prompts and their wall time in seconds."),
+        "comfyui_node_executions": ("summary", "Node executions and their wall time in seconds."),
+        "comfyui_node_cpu_seconds": ("counter", "CPU time of the prompt worker thread spent in node executions."),
+        "comfyui_node_cache_results": ("counter", "Node executions answered from the output cache (hit) or executed (miss)."),
+        "comfyui_node_input_bytes": ("counter", "Bytes of the tensors passed to nodes as inputs."),
+        "comfyui_node_output_bytes": ("counter", "Bytes of the tensors returned by nodes."),
+        "comfyui_spans": ("summary", "Model loads and unloads, sampling and VAE phases and their wall time in seconds."),
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values: dict[str, dict[tuple[tuple[str, str], ...], list[float]]] = {}
+
+    def observe(self, name: str, value: float, /, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            entry = self.values.setdefault(name, {}).setdefault(key, [0, 0.0])
+            entry[0] += 1
+            entry[1] += value
+
+    def inc(self, name: str, value: float = 1, /, **labels: str):
+        self.observe(name, value, **labels)
+
+    @staticmethod
+    def _labels(key: tuple[tuple[str, str], ...]) -> str:
+        if len(key) == 0:
+            return ""
+        escaped = (str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, v in key)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(key, escaped)) + "}"
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            for name, series in self.values.items():
+                metric_type, help_text = self.HELP.get(name, ("untyped", ""))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for key, (count, total) in series.items():
+                    labels = self._labels(key)
+                    if metric_type == "summary":
+                        lines.append(f"{name}_count{labels} {count}")
+                        lines.append(f"{name}_sum{labels} {total}")
+                    else:
+                        lines.append(f"{name}{labels} {total}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("current_trace", default=None)
+_recent_traces: collections.OrderedDict[str, Trace] = collections.OrderedDict()
+_recent_traces_lock = threading.Lock()
+
+
+def get_current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def set_current_trace(trace: Optional[Trace]) -> contextvars.Token:
+    return _current_trace.set(trace)
+
+
+def reset_current_trace(token: contextvars.Token):
+    _current_trace.reset(token)
+
+
+class span:
+    """
+    Records the block as a complete event of the current trace and in the comfyui_spans metric. Does nothing when
+    no prompt is traced.
+
+        with tracing.span("vae_decode", "vae", shape=list(samples.shape)):
+            ...
+    """
+    __slots__ = ("name", "category", "args", "trace", "start_ns")
+
+    def __init__(self, name: str, category: str, **args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.trace = None
+
+    def __enter__(self):
+        self.trace = _current_trace.get()
+        if self.trace is not None:
+            self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.trace is None:
+            return
+        end_ns = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.trace.add_complete(self.name, self.category, self.start_ns, end_ns, self.args)
+        metrics.observe("comfyui_spans", (end_ns - self.start_ns) / 1e9, category=self.category, name=self.name)
+
+
+def traced(name: str, category: str) -> Callable[[Callable], Callable]:
+    """Decorator recording every call of the function as a span."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _current_trace.get() is None:
+                return function(*args, **kwargs)
+            with span(name, category):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_node(trace: Trace, node_id: str, class_type: str, start_ns: int, start_cpu_ns: int, cached: bool,
+                result: str, input_bytes: int, output_bytes: int):
+    end_ns = time.perf_counter_ns()
+    cpu_ns = time.thread_time_ns() - start_cpu_ns
+    trace.add_complete(class_type, "node", start_ns, end_ns, {
+        "node_id": node_id, "cached": cached, "result": result, "cpu_ms": cpu_ns / 1e6,
+        "input_bytes": input_bytes, "output_bytes": output_bytes,
+    })
+    metrics.observe("comfyui_node_executions", (end_ns - start_ns) / 1e9, class_type=class_type)
+    metrics.inc("comfyui_node_cpu_seconds", cpu_ns / 1e9, class_type=class_type)
+    metrics.inc("comfyui_node_cache_results", 1, class_type=class_type, result="hit" if cached else "miss")
+    if input_bytes > 0:
+        metrics.inc("comfyui_node_input_bytes", input_bytes, class_type=class_type)
+    if output_bytes > 0:
+        metrics.inc("comfyui_node_output_bytes", output_bytes, class_type=class_type)
+
+
+def finish_trace(trace: Trace, status: str, directory: Optional[str] = None):
+    """Keeps the trace of a finished prompt for get_trace() and writes it to directory when given."""
+    metrics.observe("comfyui_prompts", (time.perf_counter_ns() - trace.start_ns) / 1e9, status=status)
+    with _recent_traces_lock:
+        _recent_traces[trace.prompt_id] = trace
+        _recent_traces.move_to_end(trace.prompt_id)
+        while len(_recent_traces) > MAX_RECENT_TRACES:
+            _recent_traces.popitem(last=False)
+    if directory is not None:
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # prompt ids come from clients
+            filename = "".join(c if c.isalnum() or c in "-_" else "_" for c in trace.prompt_id)
+            with open(os.path.join(directory, f"{filename}.json"), "w") as f:
+                json.dump(trace.to_dict(), f)
+        except OSError as e:
+            logging.warning(f"Failed to write the trace of prompt {trace.prompt_id}: {e}")
+
+
+def get_trace(prompt_id: str) -> Optional[Trace]:
+    with _recent_traces_lock:
+        return _recent_traces.get(prompt_id)
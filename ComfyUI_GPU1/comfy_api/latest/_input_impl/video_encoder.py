@@ -0,0 +1,209 @@
+"""
+Pipelined video encoding.
+
+Turning IMAGE tensors into encoder input (float to uint8, RGB to YUV) is done a batch of frames at a time with
+vectorized torch ops on the device the images are on. The conversion runs in a producer thread and hands
+av.VideoFrames to the encoding thread through a bounded queue, so converting the next batch overlaps with encoding
+the current one while only a few batches are ever held in memory.
+"""
+from __future__ import annotations
+from fractions import Fraction
+from typing import Iterator, Optional
+import av
+import queue
+import threading
+import torch
+import torch.nn.functional as F
+from comfy_api.latest._util import VideoCodec, VideoContainer
+
+
+# PyAV encoder names for each codec, in order of preference
+CODEC_ENCODERS = {
+    VideoCodec.H264: ["libx264", "h264"],
+    VideoCodec.HEVC: ["libx265", "hevc"],
+    VideoCodec.VP9: ["libvpx-vp9", "vp9"],
+    VideoCodec.AV1: ["libsvtav1", "libaom-av1", "librav1e", "av1"],
+}
+
+CONTAINER_FORMATS = {
+    VideoContainer.MP4: "mp4",
+    VideoContainer.WEBM: "webm",
+    VideoContainer.MKV: "matroska",
+}
+
+CONTAINER_AUDIO_ENCODERS = {
+    VideoContainer.MP4: ["aac"],
+    VideoContainer.WEBM: ["libopus", "libvorbis"],
+    VideoContainer.MKV: ["aac"],
+}
+
+_encoder_available: dict[str, bool] = {}
+
+
+def is_encoder_available(name: str) -> bool:
+    if name not in _encoder_available:
+        try:
+            av.codec.Codec(name, "w")
+            _encoder_available[name] = True
+        except Exception:
+            _encoder_available[name] = False
+    return _encoder_available[name]
+
+
+def get_encoder_name(codec: VideoCodec) -> str:
+    for name in CODEC_ENCODERS[codec]:
+        if is_encoder_available(name):
+            return name
+    raise ValueError(f"No encoder available for the {codec.value} codec")
+
+
+def get_audio_encoder_name(container: VideoContainer) -> str:
+    for name in CONTAINER_AUDIO_ENCODERS[container]:
+        if is_encoder_available(name):
+            return name
+    raise ValueError(f"No audio encoder available for the {container.value} container")
+
+
+def resolve_format(format: VideoContainer | str, codec: VideoCodec | str) -> tuple[VideoContainer, VideoCodec]:
+    """
+    Resolves auto values and checks that the codec can be stored in the container.
+    """
+    format = VideoContainer(format)
+    codec = VideoCodec(codec)
+    if format == VideoContainer.AUTO:
+        format = VideoContainer.MP4
+    if codec == VideoCodec.AUTO:
+        codec = VideoContainer.get_default_codec(format)
+    if codec not in VideoContainer.get_supported_codecs(format):
+        raise ValueError(f"The {codec.value} codec is not supported by the {format.value} format")
+    return format, codec
+
+
+def add_video_stream(
+    container: av.container.OutputContainer,
+    codec: VideoCodec,
+    frame_rate: Fraction,
+    width: int,
+    height: int,
+    crf: Optional[float] = None,
+    codec_options: Optional[dict[str, str]] = None,
+    thread_count: int = 0,
+) -> av.VideoStream:
+    """
+    Adds a video stream for the codec. A thread_count of 0 lets the encoder pick the number of threads.
+    """
+    encoder = get_encoder_name(codec)
+    stream = container.add_stream(encoder, rate=frame_rate)
+    stream.width = width
+    stream.height = height
+    stream.pix_fmt = "yuv420p10le" if codec == VideoCodec.AV1 else "yuv420p"
+    options = {}
+    if crf is not None:
+        # constant quality, no bitrate target
+        stream.bit_rate = 0
+        options["crf"] = str(crf)
+    if encoder == "libsvtav1":
+        options["preset"] = "6"
+    if codec_options is not None:
+        options.update({k: str(v) for k, v in codec_options.items()})
+    stream.options = options
+    stream.codec_context.thread_count = thread_count
+    return stream
+
+
+def images_to_uint8(images: torch.Tensor) -> torch.Tensor:
+    """
+    Converts (N, H, W, C) float images in [0, 1] to (N, H, W, 3) uint8 RGB.
+    """
+    return images[..., :3].mul(255).clamp_(0, 255).to(torch.uint8)
+
+
+def images_to_yuv420p(images: torch.Tensor) -> torch.Tensor:
+    """
+    Converts (N, H, W, C) float images in [0, 1] to planar yuv420p (BT.601, limited range, the matrix swscale uses
+    by default), returned as (N, H * 3 / 2, W) uint8 with the Y, U and V planes one after another. The chroma of
+    each 2x2 block is the average of its pixels, swscale filters over a wider area, so fine chroma detail can come
+    out slightly different. H and W must be even.
+    """
+    rgb = images[..., :3].float().clamp(0, 1).movedim(-1, 1)
+    r, g, b = rgb.unbind(1)
+    y = 16.0 + 65.481 * r + 128.553 * g + 24.966 * b
+    r, g, b = F.avg_pool2d(rgb, 2).unbind(1)
+    u = 128.0 - 37.797 * r - 74.203 * g + 112.0 * b
+    v = 128.0 + 112.0 * r - 93.786 * g - 18.214 * b
+    n, h, w = y.shape
+    yuv = torch.cat((y.reshape(n, -1), u.reshape(n, -1), v.reshape(n, -1)), dim=1)
+    return yuv.round_().to(torch.uint8).reshape(n, h * 3 // 2, w)
+
+
+def iter_video_frames(images: torch.Tensor, pix_fmt: str, batch_size: int = 16) -> Iterator[list[av.VideoFrame]]:
+    """
+    Yields batches of av.VideoFrames for the images. Frames are converted to yuv420p directly when that is what
+    the encoder takes, otherwise they are passed as rgb24 and the encoder converts them.
+
+    On the CPU swscale converts to yuv420p several times faster than the float torch ops, there the frames are
+    converted to uint8 one at a time, which keeps the intermediates in cache, and reformatted by swscale.
+    """
+    to_yuv = pix_fmt == "yuv420p" and images.shape[1] % 2 == 0 and images.shape[2] % 2 == 0
+    for start in range(0, images.shape[0], batch_size):
+        batch = images[start:start + batch_size]
+        if batch.device.type == "cpu":
+            frames = [av.VideoFrame.from_ndarray(images_to_uint8(image).numpy(), format="rgb24") for image in batch]
+            if pix_fmt == "yuv420p":
+                frames = [frame.reformat(format="yuv420p") for frame in frames]
+            yield frames
+        elif to_yuv:
+            frames = images_to_yuv420p(batch).cpu().numpy()
+            yield [av.VideoFrame.from_ndarray(frame, format="yuv420p") for frame in frames]
+        else:
+            frames = images_to_uint8(batch).cpu().numpy()
+            yield [av.VideoFrame.from_ndarray(frame, format="rgb24") for frame in frames]
+
+
+def encode_video_frames(
+    container: av.container.OutputContainer,
+    stream: av.VideoStream,
+    images: torch.Tensor,
+    batch_size: int = 16,
+    queue_size: int = 2,
+):
+    """
+    Encodes and muxes the images into the stream, then flushes the encoder. At most queue_size batches of
+    converted frames are waiting for the encoder at any time.
+    """
+    frame_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                frame_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def convert():
+        try:
+            for frames in iter_video_frames(images, stream.pix_fmt, batch_size):
+                if not put(frames):
+                    return
+            put(None)
+        except Exception as e:
+            put(e)
+
+    thread = threading.Thread(target=convert, name="VideoFrameConverter", daemon=True)
+    thread.start()
+    try:
+        while True:
+            frames = frame_queue.get()
+            if frames is None:
+                break
+            if isinstance(frames, Exception):
+                raise frames
+            for frame in frames:
+                container.mux(stream.encode(frame))
+        container.mux(stream.encode(None))
+    finally:
+        stop.set()
+        thread.join()
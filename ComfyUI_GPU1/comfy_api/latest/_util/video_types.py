@@ -8,6 +8,9 @@ from comfy_api.latest._input import ImageInput, AudioInput
 class VideoCodec(str, Enum):
     AUTO = "auto"
     H264 = "h264"
+    HEVC = "hevc"
+    VP9 = "vp9"
+    AV1 = "av1"
 
     @classmethod
     def as_input(cls) -> list[str]:
@@ -19,6 +22,8 @@ class VideoCodec(str, Enum):
 class VideoContainer(str, Enum):
     AUTO = "auto"
     MP4 = "mp4"
+    WEBM = "webm"
+    MKV = "mkv"
 
     @classmethod
     def as_input(cls) -> list[str]:
@@ -36,8 +41,34 @@ class VideoContainer(str, Enum):
             value = cls(value)
         if value == VideoContainer.MP4 or value == VideoContainer.AUTO:
             return "mp4"
+        if value == VideoContainer.WEBM:
+            return "webm"
+        if value == VideoContainer.MKV:
+            return "mkv"
         return ""
 
+    @classmethod
+    def get_default_codec(cls, value) -> VideoCodec:
+        """
+        Returns the codec used when saving to the container with the codec set to auto.
+        """
+        if isinstance(value, str):
+            value = cls(value)
+        if value == VideoContainer.WEBM:
+            return VideoCodec.VP9
+        return VideoCodec.H264
+
+    @classmethod
+    def get_supported_codecs(cls, value) -> list[VideoCodec]:
+        """
+        Returns the codecs that can be stored in the container.
+        """
+        if isinstance(value, str):
+            value = cls(value)
+        if value == VideoContainer.WEBM:
+            return [VideoCodec.VP9, VideoCodec.AV1]
+        return [VideoCodec.H264, VideoCodec.HEVC, VideoCodec.VP9, VideoCodec.AV1]
+
 @dataclass
 class VideoComponents:
     """
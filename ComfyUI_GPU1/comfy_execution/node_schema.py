@@ -0,0 +1,151 @@
+from __future__ import annotations
+from typing import Any, Callable, Literal, NamedTuple, Optional
+import inspect
+import threading
+
+import folder_paths
+from comfy_api.internal import _ComfyNodeInternal, first_real_override
+from comfy_execution.resources import get_node_resources
+
+
+def is_custom_node_class(class_def: type) -> bool:
+    return getattr(class_def, "RELATIVE_PYTHON_MODULE", "nodes").startswith("custom_nodes.")
+
+
+class InputInfo(NamedTuple):
+    input_type: Any
+    category: Literal["required", "optional", "hidden"]
+    extra_info: dict
+    raw_link: bool
+    lazy: bool
+
+
+class NodeSchema:
+    """
+    Everything the executor looks up about a node class: its INPUT_TYPES, the category and flags of every input, the
+    argspec of its validate function and the resources it executes with. Built once per class by get_node_schema() instead of for every node of
+    every prompt, the returned dicts are shared and must not be modified.
+    """
+
+    def __init__(self, class_def: type):
+        self.class_def = class_def
+        self.is_v3 = issubclass(class_def, _ComfyNodeInternal)
+
+        with folder_paths.record_dependencies() as dependencies:
+            if self.is_v3:
+                self.input_types, self.v3_schema = class_def.INPUT_TYPES(include_hidden=True, return_schema=True)
+            else:
+                self.input_types, self.v3_schema = class_def.INPUT_TYPES(), None
+        self.dependencies = dependencies
+
+        self.inputs: dict[str, InputInfo] = {}
+        for category in ("hidden", "optional", "required"):
+            # required wins over optional over hidden, like in graph.get_input_info
+            for name, info in self.input_types.get(category, {}).items():
+                if isinstance(info, str):
+                    # v1 hidden inputs are declared as {"unique_id": "UNIQUE_ID"}
+                    info = (info,)
+                extra_info = info[1] if len(info) > 1 else {}
+                self.inputs[name] = InputInfo(info[0], category, extra_info, bool(extra_info.get("rawLink", False)),
+                                              bool(extra_info.get("lazy", False)))
+        self.valid_inputs = tuple(dict.fromkeys([*self.input_types.get("required", {}), *self.input_types.get("optional", {})]))
+        self.hidden: dict[str, str] = self.input_types.get("hidden", {}) if not self.is_v3 else {}
+
+        if self.is_v3:
+            self.validate_function_name = "validate_inputs"
+            self.validate_function: Optional[Callable] = first_real_override(class_def, self.validate_function_name)
+        else:
+            self.validate_function_name = "VALIDATE_INPUTS"
+            self.validate_function = getattr(class_def, self.validate_function_name, None)
+        self.validate_function_inputs: list[str] = []
+        self.validate_has_kwargs = False
+        if self.validate_function is not None:
+            argspec = inspect.getfullargspec(self.validate_function)
+            self.validate_function_inputs = argspec.args
+            self.validate_has_kwargs = argspec.varkw is not None
+
+        if self.is_v3 and first_real_override(class_def, "fingerprint_inputs") is not None:
+            self.is_changed_name: Optional[str] = "fingerprint_inputs"
+        elif hasattr(class_def, "IS_CHANGED"):
+            self.is_changed_name = "IS_CHANGED"
+        else:
+            self.is_changed_name = None
+
+        self.resources = get_node_resources(class_def)
+
+    def get_input(self, name: str, include_hidden: bool = True) -> Optional[InputInfo]:
+        info = self.inputs.get(name)
+        if info is not None and info.category == "hidden" and not include_hidden:
+            return None
+        return info
+
+    @property
+    def is_custom_node(self) -> bool:
+        return is_custom_node_class(self.class_def)
+
+
+class NodeSchemaCache:
+    """
+    The NodeSchema of every node class that was looked up.
+
+    The options of combos backed by file lists change while the server runs. A schema remembers the model folders
+    and directories its INPUT_TYPES read (see folder_paths.record_dependencies) and refresh() drops it when one of
+    them changed. Custom nodes can read their options from anywhere, their schemas are dropped on every refresh. The
+    executor refreshes once per prompt so a prompt never sees the file lists change halfway through. Validation runs
+    on the event loop and doesn't refresh, it rebuilds a schema when a combo value is missing from its options.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.schemas: dict[type, tuple[NodeSchema, Optional[dict[tuple[str, str], tuple]]]] = {}
+
+    def get(self, class_def: type) -> NodeSchema:
+        entry = self.schemas.get(class_def)
+        if entry is not None:
+            return entry[0]
+        schema = NodeSchema(class_def)
+        if schema.is_custom_node:
+            versions = None
+        else:
+            versions = {d: folder_paths.get_dependency_version(d) for d in schema.dependencies}
+        with self.lock:
+            self.schemas[class_def] = (schema, versions)
+        return schema
+
+    def rebuild(self, class_def: type) -> NodeSchema:
+        """Builds the schema of class_def again, for when its cached file lists may predate a change."""
+        self.invalidate(class_def)
+        return self.get(class_def)
+
+    def refresh(self):
+        with self.lock:
+            entries = list(self.schemas.items())
+        current: dict[tuple[str, str], tuple] = {}
+        stale = []
+        for class_def, (_, versions) in entries:
+            if versions is None:
+                stale.append(class_def)
+                continue
+            for dependency, version in versions.items():
+                if dependency not in current:
+                    current[dependency] = folder_paths.get_dependency_version(dependency)
+                if current[dependency] != version:
+                    stale.append(class_def)
+                    break
+        with self.lock:
+            for class_def in stale:
+                self.schemas.pop(class_def, None)
+
+    def invalidate(self, class_def: Optional[type] = None):
+        with self.lock:
+            if class_def is None:
+                self.schemas.clear()
+            else:
+                self.schemas.pop(class_def, None)
+
+
+node_schemas = NodeSchemaCache()
+
+
+def get_node_schema(class_def: type) -> NodeSchema:
+    return node_schemas.get(class_def)
@@ -0,0 +1,206 @@
+"""
+Background writer for the files of save nodes.
+
+Save nodes hand over uint8 pixel data and return right away, the files are encoded and written by a small thread
+pool. Every file is written to `<path>.tmp` and renamed into place once it is complete and synced, so a crash never
+leaves a truncated output behind. The temporary file is created before submit() returns, and the counter's
+reservation marker of folder_paths.get_save_image_path is kept until the file is renamed into place. The rename never
+replaces an existing file.
+
+Writes are tracked per prompt so the prompt worker only adds a prompt to the history once all of its files are on
+disk, and the data waiting to be written is bounded: submit() blocks while the limit is reached.
+"""
+from __future__ import annotations
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Callable, Optional
+import collections
+import logging
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+import folder_paths
+from comfy.cli_args import args
+from comfy_execution.utils import get_executing_context
+
+
+def rename_new(src: str, dst: str):
+    """Renames src to dst, raises FileExistsError instead of replacing dst."""
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        raise
+    except OSError:
+        # no hard links on this filesystem
+        if os.path.exists(dst):
+            raise FileExistsError(f"{dst} already exists")
+        os.replace(src, dst)
+        return
+    os.remove(src)
+
+
+class OutputWriter:
+    def __init__(self, max_workers: int, max_pending_bytes: int):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="OutputWriter") if max_workers > 0 else None
+        self.max_pending_bytes = max_pending_bytes
+        self.pending_bytes = 0
+        self.cond = threading.Condition()
+        self.pending_files: dict[str, Future] = {}
+        self.prompt_writes: dict[str, set[Future]] = {}
+        self.prompt_errors: dict[str, list[str]] = {}
+        # [prompt_id, callback, errors once the prompt's files are written] in the order they were registered
+        self.prompt_callbacks: collections.deque[list] = collections.deque()
+        self.callback_lock = threading.Lock()
+
+    def submit(self, path: str, write: Callable[[BinaryIO], None], nbytes: int = 0, prompt_id: Optional[str] = None) -> Future:
+        """
+        Writes a file with write(file) in the background. nbytes is the amount of memory the pending write keeps
+        alive. The write is attributed to the currently executing prompt unless prompt_id is given.
+        """
+        path = os.path.abspath(path)
+        if prompt_id is None:
+            context = get_executing_context()
+            if context is not None:
+                prompt_id = context.prompt_id
+
+        with self.cond:
+            # a single write larger than the limit is still accepted once nothing else is pending
+            while self.pending_bytes > 0 and self.pending_bytes + nbytes > self.max_pending_bytes:
+                self.cond.wait()
+            self.pending_bytes += nbytes
+
+        marker = folder_paths.save_counter_index.begin_write(path)
+        try:
+            # exclusive, an instance sharing the output folder that picked the same name fails instead of overwriting
+            file = open(path + ".tmp", "xb")
+        except Exception:
+            folder_paths.save_counter_index.end_write(marker)
+            self._release(nbytes)
+            raise
+
+        if self.executor is None:
+            future = Future()
+            try:
+                self._write(path, file, write)
+                future.set_result(path)
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            future = self.executor.submit(self._write, path, file, write)
+
+        with self.cond:
+            self.pending_files[path] = future
+            if prompt_id is not None:
+                self.prompt_writes.setdefault(prompt_id, set()).add(future)
+        future.add_done_callback(lambda f: self._on_done(path, prompt_id, nbytes, marker, f))
+        return future
+
+    @staticmethod
+    def _write(path: str, file: BinaryIO, write: Callable[[BinaryIO], None]) -> str:
+        try:
+            with file:
+                write(file)
+                file.flush()
+                os.fsync(file.fileno())
+            rename_new(file.name, path)
+        except BaseException:
+            try:
+                os.remove(file.name)
+            except OSError:
+                pass
+            raise
+        return path
+
+    def _release(self, nbytes: int):
+        with self.cond:
+            self.pending_bytes -= nbytes
+            self.cond.notify_all()
+
+    def _on_done(self, path: str, prompt_id: Optional[str], nbytes: int, marker: Optional[str], future: Future):
+        folder_paths.save_counter_index.end_write(marker)
+        error = future.exception()
+        if error is not None:
+            logging.error(f"Failed to write {path}: {error}")
+        prompt_written = False
+        with self.cond:
+            self.pending_bytes -= nbytes
+            if self.pending_files.get(path) is future:
+                self.pending_files.pop(path)
+            if prompt_id is not None:
+                if error is not None:
+                    self.prompt_errors.setdefault(prompt_id, []).append(f"Failed to write {os.path.basename(path)}: {error}")
+                writes = self.prompt_writes.get(prompt_id)
+                if writes is not None:
+                    writes.discard(future)
+                    if len(writes) == 0:
+                        self.prompt_writes.pop(prompt_id)
+                        prompt_written = self._set_written(prompt_id)
+            self.cond.notify_all()
+        if prompt_written:
+            self._run_callbacks()
+
+    def _set_written(self, prompt_id: str) -> bool:
+        written = False
+        for entry in self.prompt_callbacks:
+            if entry[0] == prompt_id and entry[2] is None:
+                entry[2] = self.prompt_errors.pop(prompt_id, [])
+                written = True
+        return written
+
+    def _run_callbacks(self):
+        # the lock keeps the callbacks in order when the files of several prompts are done at the same time
+        with self.callback_lock:
+            while True:
+                with self.cond:
+                    if len(self.prompt_callbacks) == 0 or self.prompt_callbacks[0][2] is None:
+                        return
+                    _, callback, errors = self.prompt_callbacks.popleft()
+                callback(errors)
+
+    def on_prompt_written(self, prompt_id: str, callback: Callable[[list[str]], None]):
+        """
+        Calls callback(errors) once every file of the prompt is written, right away if there is nothing pending.
+        Callbacks run in the order they were registered, so a prompt without files waits for the callbacks of the
+        prompts before it. The callback may run on a writer thread.
+        """
+        with self.cond:
+            self.prompt_callbacks.append([prompt_id, callback, None])
+            if len(self.prompt_writes.get(prompt_id, ())) > 0:
+                return
+            self._set_written(prompt_id)
+        self._run_callbacks()
+
+    def get_pending(self, path: str) -> Optional[Future]:
+        with self.cond:
+            return self.pending_files.get(os.path.abspath(path))
+
+    def wait_all(self):
+        with self.cond:
+            while len(self.pending_files) > 0:
+                self.cond.wait()
+
+
+_writer: Optional[OutputWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> OutputWriter:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = OutputWriter(args.output_writer_threads, args.output_writer_max_mb * 1024 * 1024)
+        return _writer
+
+
+def save_image(path: str, frames: list[np.ndarray], format: str, **params) -> Future:
+    """
+    Saves uint8 (H, W, C) frames as one image file with PIL in the background. Frames after the first are passed
+    as append_images, params are passed to Image.save.
+    """
+    def write(file: BinaryIO):
+        pil_images = [Image.fromarray(frame) for frame in frames]
+        pil_images[0].save(file, format=format, append_images=pil_images[1:], **params)
+
+    return get_writer().submit(path, write, sum(frame.nbytes for frame in frames))
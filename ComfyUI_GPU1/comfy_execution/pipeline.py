@@ -0,0 +1,47 @@
+"""
+Preparation of the next queued prompt while the current one executes (--pipeline-prompts).
+
+When the prompt worker starts a prompt, the prompt at the head of the queue is prepared in a background thread:
+the input files of its built-in loaders are fingerprinted, without running any node code. When that prompt's turn
+comes, the worker waits for its preparation to finish, the IS_CHANGED functions of the executor then find the file
+fingerprints cached and the files in the page cache. Prompts still execute one at a time and in queue order, and
+the errors of a prompt are reported by its execution like before: the preparation only warms caches and doesn't
+keep any result.
+"""
+from __future__ import annotations
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Optional
+import asyncio
+import logging
+import time
+
+
+class PromptPreparer:
+    def __init__(self, prepare: Callable[[str, dict], Awaitable[Any]]):
+        self.prepare = prepare
+        self.thread_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prompt-prepare")
+        self.prepared_prompt_id: Optional[str] = None
+        self.future: Optional[Future] = None
+
+    def prepare_next(self, queue):
+        """Starts preparing the prompt at the head of queue, unless it's already being prepared."""
+        item = queue.peek()
+        if item is None or item.prompt_id == self.prepared_prompt_id:
+            return
+        self.prepared_prompt_id = item.prompt_id
+        self.future = self.thread_pool.submit(self._run, item.prompt_id, item.prompt)
+
+    def wait(self, prompt_id: str):
+        """Waits for the preparation of prompt_id, if it was started, so it doesn't run next to the execution."""
+        if self.future is not None and self.prepared_prompt_id == prompt_id:
+            self.future.result()
+
+    def _run(self, prompt_id: str, prompt: dict):
+        start = time.perf_counter()
+        try:
+            asyncio.run(self.prepare(prompt_id, prompt))
+        except Exception as e:
+            # the execution of the prompt reports it
+            logging.debug(f"Failed to prepare prompt {prompt_id}: {e}")
+        else:
+            logging.debug(f"Prepared prompt {prompt_id} in {time.perf_counter() - start:.2f} seconds")
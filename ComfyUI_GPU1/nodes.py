@@ -5,7 +5,6 @@ import torch
 import os
 import sys
 import json
-import hashlib
 import inspect
 import traceback
 import math
@@ -27,6 +26,7 @@ import comfy.sample
 import comfy.sd
 import comfy.utils
 import comfy.controlnet
+import comfy.value_serialization
 from comfy.comfy_types import IO, ComfyNodeABC, InputTypeDict, FileLocator
 from comfy_api.internal import register_versions, ComfyAPIWithVersion
 from comfy_api.version_list import supported_versions
@@ -42,6 +42,7 @@ import importlib
 import folder_paths
 import latent_preview
 import node_helpers
+from comfy_execution import output_writer
 
 def before_node_execution():
     comfy.model_management.throw_exception_if_processing_interrupted()
@@ -515,6 +516,7 @@ class LoadLatent:
 
     RETURN_TYPES = ("LATENT", )
     FUNCTION = "load"
+    EXECUTION_RESOURCES = ("io",)
 
     def load(self, latent):
         latent_path = folder_paths.get_annotated_filepath(latent)
@@ -528,10 +530,7 @@ class LoadLatent:
     @classmethod
     def IS_CHANGED(s, latent):
         image_path = folder_paths.get_annotated_filepath(latent)
-        m = hashlib.sha256()
-        with open(image_path, 'rb') as f:
-            m.update(f.read())
-        return m.digest().hex()
+        return folder_paths.get_file_fingerprint(image_path)
 
     @classmethod
     def VALIDATE_INPUTS(s, latent):
@@ -540,6 +539,73 @@ class LoadLatent:
         return True
 
 
+class SaveConditioning:
+    def __init__(self):
+        self.output_dir = folder_paths.get_output_directory()
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {"required": { "conditioning": ("CONDITIONING", ),
+                              "filename_prefix": ("STRING", {"default": "conditioning/ComfyUI"})},
+                "hidden": {"prompt": "PROMPT", "extra_pnginfo": "EXTRA_PNGINFO"},
+                }
+    RETURN_TYPES = ()
+    FUNCTION = "save"
+
+    OUTPUT_NODE = True
+
+    CATEGORY = "_for_testing"
+    DESCRIPTION = "Saves the conditioning, with its pooled output and extras, to a safetensors file. Conditioning that holds control nets, hooks or other models can't be saved."
+
+    def save(self, conditioning, filename_prefix="ComfyUI", prompt=None, extra_pnginfo=None):
+        full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, self.output_dir)
+
+        metadata = None
+        if not args.disable_metadata:
+            metadata = {"prompt": json.dumps(prompt) if prompt is not None else ""}
+            if extra_pnginfo is not None:
+                for x in extra_pnginfo:
+                    metadata[x] = json.dumps(extra_pnginfo[x])
+
+        file = f"{filename}_{counter:05}_.conditioning"
+        results: list[FileLocator] = [{
+            "filename": file,
+            "subfolder": subfolder,
+            "type": "output"
+        }]
+        comfy.value_serialization.save(conditioning, os.path.join(full_output_folder, file), metadata=metadata)
+        return { "ui": { "conditioning": results } }
+
+
+class LoadConditioning:
+    @classmethod
+    def INPUT_TYPES(s):
+        input_dir = folder_paths.get_input_directory()
+        files = [f for f in os.listdir(input_dir) if os.path.isfile(os.path.join(input_dir, f)) and f.endswith(".conditioning")]
+        return {"required": {"conditioning": [sorted(files), ]}, }
+
+    CATEGORY = "_for_testing"
+
+    RETURN_TYPES = ("CONDITIONING", )
+    FUNCTION = "load"
+    EXECUTION_RESOURCES = ("io",)
+
+    def load(self, conditioning):
+        conditioning_path = folder_paths.get_annotated_filepath(conditioning)
+        return (comfy.value_serialization.load(conditioning_path), )
+
+    @classmethod
+    def IS_CHANGED(s, conditioning):
+        conditioning_path = folder_paths.get_annotated_filepath(conditioning)
+        return folder_paths.get_file_fingerprint(conditioning_path)
+
+    @classmethod
+    def VALIDATE_INPUTS(s, conditioning):
+        if not folder_paths.exists_annotated_filepath(conditioning):
+            return "Invalid conditioning file: {}".format(conditioning)
+        return True
+
+
 class CheckpointLoader:
     @classmethod
     def INPUT_TYPES(s):
@@ -1591,7 +1657,7 @@ class SaveImage:
         results = list()
         for (batch_number, image) in enumerate(images):
             i = 255. * image.cpu().numpy()
-            img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
+            pixels = np.clip(i, 0, 255).astype(np.uint8)
             metadata = None
             if not args.disable_metadata:
                 metadata = PngInfo()
@@ -1603,7 +1669,7 @@ class SaveImage:
 
             filename_with_batch_num = filename.replace("%batch_num%", str(batch_number))
             file = f"{filename_with_batch_num}_{counter:05}_.png"
-            img.save(os.path.join(full_output_folder, file), pnginfo=metadata, compress_level=self.compress_level)
+            output_writer.save_image(os.path.join(full_output_folder, file), [pixels], "PNG", pnginfo=metadata, compress_level=self.compress_level)
             results.append({
                 "filename": file,
                 "subfolder": subfolder,
@@ -1641,6 +1707,7 @@ class LoadImage:
 
     RETURN_TYPES = ("IMAGE", "MASK")
     FUNCTION = "load_image"
+    EXECUTION_RESOURCES = ("io",)
     def load_image(self, image):
         image_path = folder_paths.get_annotated_filepath(image)
 
@@ -1691,10 +1758,7 @@ class LoadImage:
     @classmethod
     def IS_CHANGED(s, image):
         image_path = folder_paths.get_annotated_filepath(image)
-        m = hashlib.sha256()
-        with open(image_path, 'rb') as f:
-            m.update(f.read())
-        return m.digest().hex()
+        return folder_paths.get_file_fingerprint(image_path)
 
     @classmethod
     def VALIDATE_INPUTS(s, image):
@@ -1718,6 +1782,7 @@ class LoadImageMask:
 
     RETURN_TYPES = ("MASK",)
     FUNCTION = "load_image"
+    EXECUTION_RESOURCES = ("io",)
     def load_image(self, image, channel):
         image_path = folder_paths.get_annotated_filepath(image)
         i = node_helpers.pillow(Image.open, image_path)
@@ -1740,10 +1805,7 @@ class LoadImageMask:
     @classmethod
     def IS_CHANGED(s, image, channel):
         image_path = folder_paths.get_annotated_filepath(image)
-        m = hashlib.sha256()
-        with open(image_path, 'rb') as f:
-            m.update(f.read())
-        return m.digest().hex()
+        return folder_paths.get_file_fingerprint(image_path)
 
     @classmethod
     def VALIDATE_INPUTS(s, image):
@@ -1787,6 +1849,7 @@ class ImageScale:
                               "crop": (s.crop_methods,)}}
     RETURN_TYPES = ("IMAGE",)
     FUNCTION = "upscale"
+    EXECUTION_RESOURCES = ("cpu",)
 
     CATEGORY = "image/upscaling"
 
@@ -1814,6 +1877,7 @@ class ImageScaleBy:
                               "scale_by": ("FLOAT", {"default": 1.0, "min": 0.01, "max": 8.0, "step": 0.01}),}}
     RETURN_TYPES = ("IMAGE",)
     FUNCTION = "upscale"
+    EXECUTION_RESOURCES = ("cpu",)
 
     CATEGORY = "image/upscaling"
 
@@ -1833,6 +1897,7 @@ class ImageInvert:
 
     RETURN_TYPES = ("IMAGE",)
     FUNCTION = "invert"
+    EXECUTION_RESOURCES = ("cpu",)
 
     CATEGORY = "image"
 
@@ -2007,6 +2072,8 @@ NODE_CLASS_MAPPINGS = {
 
     "LoadLatent": LoadLatent,
     "SaveLatent": SaveLatent,
+    "LoadConditioning": LoadConditioning,
+    "SaveConditioning": SaveConditioning,
 
     "ConditioningZeroOut": ConditioningZeroOut,
     "ConditioningSetTimestepRange": ConditioningSetTimestepRange,
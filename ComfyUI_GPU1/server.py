@@ -14,7 +14,7 @@ import struct
 import ssl
 import socket
 import ipaddress
-from PIL import Image, ImageOps
+from PIL import Image
 from PIL.PngImagePlugin import PngInfo
 from io import BytesIO
 
@@ -26,15 +26,21 @@ import mimetypes
 from comfy.cli_args import args
 import comfy.utils
 import comfy.model_management
+import comfy.tracing
 from comfy_api import feature_flags
 import node_helpers
 from comfyui_version import __version__
 from app.frontend_management import FrontendManager
 from comfy_api.internal import _ComfyNodeInternal
+from comfy_execution import output_writer
 
 from app.user_manager import UserManager
 from app.model_manager import ModelFileManager
 from app.custom_node_manager import CustomNodeManager
+from app.thumbnail_cache import ThumbnailCache
+from app.preview_sender import PreviewSender
+from app.object_info_cache import ObjectInfoCache
+from app.prompt_templates import PromptTemplate, PromptTemplateError, PromptTemplates
 from typing import Optional, Union
 from api_server.routes.internal.internal_routes import InternalRoutes
 from protocol import BinaryEventTypes
@@ -42,6 +48,51 @@ from protocol import BinaryEventTypes
 # Import cache control middleware
 from middleware.cache_middleware import cache_control
 
+def get_view_image_format(preview, channel):
+    """Returns the (format, quality) /view re-encodes an image with for the preview and channel query parameters."""
+    if preview is None:
+        return 'png', None
+    preview_info = preview.split(';')
+    image_format = preview_info[0]
+    if image_format not in ['webp', 'jpeg'] or 'a' in (channel or ''):
+        image_format = 'webp'
+
+    quality = 90
+    if preview_info[-1].isdigit():
+        quality = int(preview_info[-1])
+    return image_format, quality
+
+
+def encode_view_image(file, preview, channel):
+    image_format, quality = get_view_image_format(preview, channel)
+    with Image.open(file) as img:
+        if preview is not None:
+            if image_format in ['jpeg'] or channel == 'rgb':
+                img = img.convert("RGB")
+        elif channel == 'rgb':
+            if img.mode == "RGBA":
+                r, g, b, a = img.split()
+                img = Image.merge('RGB', (r, g, b))
+            else:
+                img = img.convert("RGB")
+        else:
+            if img.mode == "RGBA":
+                _, _, _, a = img.split()
+            else:
+                a = Image.new('L', img.size, 255)
+
+            # alpha img
+            img = Image.new('RGBA', img.size)
+            img.putalpha(a)
+
+        buffer = BytesIO()
+        if quality is not None:
+            img.save(buffer, format=image_format, quality=quality)
+        else:
+            img.save(buffer, format=image_format)
+        return buffer.getvalue()
+
+
 async def send_socket_catch_exception(function, message):
     try:
         await function(message)
@@ -56,7 +107,8 @@ async def compress_body(request: web.Request, handler):
         return response
     if response.content_type not in ["application/json", "text/plain"]:
         return response
-    if response.body and "gzip" in accept_encoding:
+    # responses that are already compressed, like /object_info, keep their encoding
+    if response.body and "gzip" in accept_encoding and "Content-Encoding" not in response.headers:
         response.enable_compression()
     return response
 
@@ -154,8 +206,13 @@ class PromptServer():
         self.internal_routes = InternalRoutes(self)
         self.supports = ["custom_nodes_from_web"]
         self.prompt_queue = execution.PromptQueue(self)
+        self.prompt_templates = PromptTemplates()
         self.loop = loop
         self.messages = asyncio.Queue()
+        self.preview_sender = PreviewSender(self)
+        self.thumbnail_cache = None
+        if args.thumbnail_cache_mb > 0:
+            self.thumbnail_cache = ThumbnailCache(os.path.join(folder_paths.get_user_directory(), "__cache__", "thumbnails"), args.thumbnail_cache_mb * 1024 * 1024)
         self.client_session:Optional[aiohttp.ClientSession] = None
         self.number = 0
 
@@ -353,9 +410,12 @@ class PromptServer():
                 if not image_is_duplicate:
                     if image_save_function is not None:
                         image_save_function(image, post, filepath)
+                        folder_paths.mark_file_changed(filepath)
                     else:
+                        data = image.file.read()
                         with open(filepath, "wb") as f:
-                            f.write(image.file.read())
+                            f.write(data)
+                        folder_paths.mark_file_changed(filepath, data)
 
                 return web.json_response({"name" : filename, "subfolder": subfolder, "type": image_upload_type})
             else:
@@ -442,78 +502,46 @@ class PromptServer():
                 filename = os.path.basename(filename)
                 file = os.path.join(output_dir, filename)
 
-                if os.path.isfile(file):
-                    if 'preview' in request.rel_url.query:
-                        with Image.open(file) as img:
-                            preview_info = request.rel_url.query['preview'].split(';')
-                            image_format = preview_info[0]
-                            if image_format not in ['webp', 'jpeg'] or 'a' in request.rel_url.query.get('channel', ''):
-                                image_format = 'webp'
-
-                            quality = 90
-                            if preview_info[-1].isdigit():
-                                quality = int(preview_info[-1])
-
-                            buffer = BytesIO()
-                            if image_format in ['jpeg'] or request.rel_url.query.get('channel', '') == 'rgb':
-                                img = img.convert("RGB")
-                            img.save(buffer, format=image_format, quality=quality)
-                            buffer.seek(0)
-
-                            return web.Response(body=buffer.read(), content_type=f'image/{image_format}',
-                                                headers={"Content-Disposition": f"filename=\"{filename}\""})
-
-                    if 'channel' not in request.rel_url.query:
-                        channel = 'rgba'
-                    else:
-                        channel = request.rel_url.query["channel"]
-
-                    if channel == 'rgb':
-                        with Image.open(file) as img:
-                            if img.mode == "RGBA":
-                                r, g, b, a = img.split()
-                                new_img = Image.merge('RGB', (r, g, b))
-                            else:
-                                new_img = img.convert("RGB")
-
-                            buffer = BytesIO()
-                            new_img.save(buffer, format='PNG')
-                            buffer.seek(0)
-
-                            return web.Response(body=buffer.read(), content_type='image/png',
-                                                headers={"Content-Disposition": f"filename=\"{filename}\""})
-
-                    elif channel == 'a':
-                        with Image.open(file) as img:
-                            if img.mode == "RGBA":
-                                _, _, _, a = img.split()
-                            else:
-                                a = Image.new('L', img.size, 255)
-
-                            # alpha img
-                            alpha_img = Image.new('RGBA', img.size)
-                            alpha_img.putalpha(a)
-                            alpha_buffer = BytesIO()
-                            alpha_img.save(alpha_buffer, format='PNG')
-                            alpha_buffer.seek(0)
-
-                            return web.Response(body=alpha_buffer.read(), content_type='image/png',
-                                                headers={"Content-Disposition": f"filename=\"{filename}\""})
-                    else:
-                        # Get content type from mimetype, defaulting to 'application/octet-stream'
-                        content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
-
-                        # For security, force certain mimetypes to download instead of display
-                        if content_type in {'text/html', 'text/html-sandboxed', 'application/xhtml+xml', 'text/javascript', 'text/css'}:
-                            content_type = 'application/octet-stream'  # Forces download
+                pending_write = output_writer.get_writer().get_pending(file)
+                if pending_write is not None:
+                    try:
+                        await asyncio.wrap_future(pending_write)
+                    except Exception:
+                        pass
 
-                        return web.FileResponse(
-                            file,
-                            headers={
-                                "Content-Disposition": f"filename=\"{filename}\"",
-                                "Content-Type": content_type
-                            }
-                        )
+                if os.path.isfile(file):
+                    preview = request.rel_url.query.get('preview')
+                    channel = request.rel_url.query.get('channel')
+                    if preview is not None or channel in ('rgb', 'a'):
+                        # re-encoded images get validators of their own, derived from the source file and the parameters
+                        stat = os.stat(file)
+                        key = ThumbnailCache.get_key(file, stat, preview=preview, channel=channel)
+                        image_format = get_view_image_format(preview, channel)[0]
+                        if request.if_none_match is not None and any(etag.value == key for etag in request.if_none_match):
+                            response = web.Response(status=304)
+                        else:
+                            body = await self.loop.run_in_executor(None, self.get_view_image, key, file, preview, channel)
+                            response = web.Response(body=body, content_type=f'image/{image_format}',
+                                                    headers={"Content-Disposition": f"filename=\"{filename}\""})
+                        response.etag = key
+                        response.last_modified = stat.st_mtime
+                        return response
+
+                    # Get content type from mimetype, defaulting to 'application/octet-stream'
+                    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+                    # For security, force certain mimetypes to download instead of display
+                    if content_type in {'text/html', 'text/html-sandboxed', 'application/xhtml+xml', 'text/javascript', 'text/css'}:
+                        content_type = 'application/octet-stream'  # Forces download
+
+                    # FileResponse handles ETag/Last-Modified validators and Range requests for seeking in videos
+                    return web.FileResponse(
+                        file,
+                        headers={
+                            "Content-Disposition": f"filename=\"{filename}\"",
+                            "Content-Type": content_type
+                        }
+                    )
 
             return web.Response(status=404)
 
@@ -624,26 +652,55 @@ class PromptServer():
                 info['api_node'] = obj_class.API_NODE
             return info
 
+        self.object_info_cache = ObjectInfoCache(node_info)
+
         @routes.get("/object_info")
         async def get_object_info(request):
-            with folder_paths.cache_helper:
-                out = {}
-                for x in nodes.NODE_CLASS_MAPPINGS:
-                    try:
-                        out[x] = node_info(x)
-                    except Exception:
-                        logging.error(f"[ERROR] An error occurred while retrieving information for the '{x}' node.")
-                        logging.error(traceback.format_exc())
-                return web.json_response(out)
+            version = self.object_info_cache.update(nodes.NODE_CLASS_MAPPINGS)
+            if request.if_none_match is not None and any(etag.value == str(version) for etag in request.if_none_match):
+                response = web.Response(status=304)
+            else:
+                encoding = ObjectInfoCache.get_accepted_encoding(request.headers.get("Accept-Encoding", ""))
+                version, body = await self.loop.run_in_executor(None, self.object_info_cache.get_body, encoding)
+                response = web.Response(body=body, content_type="application/json")
+                if encoding != "identity":
+                    response.headers["Content-Encoding"] = encoding
+                response.headers["Vary"] = "Accept-Encoding"
+            response.etag = str(version)
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+
+        @routes.get("/object_info/since/{version}")
+        async def get_object_info_delta(request):
+            try:
+                since = int(request.match_info["version"])
+            except ValueError:
+                return web.Response(status=400)
+            self.object_info_cache.update(nodes.NODE_CLASS_MAPPINGS)
+            return web.json_response(self.object_info_cache.get_delta(since))
 
         @routes.get("/object_info/{node_class}")
         async def get_object_info_node(request):
             node_class = request.match_info.get("node_class", None)
             out = {}
             if (node_class is not None) and (node_class in nodes.NODE_CLASS_MAPPINGS):
-                out[node_class] = node_info(node_class)
+                self.object_info_cache.update(nodes.NODE_CLASS_MAPPINGS)
+                info = self.object_info_cache.get_node_info(node_class)
+                out[node_class] = info if info is not None else node_info(node_class)
             return web.json_response(out)
 
+        @routes.get("/metrics")
+        async def get_metrics(request):
+            return web.Response(text=comfy.tracing.metrics.render(), content_type="text/plain", charset="utf-8",
+                                headers={"Cache-Control": "no-cache"})
+
+        @routes.get("/trace/{prompt_id}")
+        async def get_trace(request):
+            trace = comfy.tracing.get_trace(request.match_info.get("prompt_id", None))
+            if trace is None:
+                return web.Response(status=404)
+            return web.json_response(trace.to_dict())
+
         @routes.get("/history")
         async def get_history(request):
             max_items = request.rel_url.query.get("max_items", None)
@@ -656,7 +713,18 @@ class PromptServer():
             else:
                 offset = -1
 
-            return web.json_response(self.prompt_queue.get_history(max_items=max_items, offset=offset))
+            status = request.rel_url.query.get("status", None)
+            since = request.rel_url.query.get("since", None)
+            until = request.rel_url.query.get("until", None)
+            try:
+                if since is not None:
+                    since = int(since)
+                if until is not None:
+                    until = int(until)
+            except ValueError:
+                return web.json_response({"error": "since and until must be integer timestamps in ms"}, status=400)
+
+            return web.json_response(self.prompt_queue.get_history(max_items=max_items, offset=offset, status=status, since=since, until=until))
 
         @routes.get("/history/{prompt_id}")
         async def get_history_prompt_id(request):
@@ -675,6 +743,33 @@ class PromptServer():
         async def post_prompt(request):
             logging.info("got prompt")
             json_data =  await request.json()
+
+            validated = None
+            if "template_id" in json_data and "prompt" not in json_data:
+                template = self.prompt_templates.get(json_data["template_id"])
+                if template is None:
+                    error = {
+                        "type": "invalid_prompt",
+                        "message": "Unknown prompt template",
+                        "details": f"Template '{json_data['template_id']}' is not registered",
+                        "extra_info": {}
+                    }
+                    return web.json_response({"error": error, "node_errors": {}}, status=400)
+                try:
+                    json_data["prompt"], validated = template.instantiate(json_data.get("inputs", {}))
+                except PromptTemplateError as e:
+                    error = {
+                        "type": "invalid_prompt",
+                        "message": "Invalid prompt template inputs",
+                        "details": str(e),
+                        "extra_info": {}
+                    }
+                    return web.json_response({"error": error, "node_errors": {}}, status=400)
+                json_data.setdefault("partial_execution_targets", template.partial_execution_targets)
+                if json_data["partial_execution_targets"] != template.partial_execution_targets or len(self.on_prompt_handlers) > 0:
+                    # the outputs or the on_prompt handlers may change what has to be validated
+                    validated = None
+
             json_data = self.trigger_on_prompt(json_data)
 
             if "number" in json_data:
@@ -695,7 +790,7 @@ class PromptServer():
                 if "partial_execution_targets" in json_data:
                     partial_execution_targets = json_data["partial_execution_targets"]
 
-                valid = await execution.validate_prompt(prompt_id, prompt, partial_execution_targets)
+                valid = await execution.validate_prompt(prompt_id, prompt, partial_execution_targets, validated)
                 extra_data = {}
                 if "extra_data" in json_data:
                     extra_data = json_data["extra_data"]
@@ -719,6 +814,35 @@ class PromptServer():
                 }
                 return web.json_response({"error": error, "node_errors": {}}, status=400)
 
+        @routes.post("/prompt_templates")
+        async def post_prompt_template(request):
+            json_data = self.trigger_on_prompt(await request.json())
+            if "prompt" not in json_data:
+                error = {
+                    "type": "no_prompt",
+                    "message": "No prompt provided",
+                    "details": "No prompt provided",
+                    "extra_info": {}
+                }
+                return web.json_response({"error": error, "node_errors": {}}, status=400)
+
+            prompt = json_data["prompt"]
+            partial_execution_targets = json_data.get("partial_execution_targets")
+            template_id = PromptTemplates.get_template_id(prompt, partial_execution_targets)
+            validated = {}
+            valid = await execution.validate_prompt(template_id, prompt, partial_execution_targets, validated)
+            if not valid[0]:
+                logging.warning("invalid prompt template: {}".format(valid[1]))
+                return web.json_response({"error": valid[1], "node_errors": valid[3]}, status=400)
+            self.prompt_templates.put(PromptTemplate(template_id, prompt, partial_execution_targets, validated))
+            return web.json_response({"template_id": template_id, "node_errors": valid[3]})
+
+        @routes.delete("/prompt_templates/{template_id}")
+        async def delete_prompt_template(request):
+            if self.prompt_templates.delete(request.match_info["template_id"]):
+                return web.Response(status=200)
+            return web.Response(status=404)
+
         @routes.post("/queue")
         async def post_queue(request):
             json_data =  await request.json()
@@ -834,6 +958,16 @@ class PromptServer():
             web.static('/', self.web_root),
         ])
 
+    def get_view_image(self, key, file, preview, channel):
+        body = None
+        if self.thumbnail_cache is not None:
+            body = self.thumbnail_cache.get(key)
+        if body is None:
+            body = encode_view_image(file, preview, channel)
+            if self.thumbnail_cache is not None:
+                self.thumbnail_cache.put(key, body)
+        return body
+
     def get_queue_info(self):
         prompt_info = {}
         exec_info = {}
@@ -842,12 +976,8 @@ class PromptServer():
         return prompt_info
 
     async def send(self, event, data, sid=None):
-        if event == BinaryEventTypes.UNENCODED_PREVIEW_IMAGE:
-            await self.send_image(data, sid=sid)
-        elif event == BinaryEventTypes.PREVIEW_IMAGE_WITH_METADATA:
-            # data is (preview_image, metadata)
-            preview_image, metadata = data
-            await self.send_image_with_metadata(preview_image, metadata, sid=sid)
+        if event == BinaryEventTypes.UNENCODED_PREVIEW_IMAGE or event == BinaryEventTypes.PREVIEW_IMAGE_WITH_METADATA:
+            self.preview_sender.queue(event, data, sid)
         elif isinstance(data, (bytes, bytearray)):
             await self.send_bytes(event, data, sid)
         else:
@@ -863,65 +993,10 @@ class PromptServer():
         return message
 
     async def send_image(self, image_data, sid=None):
-        image_type = image_data[0]
-        image = image_data[1]
-        max_size = image_data[2]
-        if max_size is not None:
-            if hasattr(Image, 'Resampling'):
-                resampling = Image.Resampling.BILINEAR
-            else:
-                resampling = Image.Resampling.LANCZOS
-
-            image = ImageOps.contain(image, (max_size, max_size), resampling)
-        type_num = 1
-        if image_type == "JPEG":
-            type_num = 1
-        elif image_type == "PNG":
-            type_num = 2
-
-        bytesIO = BytesIO()
-        header = struct.pack(">I", type_num)
-        bytesIO.write(header)
-        image.save(bytesIO, format=image_type, quality=95, compress_level=1)
-        preview_bytes = bytesIO.getvalue()
-        await self.send_bytes(BinaryEventTypes.PREVIEW_IMAGE, preview_bytes, sid=sid)
+        await self.preview_sender.send_image(image_data, sid=sid)
 
     async def send_image_with_metadata(self, image_data, metadata=None, sid=None):
-        image_type = image_data[0]
-        image = image_data[1]
-        max_size = image_data[2]
-        if max_size is not None:
-            if hasattr(Image, 'Resampling'):
-                resampling = Image.Resampling.BILINEAR
-            else:
-                resampling = Image.Resampling.LANCZOS
-
-            image = ImageOps.contain(image, (max_size, max_size), resampling)
-
-        mimetype = "image/png" if image_type == "PNG" else "image/jpeg"
-
-        # Prepare metadata
-        if metadata is None:
-            metadata = {}
-        metadata["image_type"] = mimetype
-
-        # Serialize metadata as JSON
-        import json
-        metadata_json = json.dumps(metadata).encode('utf-8')
-        metadata_length = len(metadata_json)
-
-        # Prepare image data
-        bytesIO = BytesIO()
-        image.save(bytesIO, format=image_type, quality=95, compress_level=1)
-        image_bytes = bytesIO.getvalue()
-
-        # Combine metadata and image
-        combined_data = bytearray()
-        combined_data.extend(struct.pack(">I", metadata_length))
-        combined_data.extend(metadata_json)
-        combined_data.extend(image_bytes)
-
-        await self.send_bytes(BinaryEventTypes.PREVIEW_IMAGE_WITH_METADATA, combined_data, sid=sid)
+        await self.preview_sender.send_image_with_metadata(image_data, metadata, sid=sid)
 
     async def send_bytes(self, event, data, sid=None):
         message = self.encode_bytes(event, data)
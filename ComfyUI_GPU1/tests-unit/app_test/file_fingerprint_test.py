@@ -0,0 +1,67 @@
+import hashlib
+import os
+
+from app.file_fingerprint import FingerprintCache
+
+
+class CountingSha256:
+    calls = 0
+
+    def __init__(self):
+        CountingSha256.calls += 1
+        self.m = hashlib.sha256()
+
+    def update(self, data):
+        self.m.update(data)
+
+    def hexdigest(self):
+        return self.m.hexdigest()
+
+
+def make_cache(max_entries=16):
+    CountingSha256.calls = 0
+    cache = FingerprintCache(max_entries)
+    cache.hash_function = CountingSha256
+    return cache
+
+
+def test_unchanged_file_is_hashed_once(tmp_path):
+    path = tmp_path / "image.png"
+    path.write_bytes(b"abc" * 1000)
+    cache = make_cache()
+
+    digest = cache.get(str(path))
+    assert digest == hashlib.sha256(b"abc" * 1000).hexdigest()
+    assert cache.get(str(path)) == digest
+    assert CountingSha256.calls == 1
+
+
+def test_changed_file_is_hashed_again(tmp_path):
+    path = tmp_path / "image.png"
+    path.write_bytes(b"aaaa")
+    cache = make_cache()
+    first = cache.get(str(path))
+
+    # same size, the mtime tells the change apart
+    path.write_bytes(b"bbbb")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert cache.get(str(path)) == hashlib.sha256(b"bbbb").hexdigest() != first
+    assert CountingSha256.calls == 2
+
+
+def test_put_data_prepopulates(tmp_path):
+    path = tmp_path / "upload.png"
+    path.write_bytes(b"uploaded")
+    cache = make_cache()
+    cache.put_data(str(path), b"uploaded")
+    assert cache.get(str(path)) == hashlib.sha256(b"uploaded").hexdigest()
+    assert CountingSha256.calls == 1
+
+
+def test_least_recently_used_entries_are_dropped(tmp_path):
+    cache = make_cache(max_entries=2)
+    for name in ("a", "b", "c"):
+        (tmp_path / name).write_bytes(name.encode())
+        cache.get(str(tmp_path / name))
+    assert list(cache.entries) == [str(tmp_path / "b"), str(tmp_path / "c")]
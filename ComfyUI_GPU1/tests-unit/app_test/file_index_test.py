@@ -0,0 +1,101 @@
+import os
+import sys
+import time
+
+import pytest
+
+from folder_paths import recursive_search
+from app.file_index import DirectoryWatcher, FileIndex
+
+
+def touch(*parts):
+    path = os.path.join(*parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write("x")
+
+
+def bump_mtime(path):
+    # directory mtimes can have a coarse resolution, make sure a change is visible
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+class CountingScan:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, directory):
+        self.calls.append(directory)
+        return recursive_search(directory, excluded_dir_names=[".git"])
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = str(tmp_path)
+    touch(root, "a.safetensors")
+    touch(root, "sub", "b.ckpt")
+    touch(root, "sub", "notes.txt")
+    touch(root, ".git", "c.safetensors")
+    return root
+
+
+def test_lists_files_by_extension(tree):
+    index = FileIndex(tree, CountingScan(), excluded_dir_names=[".git"])
+    assert index.list_files({".safetensors", ".ckpt"}) == ["a.safetensors", os.path.join("sub", "b.ckpt")]
+    assert index.list_files() == ["a.safetensors", os.path.join("sub", "b.ckpt"), os.path.join("sub", "notes.txt")]
+    assert index.get_stat("a.safetensors").st_size == 1
+    assert index.get_stat("missing.safetensors") is None
+
+
+def test_only_changed_directories_are_listed_again(tree):
+    scan = CountingScan()
+    index = FileIndex(tree, scan, excluded_dir_names=[".git"])
+    version = index.get_version()
+    assert scan.calls == [tree]
+
+    # nothing changed, no walk and no new version
+    assert index.get_version() == version
+
+    touch(tree, "sub", "d.ckpt")
+    bump_mtime(os.path.join(tree, "sub"))
+    assert os.path.join("sub", "d.ckpt") in index.list_files({".ckpt"})
+    assert index.get_version() != version
+    assert scan.calls == [tree]
+
+    # a new directory is scanned on its own
+    touch(tree, "new", "deep", "e.ckpt")
+    bump_mtime(tree)
+    assert os.path.join("new", "deep", "e.ckpt") in index.list_files({".ckpt"})
+    assert scan.calls == [tree, os.path.join(tree, "new")]
+
+    os.remove(os.path.join(tree, "new", "deep", "e.ckpt"))
+    os.rmdir(os.path.join(tree, "new", "deep"))
+    os.rmdir(os.path.join(tree, "new"))
+    bump_mtime(tree)
+    assert index.list_files({".ckpt"}) == [os.path.join("sub", "b.ckpt"), os.path.join("sub", "d.ckpt")]
+    assert os.path.join(tree, "new", "deep") not in index.dirs
+
+
+def test_missing_root_is_picked_up_once_created(tmp_path):
+    root = str(tmp_path / "models")
+    index = FileIndex(root, CountingScan())
+    assert index.list_files() == []
+    touch(root, "a.pt")
+    assert index.list_files() == ["a.pt"]
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is only available on linux")
+def test_inotify_reports_changes_without_polling(tree):
+    watcher = DirectoryWatcher(poll_interval=0)
+    if watcher.inotify is None:
+        pytest.skip("inotify is not available")
+    index = FileIndex(tree, CountingScan(), excluded_dir_names=[".git"], watcher=watcher)
+    index.refresh()
+    index.poll = None  # changes have to come from inotify
+
+    touch(tree, "sub", "f.ckpt")
+    deadline = time.monotonic() + 5
+    while os.path.join("sub", "f.ckpt") not in index.list_files({".ckpt"}):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+from app.thumbnail_cache import ThumbnailCache
+
+
+@pytest.fixture
+def source_file(tmp_path):
+    path = tmp_path / "image.png"
+    path.write_bytes(b"source")
+    return str(path)
+
+
+def test_key_follows_source_and_parameters(source_file):
+    stat = os.stat(source_file)
+    key = ThumbnailCache.get_key(source_file, stat, preview="webp;90", channel=None)
+    assert key == ThumbnailCache.get_key(source_file, stat, preview="webp;90", channel=None)
+    assert key != ThumbnailCache.get_key(source_file, stat, preview="webp;50", channel=None)
+    assert key != ThumbnailCache.get_key(source_file, stat, preview="webp;90", channel="rgb")
+
+    os.utime(source_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert key != ThumbnailCache.get_key(source_file, os.stat(source_file), preview="webp;90", channel=None)
+
+
+def test_get_and_put(tmp_path):
+    cache = ThumbnailCache(str(tmp_path / "cache"), 1024)
+    assert cache.get("a") is None
+    cache.put("a", b"thumbnail")
+    assert cache.get("a") == b"thumbnail"
+
+    # entries survive a restart
+    assert ThumbnailCache(str(tmp_path / "cache"), 1024).get("a") == b"thumbnail"
+
+
+def test_lru_eviction(tmp_path):
+    cache = ThumbnailCache(str(tmp_path / "cache"), 20)
+    cache.put("a", b"x" * 8)
+    cache.put("b", b"x" * 8)
+    cache.get("a")
+    cache.put("c", b"x" * 8)
+
+    assert cache.total_bytes == 16
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert sorted(os.listdir(tmp_path / "cache")) == ["a", "c"]
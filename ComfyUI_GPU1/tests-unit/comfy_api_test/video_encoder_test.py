@@ -0,0 +1,110 @@
+import logging
+import os
+import tempfile
+import time
+from fractions import Fraction
+
+import av
+import numpy as np
+import pytest
+import torch
+
+from comfy_api.input_impl.video_types import VideoFromComponents, VideoFromFile
+from comfy_api.latest._input_impl.video_encoder import CODEC_ENCODERS, images_to_yuv420p, is_encoder_available
+from comfy_api.util.video_types import VideoCodec, VideoComponents, VideoContainer
+
+
+def has_encoder(codec: VideoCodec) -> bool:
+    return any(is_encoder_available(name) for name in CODEC_ENCODERS[codec])
+
+
+def swscale_yuv420p(image: torch.Tensor) -> np.ndarray:
+    rgb = (image * 255).round().to(torch.uint8).numpy()
+    return av.VideoFrame.from_ndarray(rgb, format="rgb24").reformat(format="yuv420p").to_ndarray().astype(np.int32)
+
+
+def test_yuv420p_luma_matches_swscale():
+    images = torch.rand(2, 16, 24, 3)
+    yuv = images_to_yuv420p(images).numpy().astype(np.int32)
+    for image, frame_yuv in zip(images, yuv):
+        expected = swscale_yuv420p(image)
+        assert frame_yuv.shape == expected.shape
+        assert np.abs(frame_yuv[:16] - expected[:16]).max() <= 1
+
+
+def test_yuv420p_chroma_of_smooth_images_matches_swscale():
+    # the chroma is averaged over 2x2 blocks while swscale filters over a wider area, which only agree without fine detail
+    y, x = torch.meshgrid(torch.linspace(0, 1, 32), torch.linspace(0, 1, 48), indexing="ij")
+    image = torch.stack([x, y, (x + y) / 2], dim=-1)
+    frame_yuv = images_to_yuv420p(image.unsqueeze(0)).numpy()[0].astype(np.int32)
+    assert np.abs(frame_yuv - swscale_yuv420p(image)).max() <= 1
+
+
+@pytest.mark.parametrize("format, codec", [
+    (VideoContainer.MP4, VideoCodec.H264),
+    (VideoContainer.MP4, VideoCodec.HEVC),
+    (VideoContainer.WEBM, VideoCodec.VP9),
+    (VideoContainer.WEBM, VideoCodec.AV1),
+    (VideoContainer.MKV, VideoCodec.H264),
+])
+def test_save_to_formats(format, codec):
+    if not has_encoder(codec):
+        pytest.skip(f"no {codec.value} encoder available")
+    images = torch.rand(5, 32, 32, 3)
+    video = VideoFromComponents(VideoComponents(images=images, frame_rate=Fraction(24)))
+    with tempfile.NamedTemporaryFile(suffix=f".{VideoContainer.get_extension(format)}", delete=False) as f:
+        path = f.name
+    try:
+        video.save_to(path, format=format, codec=codec, metadata={"prompt": {"1": "test"}}, thread_count=2)
+        loaded = VideoFromFile(path)
+        assert loaded.get_dimensions() == (32, 32)
+        assert loaded.get_components().images.shape[0] == 5
+    finally:
+        os.unlink(path)
+
+
+def test_save_to_rejects_codec_not_in_container():
+    video = VideoFromComponents(VideoComponents(images=torch.rand(2, 16, 16, 3), frame_rate=Fraction(24)))
+    with pytest.raises(ValueError):
+        video.save_to(os.path.join(tempfile.gettempdir(), "unused.webm"), format=VideoContainer.WEBM, codec=VideoCodec.H264)
+
+
+def encode_per_frame(images, frame_rate, path):
+    """The per frame conversion save_to used before frames were converted in batches on a separate thread."""
+    with av.open(path, mode="w") as output:
+        stream = output.add_stream("libx264", rate=frame_rate)
+        stream.width = images.shape[2]
+        stream.height = images.shape[1]
+        stream.pix_fmt = "yuv420p"
+        stream.options = {"preset": "ultrafast"}
+        for frame in images:
+            img = (frame * 255).clamp(0, 255).byte().cpu().numpy()
+            frame = av.VideoFrame.from_ndarray(img, format="rgb24")
+            frame = frame.reformat(format="yuv420p")
+            output.mux(stream.encode(frame))
+        output.mux(stream.encode(None))
+
+
+def encode_fps(encode, frames):
+    # the best of two runs, the first one also warms up the encoder
+    best = float("inf")
+    for _ in range(2):
+        start = time.perf_counter()
+        encode()
+        best = min(best, time.perf_counter() - start)
+    return frames / best
+
+
+@pytest.mark.benchmark
+def test_save_to_fps_81_frames_720p():
+    if not is_encoder_available("libx264"):
+        pytest.skip("no libx264 encoder available")
+    images = torch.rand(81, 720, 1280, 3)
+    frame_rate = Fraction(16)
+    video = VideoFromComponents(VideoComponents(images=images, frame_rate=frame_rate))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "video.mp4")
+        fps = encode_fps(lambda: video.save_to(path, format=VideoContainer.MP4, codec=VideoCodec.H264, codec_options={"preset": "ultrafast"}), len(images))
+        per_frame_fps = encode_fps(lambda: encode_per_frame(images, frame_rate, path), len(images))
+    logging.info(f"81 frames 1280x720 h264: save_to {fps:.1f} fps, per frame conversion {per_frame_fps:.1f} fps")
+    assert fps > per_frame_fps
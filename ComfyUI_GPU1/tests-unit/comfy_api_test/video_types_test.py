@@ -52,7 +52,7 @@ def create_test_video(width=4, height=4, frames=3, fps=30):
 
         for i in range(frames):
             frame = av.VideoFrame.from_ndarray(
-                torch.ones(height, width, 3, dtype=torch.uint8).numpy() * (i * 85),
+                torch.ones(height, width, 3, dtype=torch.uint8).numpy() * (i * 85 % 256),
                 format="rgb24",
             )
             frame = frame.reformat(format="yuv420p")
@@ -237,3 +237,61 @@ def test_duration_consistency(video_components):
     manual_duration = float(components.images.shape[0] / components.frame_rate)
 
     assert duration == pytest.approx(manual_duration)
+
+
+@pytest.fixture
+def ten_frame_video_file():
+    """8x8 video with 10 frames at 30fps"""
+    file_path = create_test_video(width=8, height=8, frames=10)
+    yield file_path
+    os.unlink(file_path)
+
+
+def test_video_from_file_get_components_all_frames(ten_frame_video_file):
+    """All frames decoded as float32 in [0, 1] when no decode options are set"""
+    components = VideoFromFile(ten_frame_video_file).get_components()
+    assert components.images.shape == (10, 8, 8, 3)
+    assert components.images.dtype == torch.float32
+    assert components.frame_rate == Fraction(30)
+
+
+def test_video_from_file_frame_range_and_stride(ten_frame_video_file):
+    """Frame range, stride and max_frames are applied while decoding"""
+    video = VideoFromFile(ten_frame_video_file, start_frame=2, end_frame=9, frame_stride=2)
+    components = video.get_components()
+    assert components.images.shape[0] == 4  # frames 2, 4, 6, 8
+    assert components.frame_rate == Fraction(15)
+    assert video.get_duration() == pytest.approx(4 / 15)
+
+    video = VideoFromFile(ten_frame_video_file, start_frame=1, max_frames=3)
+    assert video.get_components().images.shape[0] == 3
+    assert video.get_duration() == pytest.approx(3 / 30)
+
+    # the range is clamped to the frames of the source
+    video = VideoFromFile(ten_frame_video_file, start_frame=6, end_frame=100)
+    assert video.get_components().images.shape[0] == 4
+    assert video.get_duration() == pytest.approx(4 / 30)
+
+
+def test_video_from_file_target_resolution(ten_frame_video_file):
+    """Frames are scaled at decode time, keeping aspect ratio when one side is given"""
+    video = VideoFromFile(ten_frame_video_file, width=4)
+    assert video.get_dimensions() == (4, 4)
+    assert video.get_components().images.shape == (10, 4, 4, 3)
+
+
+def test_video_from_file_iter_frames_uint8_batches(ten_frame_video_file):
+    """iter_frames streams uint8 batches no larger than batch_size"""
+    batches = list(VideoFromFile(ten_frame_video_file).iter_frames(batch_size=4))
+    assert [b.shape[0] for b in batches] == [4, 4, 2]
+    assert all(b.dtype == torch.uint8 for b in batches)
+    assert batches[0].shape[1:] == (8, 8, 3)
+
+
+def test_video_from_file_with_decode_options_keeps_source(ten_frame_video_file):
+    """with_decode_options returns a new video for the same file"""
+    video = VideoFromFile(ten_frame_video_file)
+    trimmed = video.with_decode_options(max_frames=2)
+    assert not video.has_decode_options()
+    assert trimmed.has_decode_options()
+    assert trimmed.get_components().images.shape[0] == 2
@@ -0,0 +1,65 @@
+import json
+import os
+import time
+
+from comfy import tracing
+
+
+def test_span_is_noop_without_trace():
+    with tracing.span("vae_decode", "vae") as s:
+        pass
+    assert s.trace is None
+
+
+def test_span_and_traced_record_into_current_trace():
+    trace = tracing.Trace("prompt")
+
+    @tracing.traced("model_load", "model")
+    def load():
+        return 3
+
+    token = tracing.set_current_trace(trace)
+    try:
+        with tracing.span("sample", "sampler", steps=20):
+            pass
+        assert load() == 3
+        try:
+            with tracing.span("vae_decode", "vae"):
+                raise ValueError()
+        except ValueError:
+            pass
+    finally:
+        tracing.reset_current_trace(token)
+
+    assert [e["name"] for e in trace.events] == ["sample", "model_load", "vae_decode"]
+    assert trace.events[0]["args"] == {"steps": 20}
+    assert trace.events[0]["ph"] == "X"
+    assert trace.events[2]["args"]["error"] == "ValueError"
+    assert tracing.get_current_trace() is None
+
+
+def test_record_node_and_finish_trace(tmp_path):
+    trace = tracing.Trace("../some prompt")
+    tracing.record_node(trace, "3", "KSampler", time.perf_counter_ns(), time.thread_time_ns(), False, "success", 64, 128)
+    tracing.finish_trace(trace, "success", str(tmp_path))
+
+    assert tracing.get_trace("../some prompt") is trace
+    # the client supplied prompt id can't escape the directory
+    assert os.listdir(tmp_path) == ["___some_prompt.json"]
+    with open(tmp_path / "___some_prompt.json") as f:
+        data = json.load(f)
+    assert data["traceEvents"][0]["args"]["node_id"] == "3"
+    assert data["otherData"]["prompt_id"] == "../some prompt"
+
+
+def test_metrics_render():
+    metrics = tracing.Metrics()
+    metrics.observe("comfyui_node_executions", 0.5, class_type="KSampler")
+    metrics.observe("comfyui_node_executions", 1.5, class_type="KSampler")
+    metrics.inc("comfyui_node_output_bytes", 10, class_type='Say "hi"')
+    text = metrics.render()
+    assert "# TYPE comfyui_node_executions summary" in text
+    assert 'comfyui_node_executions_count{class_type="KSampler"} 2' in text
+    assert 'comfyui_node_executions_sum{class_type="KSampler"} 2.0' in text
+    assert "# TYPE comfyui_node_output_bytes counter" in text
+    assert 'comfyui_node_output_bytes{class_type="Say \\"hi\\""} 10' in text
@@ -0,0 +1,130 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import folder_paths
+from comfy_execution.output_writer import OutputWriter
+
+
+@pytest.fixture
+def writer():
+    writer = OutputWriter(max_workers=2, max_pending_bytes=1024)
+    yield writer
+    writer.executor.shutdown(wait=True)
+
+
+def test_write_is_renamed_into_place(writer, tmp_path):
+    path = str(tmp_path / "ComfyUI_00001_.png")
+    release = threading.Event()
+
+    def write(f):
+        release.wait()
+        Image.fromarray(np.zeros((4, 4, 3), dtype=np.uint8)).save(f, format="PNG")
+
+    future = writer.submit(path, write, prompt_id="prompt")
+    # only the temporary file exists until the write is done, it keeps the counter taken
+    assert os.listdir(tmp_path) == ["ComfyUI_00001_.png.tmp"]
+    assert writer.get_pending(path) is future
+
+    release.set()
+    future.result()
+    assert os.listdir(tmp_path) == ["ComfyUI_00001_.png"]
+    assert Image.open(path).size == (4, 4)
+    assert writer.get_pending(path) is None
+
+
+def test_prompt_callback_runs_after_all_writes(writer, tmp_path):
+    release = threading.Event()
+    done = []
+    for i in range(3):
+        writer.submit(str(tmp_path / f"{i}.bin"), lambda f: (release.wait(), f.write(b"x")), prompt_id="prompt")
+    writer.on_prompt_written("prompt", done.append)
+    assert done == []
+
+    release.set()
+    writer.wait_all()
+    assert done == [[]]
+    assert sorted(os.listdir(tmp_path)) == ["0.bin", "1.bin", "2.bin"]
+
+
+def test_prompt_callback_without_writes_runs_immediately(writer):
+    done = []
+    writer.on_prompt_written("other", done.append)
+    assert done == [[]]
+
+
+def test_prompt_callbacks_run_in_queue_order(writer, tmp_path):
+    release = threading.Event()
+    b_done = threading.Event()
+    done = []
+    writer.submit(str(tmp_path / "a.bin"), lambda f: (release.wait(), f.write(b"x")), prompt_id="a")
+    writer.on_prompt_written("a", lambda errors: done.append("a"))
+    # b has no files but was queued after a, so it goes to the history after it
+    writer.on_prompt_written("b", lambda errors: (done.append("b"), b_done.set()))
+    assert done == []
+
+    release.set()
+    assert b_done.wait(5)
+    assert done == ["a", "b"]
+
+
+def test_failed_write_removes_temp_file_and_reports_error(writer, tmp_path):
+    def write(f):
+        raise RuntimeError("encoder failed")
+
+    future = writer.submit(str(tmp_path / "broken.png"), write, prompt_id="prompt")
+    with pytest.raises(RuntimeError):
+        future.result()
+    writer.wait_all()
+
+    errors = []
+    writer.on_prompt_written("prompt", errors.extend)
+    assert len(errors) == 1 and "encoder failed" in errors[0]
+    assert os.listdir(tmp_path) == []
+
+
+def test_pending_bytes_are_bounded(writer, tmp_path):
+    release = threading.Event()
+    writer.submit(str(tmp_path / "a.bin"), lambda f: release.wait(), nbytes=800)
+
+    submitted = threading.Event()
+
+    def submit_second():
+        writer.submit(str(tmp_path / "b.bin"), lambda f: None, nbytes=800)
+        submitted.set()
+
+    thread = threading.Thread(target=submit_second)
+    thread.start()
+    # the second write has to wait until the first one releases its memory
+    assert not submitted.wait(0.2)
+    release.set()
+    thread.join()
+    writer.wait_all()
+    assert writer.pending_bytes == 0
+
+
+def test_existing_file_is_not_replaced(writer, tmp_path):
+    path = tmp_path / "ComfyUI_00001_.png"
+    path.write_bytes(b"other instance")
+    future = writer.submit(str(path), lambda f: f.write(b"x"))
+    with pytest.raises(FileExistsError):
+        future.result()
+    writer.wait_all()
+    assert path.read_bytes() == b"other instance"
+    assert os.listdir(tmp_path) == ["ComfyUI_00001_.png"]
+
+
+def test_reservation_is_released_after_the_rename(writer, tmp_path):
+    full_output_folder, filename, counter, _, _ = folder_paths.get_save_image_path("ComfyUI", str(tmp_path))
+    release = threading.Event()
+    future = writer.submit(os.path.join(full_output_folder, f"{filename}_{counter:05}_.png"), lambda f: (release.wait(), f.write(b"x")))
+    # the prompt is done before the file is written
+    folder_paths.save_counter_index.release_markers()
+    assert sorted(os.listdir(tmp_path)) == ["ComfyUI_00001_.lock", "ComfyUI_00001_.png.tmp"]
+    release.set()
+    future.result()
+    writer.wait_all()
+    assert os.listdir(tmp_path) == ["ComfyUI_00001_.png"]
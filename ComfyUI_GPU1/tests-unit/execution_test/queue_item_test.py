@@ -0,0 +1,88 @@
+import copy
+import logging
+import timeit
+import tracemalloc
+
+from execution import PromptQueue, QueueItem
+
+
+class DummyServer:
+    def queue_updated(self):
+        pass
+
+
+def make_prompt(num_nodes):
+    prompt = {}
+    for i in range(num_nodes):
+        prompt[str(i)] = {
+            "class_type": "KSampler",
+            "inputs": {"seed": i, "steps": 20, "cfg": 7.0, "model": [str(max(i - 1, 0)), 0], "positive": [str(max(i - 2, 0)), 0]},
+            "_meta": {"title": f"Node {i}"},
+        }
+    workflow = {"nodes": [{"id": i, "type": "KSampler", "pos": [i, i], "size": [300, 200], "widgets_values": [i, 20, 7.0]} for i in range(num_nodes)]}
+    return prompt, {"extra_pnginfo": {"workflow": workflow}, "client_id": "client"}
+
+
+def test_items_are_shared_not_copied():
+    queue = PromptQueue(DummyServer())
+    prompt, extra_data = make_prompt(3)
+    queue.put((1, "a", prompt, extra_data, ["0"]))
+    item, item_id = queue.get()
+    assert isinstance(item, QueueItem)
+    assert item.prompt is prompt
+    running, pending = queue.get_current_queue()
+    assert running[0] is item and pending == []
+
+    queue.task_done(item_id, {"outputs": {}}, None)
+    history = queue.get_history(prompt_id="a")["a"]
+    assert history["prompt"] is item
+
+
+def test_sensitive_data_stays_with_the_executing_prompt():
+    queue = PromptQueue(DummyServer())
+    prompt, extra_data = make_prompt(3)
+    extra_data["api_key_comfy_org"] = "secret"
+    queue.put((1, "a", prompt, extra_data, ["0"]))
+    queue.put((2, "b", prompt, extra_data, ["0"]))
+
+    item, item_id = queue.get()
+    assert item.extra_data["api_key_comfy_org"] == "secret"
+    running, pending = queue.get_current_queue()
+    assert "api_key_comfy_org" not in running[0].extra_data
+    assert "api_key_comfy_org" not in pending[0].extra_data
+    assert running[0].extra_data["extra_pnginfo"] is extra_data["extra_pnginfo"]
+
+    queue.task_done(item_id, {"outputs": {}}, None)
+    assert "api_key_comfy_org" not in queue.get_history(prompt_id="a")["a"]["prompt"][3]
+    # the queued item itself is left alone
+    assert extra_data["api_key_comfy_org"] == "secret"
+
+
+def test_listing_a_large_queue_does_not_copy_prompts():
+    num_prompts = 1000
+    prompt, extra_data = make_prompt(500)
+    queue = PromptQueue(DummyServer())
+    for i in range(num_prompts):
+        # every prompt is submitted separately, give each its own objects like request parsing would
+        queue.put((i, f"prompt-{i}", dict(prompt), dict(extra_data), ["0"]))
+    queue.get()
+
+    tracemalloc.start()
+    copy.deepcopy(prompt)
+    prompt_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.reset_peak()
+    start_memory = tracemalloc.get_traced_memory()[0]
+    running, pending = queue.get_current_queue()
+    listing_memory = tracemalloc.get_traced_memory()[1] - start_memory
+    tracemalloc.stop()
+
+    assert len(running) == 1 and len(pending) == num_prompts - 1
+    assert all(item.prompt is queued.prompt for item, queued in zip(pending, queue.queue))
+    # the whole listing takes less memory than a copy of a single prompt
+    assert listing_memory < prompt_memory, (listing_memory, prompt_memory)
+
+    # and less time than copying 10 of the 1000 prompts, like get_current_queue() used to copy all of them
+    listing_time = min(timeit.repeat(queue.get_current_queue, number=1, repeat=3))
+    copy_time = min(timeit.repeat(lambda: copy.deepcopy(queue.queue[:10]), number=1, repeat=3))
+    logging.info(f"/queue with {num_prompts} prompts of 500 nodes: {listing_time * 1000:.1f} ms, copying 10 of them: {copy_time * 1000:.1f} ms")
+    assert listing_time < copy_time, (listing_time, copy_time)
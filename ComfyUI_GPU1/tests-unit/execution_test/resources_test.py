@@ -0,0 +1,44 @@
+import asyncio
+
+from comfy_execution.resources import CPU, DEFAULT_RESOURCES, IO, ExecutionResources, get_node_resources
+
+
+def test_get_node_resources():
+    class Undeclared:
+        pass
+
+    class Loader:
+        EXECUTION_RESOURCES = ("io",)
+
+    assert get_node_resources(Undeclared) == DEFAULT_RESOURCES
+    assert get_node_resources(Loader) == frozenset((IO,))
+    assert not ExecutionResources.runs_concurrently(DEFAULT_RESOURCES)
+    assert not ExecutionResources.runs_concurrently(frozenset((IO, "gpu")))
+    assert ExecutionResources.runs_concurrently(frozenset((CPU, IO)))
+
+
+def test_capacity_and_release_when_done():
+    resources = ExecutionResources(2)
+    io = frozenset((IO,))
+
+    async def run():
+        resources.acquire(io)
+        resources.acquire(io)
+        assert not resources.can_start(io)
+        # nodes running on the executor's thread are never held back
+        assert resources.can_start(DEFAULT_RESOURCES)
+
+        event = asyncio.Event()
+        tasks = [asyncio.create_task(event.wait()), asyncio.create_task(event.wait())]
+        resources.release_when_done(io, tasks)
+        resources.release(io)
+        assert resources.can_start(io)
+        assert resources.in_use[IO] == 1
+
+        event.set()
+        await resources.wait()
+        assert resources.in_use[IO] == 0
+        assert len(resources.running) == 0
+
+    asyncio.run(run())
+    resources.thread_pool.shutdown()
@@ -482,6 +482,50 @@ class TestOutputNodeWithSocketOutput:
         result = image * value
         return (result,)
 
+class TestThreadSleep(ComfyNodeABC):
+    """Blocks its thread, runs in the thread pool with --concurrent-nodes."""
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "value": (IO.ANY, {}),
+                "seconds": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 9999.0, "step": 0.01}),
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
+            },
+        }
+    RETURN_TYPES = (IO.ANY,)
+    FUNCTION = "sleep"
+    EXECUTION_RESOURCES = ("io",)
+
+    CATEGORY = "_for_testing"
+
+    def sleep(self, value, seconds, unique_id):
+        pbar = ProgressBar(2, node_id=unique_id)
+        time.sleep(seconds / 2)
+        pbar.update(1)
+        time.sleep(seconds / 2)
+        pbar.update(1)
+        return (value,)
+
+class TestThreadError(ComfyNodeABC):
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "value": (IO.ANY, {}),
+            },
+        }
+    RETURN_TYPES = (IO.ANY,)
+    FUNCTION = "error"
+    EXECUTION_RESOURCES = ("cpu",)
+
+    CATEGORY = "_for_testing"
+
+    def error(self, value):
+        raise RuntimeError("Intentional error in the thread pool for testing")
+
 TEST_NODE_CLASS_MAPPINGS = {
     "TestLazyMixImages": TestLazyMixImages,
     "TestVariadicAverage": TestVariadicAverage,
@@ -498,6 +542,8 @@ TEST_NODE_CLASS_MAPPINGS = {
     "TestSleep": TestSleep,
     "TestParallelSleep": TestParallelSleep,
     "TestOutputNodeWithSocketOutput": TestOutputNodeWithSocketOutput,
+    "TestThreadSleep": TestThreadSleep,
+    "TestThreadError": TestThreadError,
 }
 
 TEST_NODE_DISPLAY_NAME_MAPPINGS = {
@@ -516,4 +562,6 @@ TEST_NODE_DISPLAY_NAME_MAPPINGS = {
     "TestSleep": "Test Sleep",
     "TestParallelSleep": "Test Parallel Sleep",
     "TestOutputNodeWithSocketOutput": "Test Output Node With Socket Output",
+    "TestThreadSleep": "Test Thread Sleep",
+    "TestThreadError": "Test Thread Error",
 }